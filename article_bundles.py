@@ -0,0 +1,131 @@
+import contextlib
+import json
+import os
+import threading
+
+from pathlib import Path
+
+# Directory next to news_dataset_with_audio holding one JSONL bundle per news_dataset shard
+BUNDLE_DIR_NAME = 'news_bundles'
+
+# Every record starts with its ID, so the index can read it without parsing the rest of the line
+RECORD_PREFIX = '{"id":'
+
+def bundle_dir(data_dir, news_house):
+    """Returns the directory of the article bundles of a news house.
+
+    Args:
+        data_dir (str): Root data directory containing one directory per news house.
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+
+    Returns:
+        Path: `<data_dir>/<news house>/news_bundles`.
+    """
+    return Path(data_dir) / news_house / BUNDLE_DIR_NAME
+
+def encode_record(article_id, audio_url, body_text, metadata):
+    """Encodes one article as a bundle line.
+
+    Args:
+        article_id (str): ID of the article.
+        audio_url (str): Audio URL of the article, None if it has no valid audio URL.
+        body_text (str): Body text of the article.
+        metadata (dict): Metadata of the article, as saved to metadata.json.
+
+    Returns:
+        str: The JSON record followed by a newline.
+    """
+    record = {'id': article_id, 'audio_url': audio_url, 'body_text': body_text, 'metadata': metadata}
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+def write_bundle(bundle_path, lines, buffer_size=1 << 20):
+    """Writes encoded records to a bundle with large buffered writes.
+
+    The bundle is written to a `.part` file renamed once complete, so a
+    bundle on disk always holds a whole shard. Nothing is fsynced: an
+    interrupted run leaves at most a `.part` file, which the next run
+    overwrites.
+
+    Args:
+        bundle_path (Path): Path of the bundle.
+        lines (iterable): Records encoded with encode_record.
+        buffer_size (int): Size of the write buffer in bytes.
+
+    Returns:
+        int: Number of records written.
+    """
+    bundle_path = Path(bundle_path)
+    bundle_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path = bundle_path.with_name(f'{bundle_path.name}.part')
+    num_records = 0
+    with open(part_path, 'w', encoding='utf-8', buffering=buffer_size) as bundle_file:
+        for line in lines:
+            bundle_file.write(line)
+            num_records += 1
+    os.replace(part_path, bundle_path)
+    return num_records
+
+def iter_bundle_paths(data_root_dir, channel):
+    """Lists the bundles of a news channel in shard order.
+
+    Args:
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        channel (str): News channel.
+
+    Returns:
+        list: Paths of the complete bundles, empty if the channel has none.
+    """
+    channel_bundle_dir = bundle_dir(data_root_dir, channel)
+    if not channel_bundle_dir.exists():
+        return []
+    return sorted(str(path) for path in channel_bundle_dir.iterdir() if path.suffix == '.jsonl')
+
+def index_bundle(bundle_path):
+    """Lists the records of a bundle with their location, without decoding their text.
+
+    Args:
+        bundle_path (str): Path of the bundle.
+
+    Yields:
+        tuple: (article ID, (bundle path, offset, length, signature)) of every record,
+            the signature changing whenever the bundle is rewritten.
+    """
+    stat = os.stat(bundle_path)
+    bundle_signature = f'{os.path.basename(bundle_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    decoder = json.JSONDecoder()
+    offset = 0
+    with open(bundle_path, 'rb') as bundle_file:
+        for line in bundle_file:
+            # IDs are short, so only the start of the line is decoded
+            article_id, _ = decoder.raw_decode(line[:1024].decode('utf-8', errors='ignore'), len(RECORD_PREFIX))
+            yield article_id, (bundle_path, offset, len(line), f'{bundle_signature}:{offset}')
+            offset += len(line)
+
+@contextlib.contextmanager
+def bundle_reader():
+    """Opens bundles on demand for reading records at their index locations.
+
+    Each bundle is opened once and shared by all threads through positional
+    reads, so reading a record costs a single read call.
+
+    Yields:
+        callable: Function taking a location from index_bundle and returning the decoded record.
+    """
+    fds = {}
+    fds_lock = threading.Lock()
+
+    def read_record(location):
+        bundle_path, offset, length = location[:3]
+        fd = fds.get(bundle_path)
+        if fd is None:
+            with fds_lock:
+                if bundle_path not in fds:
+                    fds[bundle_path] = os.open(bundle_path, os.O_RDONLY)
+                fd = fds[bundle_path]
+        return json.loads(os.pread(fd, length, offset))
+
+    try:
+        yield read_record
+    finally:
+        for fd in fds.values():
+            os.close(fd)
@@ -1,6 +1,47 @@
+import argparse
+import collections
+import contextlib
+import logging
 import os
+import threading
+import time
 import requests
 
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from metrics import configure_logging, increment, log_event, record_failure, failure_reason, timed
+from audio_store import normalize_url, hash_file, link_known_url, add_audio_file
+from metadata_io import read_metadata
+from news_manifest import open_manifest
+from extract_news_audio import STREAM_TIMEOUT, download_stream_file
+
+HEADERS = {
+    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "accept-encoding": "gzip, deflate, br, zstd",
+    "accept-language": "en-US,en;q=0.9,en-IN;q=0.8",
+    "cache-control": "max-age=0",
+    "cookie": "AMCVS_518ABC7455E462B97F000101%40AdobeOrg=1; s_cc=true; utag_main=v_id:019169eade56002296e6ea4a443c0507d001b075008f7$_sn:11$_se:5$_ss:0$_st:1727788387180$vapi_domain:rfa.org$ses_id:1727793787%3Bexp-session$_pn:5%3Bexp-session; AMCV_518ABC7455E462B97F000101%40AdobeOrg=1176715910%7CMCIDTS%7C19997%7CMCMID%7C92058839809215745258174654077801968713%7CMCAID%7CNONE%7CMCOPTOUT-1727793787s%7CNONE%7CvVersion%7C5.4.0; s_sq=%5B%5BB%5D%5D",
+    "priority": "u=0, i",
+    "sec-ch-ua": "\"Microsoft Edge\";v=\"129\", \"Not=A?Brand\";v=\"8\", \"Chromium\";v=\"129\"",
+    "sec-ch-ua-mobile": "?0",
+    "sec-ch-ua-platform": "\"Windows\"",
+    "sec-fetch-dest": "document",
+    "sec-fetch-mode": "navigate",
+    "sec-fetch-site": "none",
+    "sec-fetch-user": "?1",
+    "upgrade-insecure-requests": "1",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36 Edg/129.0.0.0"
+}
+
+# Extensions of HLS playlists, which are fetched with ffmpeg rather than over plain HTTP
+STREAM_EXTENSIONS = ('.m3u8',)
+
+# Statuses of an article download, and those whose audio was fetched or linked in this run
+DOWNLOAD_STATUSES = ('downloaded', 'duplicate', 'linked', 'exists', 'skipped', 'failed')
+FETCHED_STATUSES = ('downloaded', 'duplicate', 'linked')
+
 def download_rfa_audio(df, output_dir, session):
     """Downloads RFA audio files based on the provided DataFrame.
 
@@ -9,24 +50,6 @@ def download_rfa_audio(df, output_dir, session):
         output_dir (str): Directory where audio files will be saved.
         session (requests.Session): Session object for making requests.
     """
-    headers = {
-        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "accept-encoding": "gzip, deflate, br, zstd",
-        "accept-language": "en-US,en;q=0.9,en-IN;q=0.8",
-        "cache-control": "max-age=0",
-        "cookie": "AMCVS_518ABC7455E462B97F000101%40AdobeOrg=1; s_cc=true; utag_main=v_id:019169eade56002296e6ea4a443c0507d001b075008f7$_sn:11$_se:5$_ss:0$_st:1727788387180$vapi_domain:rfa.org$ses_id:1727793787%3Bexp-session$_pn:5%3Bexp-session; AMCV_518ABC7455E462B97F000101%40AdobeOrg=1176715910%7CMCIDTS%7C19997%7CMCMID%7C92058839809215745258174654077801968713%7CMCAID%7CNONE%7CMCOPTOUT-1727793787s%7CNONE%7CvVersion%7C5.4.0; s_sq=%5B%5BB%5D%5D",
-        "priority": "u=0, i",
-        "sec-ch-ua": "\"Microsoft Edge\";v=\"129\", \"Not=A?Brand\";v=\"8\", \"Chromium\";v=\"129\"",
-        "sec-ch-ua-mobile": "?0",
-        "sec-ch-ua-platform": "\"Windows\"",
-        "sec-fetch-dest": "document",
-        "sec-fetch-mode": "navigate",
-        "sec-fetch-site": "none",
-        "sec-fetch-user": "?1",
-        "upgrade-insecure-requests": "1",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36 Edg/129.0.0.0"
-    }
-
     os.makedirs(output_dir, exist_ok=True)
 
     for index, row in df.iterrows():
@@ -42,7 +65,7 @@ def download_rfa_audio(df, output_dir, session):
                     
                     # Check if the audio file already exists
                     if not os.path.exists(audio_file_path):
-                        response = session.get(audio_url, headers=headers, stream=True)
+                        response = session.get(audio_url, headers=HEADERS, stream=True)
                         response.raise_for_status()  # Check for HTTP errors
 
                         # Save the audio file
@@ -51,10 +74,325 @@ def download_rfa_audio(df, output_dir, session):
                                 if chunk:
                                     audio_file.write(chunk)
 
-                        print(f"Downloaded RFA audio: {audio_id}.mp3")
+                        increment('items_total', stage='download')
+                        log_event('audio_downloaded', logging.DEBUG, audio_id=audio_id)
                     else:
-                        print(f"Audio file {audio_id}.mp3 already exists. Skipping download.")
+                        increment('skipped_total', stage='download', reason='exists')
                 else:
-                    print(f"No valid audio URL found for RFA ID: {audio_id}")
+                    record_failure('download', 'invalid_audio_url', audio_id=audio_id)
             except Exception as e:
-                print(f"Failed to access or download RFA URL {audio_url}: {e}")
+                record_failure('download', failure_reason(e), audio_id=audio_id, url=audio_url, error=str(e))
+
+def create_session(pool_size=32):
+    """Creates a session whose connection pool is shared by all download threads.
+
+    Args:
+        pool_size (int): maximum number of pooled connections per host.
+
+    Returns:
+        requests.Session: Session object for making requests.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+def is_retryable_error(error):
+    """Checks if a failed request is worth retrying.
+
+    Args:
+        error (requests.RequestException): The error raised by the request.
+
+    Returns:
+        bool: True for connection errors, timeouts, 429 and 5xx responses, False otherwise.
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
+
+def download_audio_file(session, audio_url, audio_file_path, chunk_size=1 << 20, retries=5, backoff=1.0, timeout=60):
+    """Downloads one audio file, resuming a partial `.part` file with an HTTP Range request.
+
+    The file is streamed to `<audio_file_path>.part` and renamed once complete, so a
+    crash never leaves a truncated file under the final name and the next attempt
+    continues from the bytes already on disk.
+
+    Args:
+        session (requests.Session): Session object for making requests.
+        audio_url (str): URL of the audio file.
+        audio_file_path (str): Path where the audio file will be saved.
+        chunk_size (int): Number of bytes written per chunk.
+        retries (int): Number of retries after a retryable failure.
+        backoff (float): Delay in seconds before the first retry, doubled after every retry.
+        timeout (float): Connect and read timeout in seconds.
+
+    Returns:
+        str: Path of the downloaded audio file.
+    """
+    part_path = f'{audio_file_path}.part'
+    for attempt in range(retries + 1):
+        try:
+            resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            # Ranges refer to the encoded bytes, so ask for the file as is
+            request_headers = {'accept-encoding': 'identity'}
+            if resume_from:
+                request_headers['range'] = f'bytes={resume_from}-'
+
+            with session.get(audio_url, headers=request_headers, stream=True, timeout=timeout) as response:
+                if resume_from and response.status_code == 416:
+                    # The partial file already holds every byte
+                    os.replace(part_path, audio_file_path)
+                    return audio_file_path
+                response.raise_for_status()
+
+                # A 200 to a Range request means the server ignored it, so start over
+                mode = 'ab' if response.status_code == 206 else 'wb'
+                with open(part_path, mode) as audio_file:
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        audio_file.write(chunk)
+                        increment('bytes_total', len(chunk), stage='download')
+
+            os.replace(part_path, audio_file_path)
+            return audio_file_path
+        except requests.RequestException as e:
+            if attempt == retries or not is_retryable_error(e):
+                raise
+            increment('retries_total', stage='download', reason=failure_reason(e))
+            time.sleep(backoff * 2 ** attempt)
+
+def is_stream_url(audio_url):
+    """Checks if an audio URL is an HLS playlist, downloaded with ffmpeg rather than over plain HTTP.
+
+    Args:
+        audio_url (str): URL of the audio.
+
+    Returns:
+        bool: True for playlist URLs such as .m3u8, False otherwise.
+    """
+    return urlsplit(audio_url).path.endswith(STREAM_EXTENSIONS)
+
+def audio_file_path(data_dir, channel, audio_id):
+    """Returns the path of the downloaded audio of an article.
+
+    Args:
+        data_dir (str): Root data directory containing one directory per news channel.
+        channel (str): News channel of the article.
+        audio_id (str): ID of the article.
+
+    Returns:
+        str: Path of the audio file, as used by get_audio_duration.
+    """
+    return os.path.join(data_dir, channel, 'downloaded_audio', f"{audio_id}.mp3")
+
+@contextlib.contextmanager
+def host_limited_pool(workers, per_host_limit):
+    """Opens a thread pool running at most `per_host_limit` jobs of the same host at once.
+
+    A job whose host is busy is parked instead of submitted until a job of
+    that host finishes, so it never holds a pool thread that a job of another
+    host could use. Leaving the block waits for every job, parked ones included.
+
+    Args:
+        workers (int): Maximum number of jobs running at once.
+        per_host_limit (int): Maximum number of jobs of the same host running at once.
+
+    Yields:
+        callable: Function taking a URL, a function and its arguments, which schedules
+            the call under the limit of the host of the URL.
+    """
+    condition = threading.Condition()
+    running = {}
+    parked = {}
+    errors = []
+    num_pending = 0
+
+    def run(host, fn, args):
+        nonlocal num_pending
+        try:
+            fn(*args)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            with condition:
+                next_job = parked[host].popleft() if parked.get(host) else None
+                if next_job is None:
+                    running[host] -= 1
+                num_pending -= 1
+                condition.notify_all()
+            if next_job is not None:
+                executor.submit(run, host, *next_job)
+
+    def submit(url, fn, *args):
+        nonlocal num_pending
+        host = urlsplit(url).netloc if isinstance(url, str) else ''
+        with condition:
+            num_pending += 1
+            if running.get(host, 0) >= per_host_limit:
+                parked.setdefault(host, collections.deque()).append((fn, args))
+                return
+            running[host] = running.get(host, 0) + 1
+        executor.submit(run, host, fn, args)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            yield submit
+        finally:
+            # Parked jobs are submitted by the jobs they wait for, so the pool stays open until all are done
+            with condition:
+                condition.wait_for(lambda: num_pending == 0)
+    if errors:
+        raise errors[0]
+
+@contextlib.contextmanager
+def audio_downloader(data_dir, session=None, manifest_path=None, store_dir=None, stream_timeout=STREAM_TIMEOUT,
+                     **download_kwargs):
+    """Opens a downloader of the audio of one article at a time, safe to call from many threads.
+
+    HLS playlists (see STREAM_EXTENSIONS) are fetched with ffmpeg, everything
+    else over HTTP; callers limit the transfers per host by running the
+    downloads on a host_limited_pool. With a manifest, downloads go through the content-addressed audio
+    store: an article whose normalized URL was already downloaded is linked
+    to the stored file instead of being fetched again, articles sharing a URL
+    that is being downloaded wait for that download and are linked to it, and
+    a downloaded file whose content is already stored is replaced by a link
+    to it.
+
+    Args:
+        data_dir (str): Root data directory containing one directory per news channel.
+        session (requests.Session): Session object for making requests, created if not given.
+        manifest_path (str): Path of the SQLite manifest indexing the audio store, None to disable deduplication.
+        store_dir (str): Root directory of the audio store, defaults to `<data_dir>/audio_store`.
+        stream_timeout (float): Maximum run time in seconds of the download of one stream.
+        **download_kwargs: Keyword arguments passed on to download_audio_file.
+
+    Yields:
+        callable: Function taking the news channel, ID and audio URL of an article and returning its
+            (status, audio file path); the status is one of DOWNLOAD_STATUSES and the path is None
+            unless the audio is on disk.
+    """
+    session = session or create_session()
+    conn = open_manifest(manifest_path, check_same_thread=False) if manifest_path else None
+    conn_lock = threading.Lock()
+    store_dir = store_dir or os.path.join(data_dir, 'audio_store')
+    pending_urls = {}
+    state_lock = threading.Lock()
+
+    def fetch(audio_url, path):
+        # Returns False when a stream could not be downloaded, whose failure download_stream_file has recorded
+        if is_stream_url(audio_url):
+            return download_stream_file(audio_url, path, stream_timeout) is not None
+        with timed('item_seconds', stage='download'):
+            download_audio_file(session, audio_url, path, **download_kwargs)
+        return True
+
+    def download(channel, audio_id, audio_url):
+        if not isinstance(audio_url, str) or not audio_url.startswith(('http://', 'https://')):
+            increment('skipped_total', stage='download', reason='invalid_audio_url')
+            return 'skipped', None
+
+        path = audio_file_path(data_dir, channel, audio_id)
+        if os.path.exists(path):
+            increment('skipped_total', stage='download', reason='exists')
+            return 'exists', path
+
+        normalized_url, owner = None, False
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if conn is not None:
+                normalized_url = normalize_url(audio_url)
+                while True:
+                    with conn_lock:
+                        if link_known_url(conn, store_dir, channel, audio_id, audio_url, path):
+                            return 'linked', path
+                    with state_lock:
+                        pending = pending_urls.get(normalized_url)
+                        if pending is None:
+                            pending_urls[normalized_url] = threading.Event()
+                            owner = True
+                            break
+                    # Another article is fetching this URL: link to its file once it is done, or fetch it if that failed
+                    pending.wait()
+
+            if not fetch(audio_url, path):
+                return 'failed', None
+            if conn is None:
+                return 'downloaded', path
+            sha256 = hash_file(path)
+            with conn_lock:
+                duplicate = add_audio_file(conn, store_dir, channel, audio_id, audio_url, path, sha256)
+            return ('duplicate' if duplicate else 'downloaded'), path
+        except Exception as e:
+            record_failure('download', failure_reason(e), audio_id=audio_id, url=audio_url, error=str(e))
+            return 'failed', None
+        finally:
+            # Releases the articles waiting for this one to fetch their URL
+            if owner:
+                with state_lock:
+                    pending_urls.pop(normalized_url).set()
+
+    try:
+        yield download
+    finally:
+        if conn is not None:
+            conn.close()
+
+def download_audio_files(df, data_dir, workers=16, per_host_limit=4, session=None, manifest_path=None, store_dir=None,
+                         stream_timeout=STREAM_TIMEOUT, **download_kwargs):
+    """Downloads the audio of every channel concurrently into `<data_dir>/<News Channel>/downloaded_audio`.
+
+    Transfers share one pooled session and run on a host_limited_pool, so at
+    most `workers` run at once and at most `per_host_limit` of them per host;
+    every article goes through audio_downloader, which fetches HLS playlists
+    with ffmpeg and, with a manifest, deduplicates through the
+    content-addressed audio store.
+
+    Args:
+        df (pd.DataFrame): DataFrame containing the ID, Audio URL and News Channel columns.
+        data_dir (str): Root data directory containing one directory per news channel.
+        workers (int): Maximum number of concurrent transfers.
+        per_host_limit (int): Maximum number of concurrent transfers per host.
+        session (requests.Session): Session object for making requests, created if not given.
+        manifest_path (str): Path of the SQLite manifest indexing the audio store, None to disable deduplication.
+        store_dir (str): Root directory of the audio store, defaults to `<data_dir>/audio_store`.
+        stream_timeout (float): Maximum run time in seconds of the download of one stream.
+        **download_kwargs: Keyword arguments passed on to download_audio_file.
+
+    Returns:
+        dict: Download status ('downloaded', 'duplicate', 'linked', 'exists', 'skipped' or 'failed') by audio ID.
+    """
+    session = session or create_session(pool_size=max(workers, per_host_limit))
+    statuses = {}
+    with audio_downloader(data_dir, session, manifest_path, store_dir, stream_timeout, **download_kwargs) as download, \
+            tqdm(total=len(df), desc='Downloading audio', unit='file') as progress:
+        def download_article(news_channel, audio_id, audio_url):
+            status, _ = download(news_channel, audio_id, audio_url)
+            statuses[audio_id] = status
+            if status in FETCHED_STATUSES:
+                increment('items_total', stage='download')
+            progress.update()
+
+        with host_limited_pool(workers, per_host_limit) as submit:
+            for audio_id, audio_url, news_channel in df[['ID', 'Audio URL', 'News Channel']].itertuples(index=False):
+                submit(audio_url, download_article, news_channel, audio_id, audio_url)
+    return statuses
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Download the audio of the compiled news metadata.')
+    parser.add_argument('--metadata', default='./news_data.csv', help='compiled news metadata CSV or .parquet file')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--workers', type=int, default=16, help='maximum number of concurrent transfers')
+    parser.add_argument('--per-host-limit', type=int, default=4, help='maximum number of concurrent transfers per host')
+    parser.add_argument('--manifest', default=None, help='SQLite manifest indexing the audio store, enables deduplication')
+    parser.add_argument('--store-dir', default=None, help='root directory of the audio store')
+    parser.add_argument('--stream-timeout', type=float, default=STREAM_TIMEOUT,
+                        help='maximum seconds spent downloading one .m3u8 stream with ffmpeg')
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    df = read_metadata(args.metadata, columns=['ID', 'Audio URL', 'News Channel'])
+    download_audio_files(df, args.data_dir, workers=args.workers, per_host_limit=args.per_host_limit,
+                         manifest_path=args.manifest, store_dir=args.store_dir, stream_timeout=args.stream_timeout)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import shutil
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from news_manifest import get_url_hash, record_audio_article, get_audio_hashes
+
+# Query parameters that only track the visitor and never change the audio served
+TRACKING_PARAMETERS = ('utm_', 'fbclid', 'gclid')
+
+def normalize_url(url):
+    """Normalizes an audio URL so that URLs serving the same file compare equal.
+
+    The scheme is dropped (http and https serve the same file), the host is
+    lowercased, default ports, fragments and tracking parameters are removed
+    and the remaining query parameters are sorted.
+
+    Args:
+        url (str): Audio URL.
+
+    Returns:
+        str: Normalized URL, e.g. '//www.rfa.org/audio/a.mp3'.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.lower().startswith(TRACKING_PARAMETERS)
+    )
+    return urlunsplit(('', host, parts.path or '/', urlencode(query), ''))
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Computes the SHA-256 of a file.
+
+    Args:
+        file_path (str): Path of the file.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file content.
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def object_path(store_dir, sha256):
+    """Returns the path of a stored audio object.
+
+    Args:
+        store_dir (str): Root directory of the content-addressed audio store.
+        sha256 (str): SHA-256 of the audio.
+
+    Returns:
+        str: Path of the object, sharded by the first two hex digits of the hash.
+    """
+    return os.path.join(store_dir, 'objects', sha256[:2], f'{sha256}.mp3')
+
+def link_file(source_path, link_path):
+    """Makes link_path refer to source_path, with a hardlink when possible.
+
+    Falls back to a symlink when the paths are on different file systems, and
+    to a copy when symlinks are not supported either.
+
+    Args:
+        source_path (str): Existing file.
+        link_path (str): Path of the link to create, replaced if it exists.
+    """
+    os.makedirs(os.path.dirname(link_path), exist_ok=True)
+    temp_path = f'{link_path}.link'
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        try:
+            os.symlink(os.path.abspath(source_path), temp_path)
+        except OSError:
+            shutil.copyfile(source_path, temp_path)
+    os.replace(temp_path, link_path)
+
+def link_known_url(conn, store_dir, channel, audio_id, audio_url, audio_file_path):
+    """Links an article to audio already stored for the same normalized URL.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        store_dir (str): Root directory of the content-addressed audio store.
+        channel (str): News channel of the article.
+        audio_id (str): ID of the article.
+        audio_url (str): Audio URL of the article.
+        audio_file_path (str): Path where the article's audio is expected.
+
+    Returns:
+        bool: True if the audio was linked, False if it has to be downloaded.
+    """
+    normalized_url = normalize_url(audio_url)
+    sha256 = get_url_hash(conn, normalized_url)
+    if sha256 is None or not os.path.exists(object_path(store_dir, sha256)):
+        return False
+    link_file(object_path(store_dir, sha256), audio_file_path)
+    record_audio_article(conn, channel, audio_id, normalized_url, sha256)
+    return True
+
+def add_audio_file(conn, store_dir, channel, audio_id, audio_url, audio_file_path, sha256=None):
+    """Adds a downloaded audio file to the store, replacing it with a link if its content is already stored.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        store_dir (str): Root directory of the content-addressed audio store.
+        channel (str): News channel of the article.
+        audio_id (str): ID of the article.
+        audio_url (str): URL the audio was downloaded from.
+        audio_file_path (str): Path of the downloaded audio file.
+        sha256 (str): SHA-256 of the file if already known, computed otherwise.
+
+    Returns:
+        bool: True if the content was already stored, i.e. the file is a duplicate.
+    """
+    sha256 = sha256 or hash_file(audio_file_path)
+    stored_path = object_path(store_dir, sha256)
+    duplicate = os.path.exists(stored_path)
+    if duplicate:
+        link_file(stored_path, audio_file_path)
+    else:
+        link_file(audio_file_path, stored_path)
+    record_audio_article(conn, channel, audio_id, normalize_url(audio_url), sha256)
+    return duplicate
+
+def article_key(channel, audio_id):
+    """Returns the key naming an article across channels, whose IDs are only unique within a channel.
+
+    Args:
+        channel (str): News channel of the article.
+        audio_id (str): ID of the article.
+
+    Returns:
+        str: `<channel>/<ID>`, e.g. 'RFA/a1b2'.
+    """
+    return f'{channel}/{audio_id}'
+
+def annotate_duplicates(df, conn):
+    """Adds the audio hash and the canonical article of every duplicate audio to the metadata.
+
+    Among the articles sharing the same audio, the one with the smallest
+    (ID, News Channel) is canonical and the others name it in 'Duplicate Of'
+    by its article_key, since the canonical article is often in another channel.
+
+    Args:
+        df (pd.DataFrame): Metadata with ID and News Channel columns.
+        conn (sqlite3.Connection): Connection to the manifest.
+
+    Returns:
+        pd.DataFrame: The metadata with 'Audio Hash' and 'Duplicate Of' columns.
+    """
+    audio_hashes = get_audio_hashes(conn)
+    canonical_keys = {}
+    for (channel, audio_id), sha256 in sorted(audio_hashes.items(), key=lambda item: (item[0][1], item[0][0])):
+        canonical_keys.setdefault(sha256, (channel, audio_id))
+
+    keys = list(zip(df['News Channel'], df['ID'].astype(str)))
+    hashes = [audio_hashes.get(key) for key in keys]
+    df['Audio Hash'] = hashes
+    df['Duplicate Of'] = [
+        article_key(*canonical_keys[sha256]) if sha256 and canonical_keys[sha256] != key else None
+        for key, sha256 in zip(keys, hashes)
+    ]
+    return df
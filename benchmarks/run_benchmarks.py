@@ -0,0 +1,273 @@
+import argparse
+import contextlib
+import cProfile
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+import threading
+import time
+import pandas as pd
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from benchmarks.synthetic_corpus import generate_news_dataset, generate_article_tree, write_mp3_fixture, write_wav_fixture, serve_directory
+
+def directory_size(path):
+    """Returns the total size in bytes of the files under a directory.
+
+    Args:
+        path (Path): Directory to measure.
+
+    Returns:
+        int: Total size of the files.
+    """
+    return sum(file_path.stat().st_size for file_path in Path(path).rglob('*') if file_path.is_file())
+
+def bench_get_news_with_audio(workdir, articles, files):
+    """Reads whole shards with json.load and filters them with get_news_with_audio."""
+    from extract_news_audio import read_json_file, get_news_with_audio
+    shard_paths = generate_news_dataset(workdir / 'data', articles)
+
+    def run():
+        for shard_path in shard_paths:
+            get_news_with_audio(read_json_file(shard_path), shard_path.parent.parent.name)
+    return run, articles, sum(path.stat().st_size for path in shard_paths)
+
+def bench_iter_news_with_audio(workdir, articles, files):
+    """Streams shards with iter_json_items and filters them with iter_news_with_audio."""
+    from extract_news_audio import iter_json_items, iter_news_with_audio
+    shard_paths = generate_news_dataset(workdir / 'data', articles)
+
+    def run():
+        for shard_path in shard_paths:
+            for _ in iter_news_with_audio(iter_json_items(shard_path), shard_path.parent.parent.name):
+                pass
+    return run, articles, sum(path.stat().st_size for path in shard_paths)
+
+def bench_prefilter_news_with_audio(workdir, articles, files):
+    """Filters the same shards as bench_iter_news_with_audio, only decoding articles found by iter_audio_json_items."""
+    from extract_news_audio import iter_audio_json_items, iter_news_with_audio
+    shard_paths = generate_news_dataset(workdir / 'data', articles)
+
+    def run():
+        for shard_path in shard_paths:
+            for _ in iter_news_with_audio(iter_audio_json_items(shard_path), shard_path.parent.parent.name):
+                pass
+    return run, articles, sum(path.stat().st_size for path in shard_paths)
+
+def bench_save_news_file(workdir, articles, files):
+    """Writes prepared articles to the per-article directory layout with save_news_file."""
+    from extract_news_audio import iter_json_items, iter_news_with_audio, save_news_file
+    shard_paths = generate_news_dataset(workdir / 'data', articles, audio_ratio=1.0)
+    prepared = [
+        (article_id, article_data, shard_path.parent.parent / 'news_dataset_with_audio')
+        for shard_path in shard_paths
+        for article_id, article_data in iter_news_with_audio(iter_json_items(shard_path), shard_path.parent.parent.name)
+    ]
+
+    def run():
+        for article_id, article_data, output_dir in prepared:
+            save_news_file(article_data, article_id, output_dir)
+    return run, len(prepared), None
+
+def bench_write_bundle(workdir, articles, files):
+    """Writes the same articles as bench_save_news_file to one JSONL bundle per shard."""
+    from article_bundles import write_bundle
+    from extract_news_audio import iter_json_items, iter_news_with_audio, encode_news_record
+    shard_paths = generate_news_dataset(workdir / 'data', articles, audio_ratio=1.0)
+    prepared = [
+        (shard_path.parent.parent / 'news_bundles' / f'{shard_path.stem}.jsonl',
+         list(iter_news_with_audio(iter_json_items(shard_path), shard_path.parent.parent.name)))
+        for shard_path in shard_paths
+    ]
+
+    def run():
+        for bundle_path, news_with_audio in prepared:
+            write_bundle(bundle_path, (encode_news_record(article_data, article_id)[0] for article_id, article_data in news_with_audio))
+    return run, sum(len(news_with_audio) for _, news_with_audio in prepared), None
+
+def bench_compile_news_metadata(workdir, articles, files):
+    """Scans an extracted article tree and writes news_data.csv with compile_news_metadata."""
+    from compile_news_metadata import compile_news_metadata
+    generate_article_tree(workdir / 'data', articles)
+    data_size = directory_size(workdir / 'data')
+
+    def run():
+        compile_news_metadata(str(workdir / 'data'), str(workdir / 'news_data.csv'))
+    return run, articles, data_size
+
+def bench_probe_audio_durations(workdir, articles, files):
+    """Probes the duration of MP3 files with probe_audio_durations."""
+    from get_audio_duration import probe_audio_durations
+    audio_dir = workdir / 'audio'
+    audio_dir.mkdir()
+    audio_file_paths = [str(write_mp3_fixture(audio_dir / f'{i}.mp3', seconds=60 + i % 600)) for i in range(files)]
+
+    def run():
+        probe_audio_durations(audio_file_paths)
+    return run, files, directory_size(audio_dir)
+
+def bench_classify_gender(workdir, articles, files):
+    """Classifies the speaker gender of WAV files with classify_genders."""
+    from identify_gender import classify_genders
+    audio_dir = workdir / 'audio'
+    audio_dir.mkdir()
+    num_files = max(1, files // 20)
+    audio_files = [str(write_wav_fixture(audio_dir / f'{i}.wav', seconds=90, frequency=110 + i % 120)) for i in range(num_files)]
+
+    def run():
+        classify_genders(audio_files)
+    return run, num_files, directory_size(audio_dir)
+
+def bench_download_audio_files(workdir, articles, files):
+    """Downloads MP3 files from a local HTTP server with download_audio_files."""
+    from audio_download import download_audio_files
+    served_dir = workdir / 'served'
+    served_dir.mkdir()
+    for i in range(files):
+        write_mp3_fixture(served_dir / f'{i}.mp3', seconds=120)
+
+    def run():
+        with serve_directory(served_dir) as base_url:
+            df = pd.DataFrame({
+                'ID': [str(i) for i in range(files)],
+                'Audio URL': [f'{base_url}/{i}.mp3' for i in range(files)],
+                'News Channel': ['RFA'] * files,
+            })
+            download_audio_files(df, str(workdir / 'data'))
+    return run, files, directory_size(served_dir)
+
+BENCHMARKS = {
+    'get_news_with_audio': bench_get_news_with_audio,
+    'iter_news_with_audio': bench_iter_news_with_audio,
+    'prefilter_news_with_audio': bench_prefilter_news_with_audio,
+    'save_news_file': bench_save_news_file,
+    'write_bundle': bench_write_bundle,
+    'compile_news_metadata': bench_compile_news_metadata,
+    'probe_audio_durations': bench_probe_audio_durations,
+    'classify_gender': bench_classify_gender,
+    'download_audio_files': bench_download_audio_files,
+}
+
+def current_rss_mb():
+    """Returns the current resident set size of this process in MB."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+@contextlib.contextmanager
+def track_rss(interval=0.005):
+    """Tracks the memory used by a block, leaving out what was allocated before it, e.g. the fixtures.
+
+    The peak RSS counters of the kernel never go down, so the RSS of this
+    process is sampled on a thread instead. Worker processes only exist
+    during the block, so their peak RSS is taken from the kernel.
+
+    Args:
+        interval (float): Seconds between two samples.
+
+    Yields:
+        dict: Filled once the block exits with 'rss_increase_mb', the peak RSS of this process
+            above its RSS when the block started, and 'child_peak_rss_mb', the peak RSS of the
+            largest worker process that finished in the block, None without any.
+    """
+    usage = {}
+    baseline = peak = current_rss_mb()
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    stop = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not stop.wait(interval):
+            peak = max(peak, current_rss_mb())
+
+    thread = threading.Thread(target=sample, daemon=True)
+    thread.start()
+    try:
+        yield usage
+    finally:
+        stop.set()
+        thread.join()
+        peak = max(peak, current_rss_mb())
+        children_peak_after = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        usage['rss_increase_mb'] = peak - baseline
+        usage['child_peak_rss_mb'] = children_peak_after / 1024 if children_peak_after > children_peak else None
+
+def run_benchmark(name, articles, files, profile_dir=None):
+    """Runs one benchmark in the current process: builds its fixtures, then times the stage.
+
+    Only the memory allocated while the stage runs is reported, see track_rss.
+
+    Args:
+        name (str): Name of the benchmark in BENCHMARKS.
+        articles (int): Number of synthetic articles.
+        files (int): Number of synthetic audio files.
+        profile_dir (str): Directory where a cProfile dump of the stage is written, None to disable profiling.
+
+    Returns:
+        dict: Benchmark name, number of items, seconds, items/sec, MB/sec, RSS increase and worker peak RSS in MB.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        run, num_items, num_bytes = BENCHMARKS[name](Path(workdir), articles, files)
+        profiler = cProfile.Profile() if profile_dir else None
+
+        with track_rss() as usage:
+            start = time.perf_counter()
+            if profiler:
+                profiler.enable()
+            run()
+            if profiler:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+
+    if profiler:
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, f'{name}.prof'))
+    return {
+        'benchmark': name,
+        'items': num_items,
+        'seconds': round(seconds, 3),
+        'items_per_sec': round(num_items / seconds, 1) if seconds else None,
+        'mb_per_sec': round(num_bytes / seconds / 1e6, 2) if num_bytes and seconds else None,
+        'rss_increase_mb': round(usage['rss_increase_mb'], 1),
+        'child_peak_rss_mb': round(usage['child_peak_rss_mb'], 1) if usage['child_peak_rss_mb'] is not None else None,
+    }
+
+def run_benchmark_isolated(name, articles, files, profile_dir=None):
+    """Runs one benchmark in a fresh process, so that its memory use is not mixed with other benchmarks.
+
+    Args:
+        name (str): Name of the benchmark in BENCHMARKS.
+        articles (int): Number of synthetic articles.
+        files (int): Number of synthetic audio files.
+        profile_dir (str): Directory where a cProfile dump of the stage is written, None to disable profiling.
+
+    Returns:
+        dict: Result of run_benchmark.
+    """
+    # Benchmarks start process pools of their own, which the daemonic workers of multiprocessing.Pool cannot do
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(run_benchmark, name, articles, files, profile_dir).result()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the pipeline stages on a synthetic corpus.')
+    parser.add_argument('--articles', type=int, default=10_000, help='number of synthetic articles')
+    parser.add_argument('--files', type=int, default=200, help='number of synthetic audio files')
+    parser.add_argument('--only', nargs='+', choices=sorted(BENCHMARKS), help='benchmarks to run, all by default')
+    parser.add_argument('--profile-dir', default=None, help='write a cProfile dump of every stage to this directory')
+    parser.add_argument('--output', default=None, help='append the results as JSON lines to this file')
+    args = parser.parse_args()
+
+    for name in args.only or BENCHMARKS:
+        try:
+            result = run_benchmark_isolated(name, args.articles, args.files, args.profile_dir)
+        except ImportError as e:
+            print(f"{name}: skipped, {e}")
+            continue
+        print(f"{result['benchmark']:<24} {result['items']:>9} items {result['seconds']:>9.3f}s "
+              f"{result['items_per_sec'] or 0:>11.1f}/s {result['mb_per_sec'] or 0:>8.2f} MB/s {result['rss_increase_mb']:>8.1f} MB RSS increase"
+              + (f" {result['child_peak_rss_mb']:.1f} MB worker RSS" if result['child_peak_rss_mb'] is not None else ''))
+        if args.output:
+            with open(args.output, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result) + '\n')
@@ -0,0 +1,194 @@
+import contextlib
+import functools
+import json
+import random
+import threading
+import wave
+import numpy as np
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+NEWS_HOUSES = ['VOA', 'VOT', 'RFA']
+
+# Tibetan syllables used to build article text of a realistic byte size
+SYLLABLES = ['བོད', 'ཀྱི', 'གསར', 'འགྱུར', 'རྒྱལ', 'ཁབ', 'སྲིད', 'དོན', 'མི', 'དམངས', 'ལོ', 'ཟླ', 'ཚེས', 'ཉིན', 'ལས', 'དོན']
+
+# MPEG-1 layer III, 128 kbps, 44.1 kHz, stereo frame header; frames are 417 bytes long and hold 1152 samples
+MP3_FRAME_HEADER = b'\xff\xfb\x90\x00'
+MP3_FRAME_LENGTH = 417
+MP3_FRAME_SECONDS = 1152 / 44100
+
+def make_text_lines(rng, num_lines=20, words_per_line=25):
+    """Builds the Text lines of a synthetic article, ending with a reporter byline.
+
+    Args:
+        rng (random.Random): Random number generator.
+        num_lines (int): Number of lines of text.
+        words_per_line (int): Number of words per line.
+
+    Returns:
+        list: Lines of Tibetan text.
+    """
+    lines = ['་'.join(rng.choices(SYLLABLES, k=words_per_line)) + '།' for _ in range(num_lines)]
+    lines.append(f"གསར་འགོད་པ། {rng.choice(SYLLABLES)}་{rng.choice(SYLLABLES)}།")
+    return lines
+
+def make_article(rng, article_id, news_house, audio_ratio=0.3, base_url='https://example.com'):
+    """Builds one synthetic news_dataset article in the layout of the scraped shards.
+
+    Args:
+        rng (random.Random): Random number generator.
+        article_id (str): ID of the article.
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+        audio_ratio (float): Probability that the article has audio.
+        base_url (str): Base URL of the audio files.
+
+    Returns:
+        dict: The article.
+    """
+    has_audio = rng.random() < audio_ratio
+    return {
+        'data': {
+            'title': '་'.join(rng.choices(SYLLABLES, k=6)),
+            'body': {
+                'Audio': f'{base_url}/{news_house}/{article_id}.mp3' if has_audio else '',
+                'Text': make_text_lines(rng),
+            },
+            'meta_data': {
+                'Date': f'20{rng.randint(15, 24)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+                'Author': news_house,
+                'Tags': rng.choices(SYLLABLES, k=2),
+                'URL': f'https://example.com/{news_house}/{article_id}.html',
+                'speaker': 'Unknown',
+            },
+        },
+        'Message': 'Success',
+        'Response': 200,
+    }
+
+def generate_news_dataset(data_dir, num_articles, shard_size=10_000, audio_ratio=0.3, news_houses=NEWS_HOUSES, seed=0,
+                          base_url='https://example.com'):
+    """Writes synthetic news_dataset shards under `<data_dir>/<news house>/news_dataset`.
+
+    Articles are spread evenly over the news houses and written one at a
+    time, so corpora of a million articles can be generated in bounded memory.
+
+    Args:
+        data_dir (Path): Root data directory.
+        num_articles (int): Total number of articles.
+        shard_size (int): Number of articles per shard.
+        audio_ratio (float): Probability that an article has audio.
+        news_houses (list): News house identifiers.
+        seed (int): Seed of the random number generator.
+        base_url (str): Base URL of the audio files.
+
+    Returns:
+        list: Paths of the written shards.
+    """
+    rng = random.Random(seed)
+    shard_paths = []
+    per_house = -(-num_articles // len(news_houses))
+    for house_index, news_house in enumerate(news_houses):
+        news_dataset_dir = Path(data_dir) / news_house / 'news_dataset'
+        news_dataset_dir.mkdir(parents=True, exist_ok=True)
+        house_articles = min(per_house, num_articles - house_index * per_house)
+        for shard_start in range(0, max(house_articles, 0), shard_size):
+            shard_path = news_dataset_dir / f'{shard_start // shard_size:05d}.json'
+            with open(shard_path, 'w', encoding='utf-8') as f:
+                f.write('{')
+                for i in range(shard_start, min(shard_start + shard_size, house_articles)):
+                    article_id = f'{news_house}{i:07d}'
+                    article = make_article(rng, article_id, news_house, audio_ratio, base_url)
+                    f.write(('' if i == shard_start else ',') + json.dumps(article_id) + ':' + json.dumps(article, ensure_ascii=False))
+                f.write('}')
+            shard_paths.append(shard_path)
+    return shard_paths
+
+def generate_article_tree(data_dir, num_articles, news_houses=NEWS_HOUSES, seed=0):
+    """Writes synthetic extracted article directories, as produced by extract_news_audio.
+
+    Args:
+        data_dir (Path): Root data directory.
+        num_articles (int): Total number of articles.
+        news_houses (list): News house identifiers.
+        seed (int): Seed of the random number generator.
+
+    Returns:
+        int: Number of article directories written.
+    """
+    rng = random.Random(seed)
+    for i in range(num_articles):
+        news_house = news_houses[i % len(news_houses)]
+        article_id = f'{news_house}{i:07d}'
+        article_dir = Path(data_dir) / news_house / 'news_dataset_with_audio' / article_id
+        article_dir.mkdir(parents=True, exist_ok=True)
+        (article_dir / f'{article_id}_audio_url.txt').write_text(f'https://example.com/{article_id}.mp3', encoding='utf-8')
+        (article_dir / 'news_text.txt').write_text('\n'.join(make_text_lines(rng)), encoding='utf-8')
+        metadata = {'published_date': '2024-08-20', 'author': news_house, 'speaker': 'Unknown', 'category': [], 'news_url': ''}
+        (article_dir / 'metadata.json').write_text(json.dumps(metadata, ensure_ascii=False, indent=4), encoding='utf-8')
+    return num_articles
+
+def write_mp3_fixture(path, seconds=10.0):
+    """Writes a constant bitrate MP3 file made of silent frames.
+
+    The frames carry no audio data, which is enough for header-based duration
+    probing and for download tests, but not for decoding.
+
+    Args:
+        path (Path): Path of the file to write.
+        seconds (float): Duration of the file.
+
+    Returns:
+        Path: The written path.
+    """
+    num_frames = max(1, round(seconds / MP3_FRAME_SECONDS))
+    Path(path).write_bytes((MP3_FRAME_HEADER + bytes(MP3_FRAME_LENGTH - 4)) * num_frames)
+    return Path(path)
+
+def write_wav_fixture(path, seconds=10.0, frequency=150.0, sample_rate=16000):
+    """Writes a mono 16-bit WAV file of a voice-like harmonic tone, for decoding and pitch tests.
+
+    Args:
+        path (Path): Path of the file to write.
+        seconds (float): Duration of the file.
+        frequency (float): Fundamental frequency of the tone in Hz.
+        sample_rate (int): Sample rate of the file.
+
+    Returns:
+        Path: The written path.
+    """
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = sum(np.sin(2 * np.pi * frequency * harmonic * t) / harmonic for harmonic in (1, 2, 3))
+    samples = (signal / np.abs(signal).max() * 0.5 * 32767).astype('<i2')
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.tobytes())
+    return Path(path)
+
+class QuietRequestHandler(SimpleHTTPRequestHandler):
+    """Serves files without logging every request to stderr."""
+
+    def log_message(self, format, *args):
+        pass
+
+@contextlib.contextmanager
+def serve_directory(directory):
+    """Serves a directory over HTTP on a free local port, standing in for the news sites.
+
+    Args:
+        directory (Path): Directory to serve.
+
+    Yields:
+        str: Base URL of the server, e.g. 'http://127.0.0.1:8123'.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietRequestHandler, directory=str(directory)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
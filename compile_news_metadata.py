@@ -1,134 +1,332 @@
+import argparse
 import os
-import pandas as pd
-import requests
 import re
 import json
 
-data_root_dir = './data'  
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from article_bundles import iter_bundle_paths, index_bundle, bundle_reader
+from metadata_io import write_metadata_rows
+from speaker_extraction import extract_speaker_from_text
+from news_manifest import open_manifest, article_signature, get_article_signatures, upsert_article_rows, delete_articles, iter_article_rows, get_speaker_genders
+
 news_channels = ['RFA', 'VOA', 'VOT']
 
-data_list = []
+METADATA_COLUMNS = ['ID', 'Audio URL', 'Audio Text', 'Speaker Name', 'Speaker Gender', 'News Channel', 'Publishing Year']
 
 # Regex pattern for validating URLs
 url_pattern = re.compile(r'^(http|https)://.*$')
 
-# Headers for RFA requests
-headers = {
-    "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-    "accept-encoding": "gzip, deflate, br, zstd",
-    "accept-language": "en-US,en;q=0.9,en-IN;q=0.8",
-    "cache-control": "max-age=0",
-    "cookie": "AMCVS_518ABC7455E462B97F000101%40AdobeOrg=1; s_cc=true; utag_main=v_id:019169eade56002296e6ea4a443c0507d001b075008f7$_sn:11$_se:5$_ss:0$_st:1727788387180$vapi_domain:rfa.org$ses_id:1727793787%3Bexp-session$_pn:5%3Bexp-session; AMCV_518ABC7455E462B97F000101%40AdobeOrg=1176715910%7CMCIDTS%7C19997%7CMCMID%7C92058839809215745258174654077801968713%7CMCAID%7CNONE%7CMCOPTOUT-1727793787s%7CNONE%7CvVersion%7C5.4.0; s_sq=%5B%5BB%5D%5D",
-    "priority": "u=0, i",
-    "sec-ch-ua": "\"Microsoft Edge\";v=\"129\", \"Not=A?Brand\";v=\"8\", \"Chromium\";v=\"129\"",
-    "sec-ch-ua-mobile": "?0",
-    "sec-ch-ua-platform": "\"Windows\"",
-    "sec-fetch-dest": "document",
-    "sec-fetch-mode": "navigate",
-    "sec-fetch-site": "none",
-    "sec-fetch-user": "?1",
-    "upgrade-insecure-requests": "1",
-    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/129.0.0.0 Safari/537.36 Edg/129.0.0.0"
-}
-
-def extract_speaker_from_text(body_text_lines):
-    """Extracts the speaker's name (the word immediately following 'གསར་འགོད་པ།') from the text.
+def iter_article_dirs(data_root_dir, channels=news_channels):
+    """Lists the article directories of every news channel with one scandir per channel.
 
     Args:
-        body_text_lines (list): List of lines in the text.
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        channels (list): News channels to scan.
+
+    Yields:
+        tuple: (audio ID, news channel, article directory path)
+    """
+    for channel in channels:
+        channel_dir = os.path.join(data_root_dir, channel, 'news_dataset_with_audio')
+
+        if not os.path.exists(channel_dir):
+            print(f"Directory {channel_dir} not found.")
+            continue
+
+        with os.scandir(channel_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    yield entry.name, channel, entry.path
+
+def build_article_row(audio_id, channel, audio_url, audio_text_lines, metadata):
+    """Builds the metadata row of an article from the content of its files.
+
+    Args:
+        audio_id (str): ID of the article.
+        channel (str): News channel of the article.
+        audio_url (str): Content of the audio URL file, None if there is none.
+        audio_text_lines (list): Lines of the transcript, None if there is none.
+        metadata (dict): Content of metadata.json, None if there is none.
 
     Returns:
-        str: Extracted speaker's name or an empty string if not found.
+        dict: Metadata row of the article, keyed by METADATA_COLUMNS.
     """
-    full_text = ' '.join(body_text_lines).replace('\n', ' ').strip()
-    print(f"Full text for speaker extraction: {full_text}")  
-    match = re.search(r'གསར་འགོད་པ།\s*(\S+)', full_text)
-    
-    if match:
-        print(f"Extracted speaker name: {match.group(1)}") 
-        return match.group(1)  # Return the word after 'གསར་འགོད་པ།'
-    
-    return ''  # Return empty if no match is found
-
-
-for channel in news_channels:
-    channel_dir = os.path.join(data_root_dir, channel, 'news_dataset_with_audio')
-    
-    if not os.path.exists(channel_dir):
-        print(f"Directory {channel_dir} not found.")
-        continue
-    
-    for root, dirs, files in os.walk(channel_dir):
-        audio_id = os.path.basename(root)  # Get the folder name as the ID
+    speaker_name = ''
+    speaker_gender = ''
+    publishing_year = ''
+
+    if audio_url is not None and not url_pattern.match(audio_url):  # Validate if it's a URL
         audio_url = None
-        audio_text = ''  
-        speaker_name = ''
-        speaker_gender = ''
-        publishing_year = ''
-        author = ''
-        
-        for file in files:
-            if file.endswith('.txt') and file != 'news_text.txt':
-                audio_url_path = os.path.join(root, file)
-                with open(audio_url_path, 'r', encoding='utf-8') as f:
-                    url_content = f.read().strip()  # Read the URL and strip whitespace
-                    if url_pattern.match(url_content):  # Validate if it's a URL
-                        audio_url = url_content
-            
-            if file == 'news_text.txt':
-                text_file_path = os.path.join(root, file)
-                if os.path.exists(text_file_path):
-                    with open(text_file_path, 'r', encoding='utf-8') as f:
-                        audio_text_lines = f.readlines()  # Read all lines as a list
-                        audio_text = ''.join(audio_text_lines).strip()  # Join all lines into a single string
-                        
-                        # Extract speaker name from text for RFA and VOT if not already found in metadata
-                        if channel == 'RFA': 
-                            speaker_name = extract_speaker_from_text(audio_text_lines)
-
-            # Check for metadata JSON files
-            if file.endswith('.json'):
-                metadata_path = os.path.join(root, file)
-                if os.path.exists(metadata_path):
-                    with open(metadata_path, 'r', encoding='utf-8') as f:
-                        metadata = json.load(f)
-
-                        if channel == 'VOA':
-                            # Correct the publishing year for VOA
-                            publishing_year = metadata.get('author', '') 
-                            speaker_name = metadata.get('speaker', '') 
-                        else:
-                            # Use regular metadata for RFA and VOT
-                            speaker_name_metadata = metadata.get('speaker', '')
-                            # Only use speaker name from metadata if it is not 'unknown'
-                            if speaker_name_metadata.lower() != 'unknown' and not speaker_name:
-                                speaker_name = speaker_name_metadata
-                            publishing_year = metadata.get('published_date', '') 
-                            speaker_gender = metadata.get('gender', '')
-
-        data_list.append({
-            'ID': audio_id,
-            'Audio URL': audio_url if audio_url else 'URL not found',
-            'Audio Text': audio_text if audio_text else 'Transcript not found',
-            'Speaker Name': speaker_name,
-            'Speaker Gender': speaker_gender,
-            'News Channel': channel,  
-            'Publishing Year': publishing_year
-        })
-
-# Sort data_list by ID
-data_list.sort(key=lambda x: x['ID'])
-
-# Create DataFrame and save to CSV
-df = pd.DataFrame(data_list, columns=['ID', 'Audio URL', 'Audio Text', 'Speaker Name', 'Speaker Gender', 'News Channel', 'Publishing Year'])
-output_metadata_csv_path = './news_data.csv'
-df.to_csv(output_metadata_csv_path, index=False, encoding='utf-8')
-print(f"CSV file saved at {output_metadata_csv_path}")
-
-# Create a session object
-session = requests.Session()
-session.headers.update(headers)
-
-# Directory to save downloaded RFA audio
-rfa_audio_dir = os.path.join(data_root_dir, 'RFA', 'downloaded_audio')
-os.makedirs(rfa_audio_dir, exist_ok=True)
+
+    audio_text = ''
+    if audio_text_lines is not None:
+        audio_text = ''.join(audio_text_lines).strip()  # Join all lines into a single string
+
+        # Extract speaker name from text for RFA, metadata is only used when nothing is found
+        if channel == 'RFA':
+            speaker_name = extract_speaker_from_text(audio_text_lines)
+
+    if metadata is not None:
+        if channel == 'VOA':
+            # Correct the publishing year for VOA
+            publishing_year = metadata.get('author', '')
+            speaker_name = metadata.get('speaker', '')
+        else:
+            # Use regular metadata for RFA and VOT
+            speaker_name_metadata = metadata.get('speaker', '')
+            # Only use speaker name from metadata if it is not 'unknown'
+            if speaker_name_metadata.lower() != 'unknown' and not speaker_name:
+                speaker_name = speaker_name_metadata
+            publishing_year = metadata.get('published_date', '')
+            speaker_gender = metadata.get('gender', '')
+
+    return {
+        'ID': audio_id,
+        'Audio URL': audio_url if audio_url else 'URL not found',
+        'Audio Text': audio_text if audio_text else 'Transcript not found',
+        'Speaker Name': speaker_name,
+        'Speaker Gender': speaker_gender,
+        'News Channel': channel,
+        'Publishing Year': publishing_year
+    }
+
+def read_article(audio_id, channel, article_dir):
+    """Reads the audio URL, transcript and metadata files of one article directory.
+
+    Args:
+        audio_id (str): ID of the article, i.e. the name of its directory.
+        channel (str): News channel of the article.
+        article_dir (str): Path of the article directory.
+
+    Returns:
+        dict: Metadata row of the article, keyed by METADATA_COLUMNS.
+    """
+    audio_url = None
+    audio_text_lines = None
+    metadata = None
+
+    with os.scandir(article_dir) as entries:
+        file_names = {entry.name: entry.path for entry in entries if entry.is_file()}
+
+    for file_name, file_path in file_names.items():
+        if file_name.endswith('.txt') and file_name != 'news_text.txt':
+            with open(file_path, 'r', encoding='utf-8') as f:
+                url_content = f.read().strip()  # Read the URL and strip whitespace
+                if url_pattern.match(url_content):
+                    audio_url = url_content
+
+    if 'news_text.txt' in file_names:
+        with open(file_names['news_text.txt'], 'r', encoding='utf-8') as f:
+            audio_text_lines = f.readlines()  # Read all lines as a list
+
+    for file_name, file_path in file_names.items():
+        # Check for metadata JSON files
+        if file_name.endswith('.json'):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                metadata = json.load(f)
+
+    return build_article_row(audio_id, channel, audio_url, audio_text_lines, metadata)
+
+def read_bundle_article(audio_id, channel, record):
+    """Builds the metadata row of an article stored in a bundle.
+
+    Args:
+        audio_id (str): ID of the article.
+        channel (str): News channel of the article.
+        record (dict): Bundle record of the article.
+
+    Returns:
+        dict: Metadata row of the article, keyed by METADATA_COLUMNS.
+    """
+    body_text = record['body_text']
+    audio_text_lines = body_text.splitlines(keepends=True) if body_text is not None else None
+    return build_article_row(audio_id, channel, record['audio_url'], audio_text_lines, record['metadata'])
+
+def read_article_source(audio_id, channel, location, read_record):
+    """Reads one article from either layout.
+
+    Args:
+        audio_id (str): ID of the article.
+        channel (str): News channel of the article.
+        location (str or tuple): Article directory, or bundle location from index_bundle.
+        read_record (callable): Reader of bundle records from bundle_reader.
+
+    Returns:
+        dict: Metadata row of the article, keyed by METADATA_COLUMNS.
+    """
+    if isinstance(location, str):
+        return read_article(audio_id, channel, location)
+    return read_bundle_article(audio_id, channel, read_record(location))
+
+def source_signature(location):
+    """Builds the signature of an article directory or bundle location, see article_signature.
+
+    Args:
+        location (str or tuple): Article directory, or bundle location from index_bundle.
+
+    Returns:
+        str: Signature that changes whenever the article is modified.
+    """
+    if isinstance(location, str):
+        return article_signature(location)
+    return f'bundle:{location[3]}'
+
+def iter_article_sources(data_root_dir, channels=news_channels):
+    """Lists the articles of every news channel in both the directory and the bundle layout.
+
+    Args:
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        channels (list): News channels to scan.
+
+    Yields:
+        tuple: (audio ID, news channel, article directory path or bundle location)
+    """
+    for channel in channels:
+        bundle_paths = iter_bundle_paths(data_root_dir, channel)
+        if bundle_paths and not os.path.exists(os.path.join(data_root_dir, channel, 'news_dataset_with_audio')):
+            article_dirs = []
+        else:
+            article_dirs = iter_article_dirs(data_root_dir, [channel])
+        yield from article_dirs
+        for bundle_path in bundle_paths:
+            for audio_id, location in index_bundle(bundle_path):
+                yield audio_id, channel, location
+
+def list_articles(data_root_dir, channels=news_channels):
+    """Lists the articles to compile sorted by ID, then by channel order.
+
+    An article found more than once keeps its last copy: bundles override
+    article directories, and later shards override earlier ones, like a
+    later extraction overwrites an article directory.
+
+    Args:
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        channels (list): News channels to scan.
+
+    Returns:
+        list: (audio ID, news channel, article directory path or bundle location) tuples.
+    """
+    articles = {(article[1], article[0]): article for article in iter_article_sources(data_root_dir, channels)}
+    channel_order = {channel: index for index, channel in enumerate(channels)}
+    return sorted(articles.values(), key=lambda article: (article[0], channel_order[article[1]]))
+
+def read_articles(article_dirs, workers=32, batch_size=1024):
+    """Reads article directories or bundle records on a thread pool, yielding rows in the order of article_dirs.
+
+    At most `batch_size` articles are in flight at a time, so memory does not
+    grow with the number of articles.
+
+    Args:
+        article_dirs (iterable): (audio ID, news channel, article directory path or bundle location) tuples.
+        workers (int): Number of reader threads.
+        batch_size (int): Number of articles read per batch.
+
+    Yields:
+        dict: Metadata row of every article.
+    """
+    article_dirs = iter(article_dirs)
+    with bundle_reader() as read_record, ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(islice(article_dirs, batch_size))
+            if not batch:
+                return
+            yield from executor.map(lambda article: read_article_source(*article, read_record), batch)
+
+def update_article_manifest(conn, article_dirs, channels, workers=32):
+    """Brings the manifest in line with the article directories on disk.
+
+    Only articles whose files were added or changed since the last run are
+    read again, articles whose directory disappeared are removed.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        article_dirs (list): (audio ID, news channel, article directory path or bundle location) tuples.
+        channels (list): News channels covered by article_dirs.
+        workers (int): Number of reader threads.
+
+    Returns:
+        tuple: (number of articles read, number of articles removed)
+    """
+    stored_signatures = get_article_signatures(conn, channels)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        signatures = list(executor.map(lambda article: source_signature(article[2]), article_dirs))
+
+    changed_article_dirs = []
+    changed_signatures = []
+    for article, signature in zip(article_dirs, signatures):
+        if stored_signatures.pop((article[1], article[0]), None) != signature:
+            changed_article_dirs.append(article)
+            changed_signatures.append(signature)
+
+    upsert_article_rows(conn, zip(read_articles(changed_article_dirs, workers=workers), changed_signatures))
+    delete_articles(conn, stored_signatures.keys())
+    return len(changed_article_dirs), len(stored_signatures)
+
+def fill_speaker_genders(rows, speaker_genders):
+    """Fills the Speaker Gender of rows without one from the speaker gender cache.
+
+    Args:
+        rows (iterable): Metadata rows.
+        speaker_genders (dict): Cached gender by speaker name.
+
+    Yields:
+        dict: The metadata rows, with the gender of known speakers filled in.
+    """
+    for row in rows:
+        if not row['Speaker Gender'] and row['Speaker Name'] in speaker_genders:
+            row['Speaker Gender'] = speaker_genders[row['Speaker Name']]
+        yield row
+
+def compile_news_metadata(data_root_dir='./data', output_path='./news_data.csv', channels=news_channels, workers=32, manifest_path=None,
+                          separate_text=False):
+    """Compiles the metadata of every extracted article into a CSV or Parquet file sorted by ID.
+
+    Rows are written as soon as they are read instead of being collected first.
+    Articles are read from article directories and from the JSONL bundles
+    written by `extract_news_audio.py --output-format jsonl` alike.
+    With a manifest, only new or changed articles are read and the rest of the
+    rows come from the manifest, and missing speaker genders are filled from
+    the speaker gender cache built by speaker_gender.py.
+
+    Args:
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        output_path (str): Path of the CSV or .parquet file to write.
+        channels (list): News channels to compile.
+        workers (int): Number of reader threads.
+        manifest_path (str): Path of the SQLite manifest of processed articles, None to read every article.
+        separate_text (bool): For Parquet output, write the transcripts to a separate file.
+
+    Returns:
+        int: Number of rows written.
+    """
+    # Only the article locations are held in memory, the text is read while writing
+    article_dirs = list_articles(data_root_dir, channels)
+
+    conn = None
+    if manifest_path is None:
+        rows = read_articles(article_dirs, workers=workers)
+    else:
+        conn = open_manifest(manifest_path)
+        num_read, num_removed = update_article_manifest(conn, article_dirs, channels, workers=workers)
+        print(f"Manifest updated: {num_read} articles read, {num_removed} removed")
+        rows = fill_speaker_genders(iter_article_rows(conn, channels), get_speaker_genders(conn))
+
+    try:
+        num_rows = write_metadata_rows(rows, output_path, METADATA_COLUMNS, separate_text=separate_text)
+    finally:
+        if conn is not None:
+            conn.close()
+    return num_rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compile the metadata of the extracted news articles into a CSV or Parquet file.')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--output', default='./news_data.csv', help='output CSV or .parquet file')
+    parser.add_argument('--workers', type=int, default=32, help='number of reader threads')
+    parser.add_argument('--manifest', default=None, help='SQLite manifest of processed articles, enables incremental runs')
+    parser.add_argument('--separate-text', action='store_true', help='write the transcripts of Parquet output to a separate file')
+    args = parser.parse_args()
+
+    compile_news_metadata(args.data_dir, args.output, workers=args.workers, manifest_path=args.manifest, separate_text=args.separate_text)
+    print(f"Metadata file saved at {args.output}")
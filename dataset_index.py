@@ -0,0 +1,346 @@
+import argparse
+import math
+import os
+import re
+import sqlite3
+import pandas as pd
+
+from pathlib import Path
+from audio_store import article_key
+from metadata_io import read_metadata_columns, read_metadata, write_metadata
+from speaker_extraction import is_known_speaker
+
+# Metadata columns kept in the index and the index column holding each; transcripts are never indexed
+INDEX_COLUMNS = {
+    'ID': 'id',
+    'News Channel': 'channel',
+    'Speaker Name': 'speaker',
+    'Speaker Gender': 'gender',
+    'Publishing Year': 'year',
+    'Audio Duration Seconds': 'duration',
+    'Audio URL': 'audio_url',
+    'Duplicate Of': 'duplicate_of',
+}
+
+DEFAULT_SPLITS = {'train': 0.8, 'dev': 0.1, 'test': 0.1}
+
+# Four-digit year within a Publishing Year value, which holds the full published date for some channels
+YEAR_PATTERN = re.compile(r'(?<!\d)(?:1[89]|20)\d{2}(?!\d)')
+
+def default_index_path(metadata_path):
+    """Returns the path of the index of a metadata file when none is given.
+
+    Args:
+        metadata_path (str): Path of the compiled metadata CSV or .parquet file.
+
+    Returns:
+        str: `<metadata path>.index.sqlite`, e.g. news_data_with_duration.csv.index.sqlite.
+    """
+    return f'{metadata_path}.index.sqlite'
+
+def open_index(index_path):
+    """Opens the SQLite index of a metadata file, creating its tables if needed.
+
+    Args:
+        index_path (str): Path of the SQLite database file.
+
+    Returns:
+        sqlite3.Connection: Connection to the index.
+    """
+    conn = sqlite3.connect(index_path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS source (
+            path TEXT PRIMARY KEY,
+            signature TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS clips (
+            row INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            speaker TEXT,
+            gender TEXT,
+            year INTEGER,
+            duration REAL,
+            audio_url TEXT,
+            duplicate_of TEXT
+        );
+        CREATE INDEX IF NOT EXISTS clips_speaker ON clips (speaker);
+        CREATE INDEX IF NOT EXISTS clips_channel ON clips (channel);
+        CREATE INDEX IF NOT EXISTS clips_year ON clips (year);
+        CREATE INDEX IF NOT EXISTS clips_duration ON clips (duration);
+    ''')
+    return conn
+
+def metadata_signature(metadata_path):
+    """Builds a signature of a metadata file from its size and mtime.
+
+    The separate transcript file of a Parquet metadata file is left out, as
+    the index does not depend on it.
+
+    Args:
+        metadata_path (str): Path of the compiled metadata CSV or .parquet file.
+
+    Returns:
+        str: Signature that changes whenever the metadata file is rewritten.
+    """
+    stat = os.stat(metadata_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+def parse_year(value):
+    """Reads the year of a Publishing Year value.
+
+    Args:
+        value: Publishing Year from the metadata, a year or a full date, e.g. '2024-08-20', '2024', 2024.0 or None.
+
+    Returns:
+        int: The year, None when the value holds none.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = YEAR_PATTERN.search(str(value))
+    return int(match.group()) if match else None
+
+def optional_value(value):
+    """Returns a metadata value with None for missing values, as stored in the index."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value
+
+def build_index(metadata_path, index_path=None, refresh=False):
+    """Indexes the compiled metadata by speaker, channel, year and duration.
+
+    Only the indexed columns are read from the metadata, never the
+    transcripts. The index is rebuilt only when the metadata file has
+    changed since it was last indexed, so calling this before every query
+    is cheap.
+
+    Args:
+        metadata_path (str): Path of the compiled metadata CSV or .parquet file.
+        index_path (str): Path of the SQLite index, defaults to default_index_path(metadata_path).
+        refresh (bool): Rebuild the index even if the metadata has not changed.
+
+    Returns:
+        str: Path of the index.
+    """
+    index_path = index_path or default_index_path(metadata_path)
+    signature = metadata_signature(metadata_path)
+    source_path = os.path.abspath(metadata_path)
+    conn = open_index(index_path)
+    try:
+        stored = conn.execute('SELECT signature FROM source WHERE path = ?', (source_path,)).fetchone()
+        if stored and stored[0] == signature and not refresh:
+            return index_path
+
+        columns = [column for column in INDEX_COLUMNS if column in read_metadata_columns(metadata_path)]
+        df = read_metadata(metadata_path, columns=columns)
+        rows = (
+            (
+                row,
+                values['ID'],
+                values['News Channel'],
+                optional_value(values.get('Speaker Name')),
+                optional_value(values.get('Speaker Gender')),
+                parse_year(values.get('Publishing Year')),
+                optional_value(values.get('Audio Duration Seconds')),
+                optional_value(values.get('Audio URL')),
+                optional_value(values.get('Duplicate Of')),
+            )
+            for row, values in enumerate(dict(zip(columns, record)) for record in df.itertuples(index=False, name=None))
+        )
+        with conn:
+            conn.execute('DELETE FROM source')
+            conn.execute('DELETE FROM clips')
+            conn.executemany('INSERT INTO clips VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            conn.execute('INSERT INTO source VALUES (?, ?)', (source_path, signature))
+    finally:
+        conn.close()
+    return index_path
+
+def query_conditions(channels=None, speakers=None, genders=None, years=None, min_duration=None, max_duration=None,
+                     unique=False):
+    """Builds the SQL conditions of a query on the index.
+
+    Args:
+        channels (list): News channels to keep, None for all.
+        speakers (list): Speaker names to keep, None for all.
+        genders (list): Speaker genders to keep, None for all.
+        years (list): Publishing years to keep, None for all.
+        min_duration (float): Minimum duration in seconds, None for no minimum.
+        max_duration (float): Maximum duration in seconds, None for no maximum.
+        unique (bool): Leave out clips whose audio duplicates an earlier clip.
+
+    Returns:
+        tuple: (WHERE clause, parameters), the clause being empty without conditions.
+    """
+    conditions = []
+    params = []
+    for column, values in (('channel', channels), ('speaker', speakers), ('gender', genders), ('year', years)):
+        if values is not None:
+            values = list(values)
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(int(value) if column == 'year' else value for value in values)
+    if min_duration is not None:
+        conditions.append('duration >= ?')
+        params.append(min_duration)
+    if max_duration is not None:
+        conditions.append('duration <= ?')
+        params.append(max_duration)
+    if unique:
+        conditions.append("(duplicate_of IS NULL OR duplicate_of = '')")
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ''), params
+
+def query_index(index_path, **filters):
+    """Lists the clips matching every filter, in metadata order.
+
+    Args:
+        index_path (str): Path of the SQLite index built by build_index.
+        **filters: Filters of query_conditions, e.g. channels=['VOA'], years=[2023, 2024], min_duration=2.
+
+    Returns:
+        pd.DataFrame: The indexed metadata columns of the matching clips.
+    """
+    where, params = query_conditions(**filters)
+    conn = open_index(index_path)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(INDEX_COLUMNS.values())} FROM clips {where} ORDER BY row", params)
+        df = pd.DataFrame(cursor.fetchall(), columns=list(INDEX_COLUMNS))
+        df['Audio Duration Seconds'] = df['Audio Duration Seconds'].astype(float)
+    finally:
+        conn.close()
+    return df
+
+def index_summary(index_path):
+    """Sums up the clips and hours of every channel, year and gender in the index.
+
+    Args:
+        index_path (str): Path of the SQLite index built by build_index.
+
+    Returns:
+        dict: {'channel', 'year', 'gender'} tables of (value, number of clips, hours) rows.
+    """
+    conn = open_index(index_path)
+    try:
+        return {
+            column: conn.execute(f'SELECT {column}, COUNT(*), ROUND(COALESCE(SUM(duration), 0) / 3600, 2) FROM clips '
+                                 f'GROUP BY {column} ORDER BY {column}').fetchall()
+            for column in ('channel', 'year', 'gender')
+        }
+    finally:
+        conn.close()
+
+def assign_splits(groups, ratios=DEFAULT_SPLITS):
+    """Spreads groups of clips over splits so that every split gets its share of the total duration.
+
+    Groups are placed largest first into the split furthest below its
+    share, which keeps every split close to its ratio as long as no single
+    group is large compared to the smallest split.
+
+    Args:
+        groups (dict): Total duration in seconds by group key.
+        ratios (dict): Share of the total duration of every split, normalized to sum to 1.
+
+    Returns:
+        dict: Split name by group key.
+    """
+    total_ratio = sum(ratios.values())
+    total_duration = sum(groups.values())
+    targets = {split: total_duration * ratio / total_ratio for split, ratio in ratios.items()}
+    assigned = dict.fromkeys(ratios, 0.0)
+    group_splits = {}
+    for key, duration in sorted(groups.items(), key=lambda item: (-item[1], str(item[0]))):
+        split = max(ratios, key=lambda name: targets[name] - assigned[name])
+        group_splits[key] = split
+        assigned[split] += duration
+    return group_splits
+
+def split_by_speaker(index_path, ratios=DEFAULT_SPLITS, **filters):
+    """Splits the matching clips into speaker-disjoint splits balanced by duration.
+
+    All clips of a known speaker go to the same split. Clips of unknown
+    speakers are placed one by one, together with the clips duplicating
+    their audio, and clips without a duration count as the mean duration of
+    the matching clips.
+
+    Args:
+        index_path (str): Path of the SQLite index built by build_index.
+        ratios (dict): Share of the total duration of every split, e.g. {'train': 0.8, 'dev': 0.1, 'test': 0.1}.
+        **filters: Filters of query_conditions selecting the clips to split.
+
+    Returns:
+        pd.DataFrame: The indexed metadata columns of the matching clips, with their split in a 'Split' column.
+    """
+    df = query_index(index_path, **filters)
+    durations = df['Audio Duration Seconds']
+    durations = durations.fillna(durations.mean() if durations.notna().any() else 1.0)
+    # 'Duplicate Of' holds the article_key of the canonical clip, so duplicates join its group
+    canonical_keys = [
+        duplicate_of if isinstance(duplicate_of, str) and duplicate_of else article_key(channel, audio_id)
+        for channel, audio_id, duplicate_of in zip(df['News Channel'], df['ID'], df['Duplicate Of'])
+    ]
+    group_keys = [
+        speaker if is_known_speaker(speaker) else ('clip', canonical_key)
+        for speaker, canonical_key in zip(df['Speaker Name'], canonical_keys)
+    ]
+
+    groups = {}
+    for key, duration in zip(group_keys, durations):
+        groups[key] = groups.get(key, 0.0) + duration
+    group_splits = assign_splits(groups, ratios)
+    df['Split'] = [group_splits[key] for key in group_keys]
+    return df
+
+def parse_ratios(values):
+    """Parses split ratios given as name=ratio strings, e.g. ['train=0.8', 'dev=0.1', 'test=0.1']."""
+    return {name: float(ratio) for name, ratio in (value.split('=', 1) for value in values)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Index the compiled metadata, then query it or split it without reading transcripts.')
+    parser.add_argument('command', choices=['build', 'query', 'split', 'summary'], help='what to do with the index')
+    parser.add_argument('--metadata', default='./news_data_with_duration.csv', help='compiled metadata CSV or .parquet file')
+    parser.add_argument('--index', default=None, help='SQLite index, defaults to <metadata>.index.sqlite')
+    parser.add_argument('--refresh', action='store_true', help='rebuild the index even if the metadata has not changed')
+    parser.add_argument('--channels', nargs='+', default=None, help='news channels to keep')
+    parser.add_argument('--speakers', nargs='+', default=None, help='speaker names to keep')
+    parser.add_argument('--genders', nargs='+', default=None, help='speaker genders to keep')
+    parser.add_argument('--years', nargs='+', type=int, default=None, help='publishing years to keep')
+    parser.add_argument('--min-duration', type=float, default=None, help='minimum duration in seconds')
+    parser.add_argument('--max-duration', type=float, default=None, help='maximum duration in seconds')
+    parser.add_argument('--unique', action='store_true', help='leave out clips whose audio duplicates an earlier clip')
+    parser.add_argument('--ratios', nargs='+', default=[f'{name}={ratio}' for name, ratio in DEFAULT_SPLITS.items()],
+                        help='duration share of every split, e.g. train=0.8 dev=0.1 test=0.1')
+    parser.add_argument('--output', default=None,
+                        help='CSV or .parquet file of the query, or directory of one CSV file per split')
+    args = parser.parse_args()
+
+    index_path = build_index(args.metadata, args.index, args.refresh)
+    filters = dict(channels=args.channels, speakers=args.speakers, genders=args.genders, years=args.years,
+                   min_duration=args.min_duration, max_duration=args.max_duration, unique=args.unique)
+
+    if args.command == 'build':
+        print(f"Indexed {args.metadata} into {index_path}")
+    elif args.command == 'summary':
+        for column, rows in index_summary(index_path).items():
+            print(f"By {column}:")
+            for value, num_clips, hours in rows:
+                print(f"  {value}: {num_clips} clips, {hours} hours")
+    elif args.command == 'query':
+        df = query_index(index_path, **filters)
+        if args.output:
+            write_metadata(df, args.output)
+        hours = df['Audio Duration Seconds'].sum() / 3600
+        print(f"{len(df)} clips, {hours:.2f} hours")
+    else:
+        ratios = parse_ratios(args.ratios)
+        df = split_by_speaker(index_path, ratios, **filters)
+        if args.output:
+            Path(args.output).mkdir(parents=True, exist_ok=True)
+        for split in ratios:
+            split_df = df[df['Split'] == split].drop(columns='Split')
+            if args.output:
+                write_metadata(split_df, str(Path(args.output) / f'{split}.csv'))
+            hours = split_df['Audio Duration Seconds'].sum() / 3600
+            print(f"{split}: {len(split_df)} clips, {split_df['Speaker Name'].nunique()} speakers, {hours:.2f} hours")
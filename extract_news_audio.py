@@ -1,10 +1,28 @@
+import argparse
+import codecs
 import json
+import logging
+import mmap
+import os
+import re
 import requests
 import subprocess
-import re
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
 from tqdm import tqdm
+from metrics import configure_logging, increment, log_event, record_failure, record_failures, capture_failures, timed, profile_stage
+from speaker_extraction import extract_speaker_from_text
+from article_bundles import bundle_dir, encode_record, write_bundle
+
+# Layouts extracted articles can be written in: one directory per article, or one JSONL bundle per shard
+OUTPUT_FORMATS = ('files', 'jsonl')
+
+# Maximum run time in seconds of one stream download, so a live stream that never ends cannot block its worker
+STREAM_TIMEOUT = 3600
+
+# An "Audio" key whose value is not empty, "", null, false, 0, [] or {}; the pre-filter of iter_audio_json_items
+AUDIO_KEY_PATTERN = re.compile(rb'"Audio"(?<!\\"Audio")\s*:\s*(?:"(?!")|\[\s*[^\s\]]|\{\s*[^\s}]|true|-?[0-9.]*[1-9])')
 
 def read_json_file(file_path):
     """Reads a json file and returns the content
@@ -19,6 +37,194 @@ def read_json_file(file_path):
         json_file_content = json.load(file)  # Load and return the content of the JSON file
     return json_file_content
 
+def iter_json_items(file_path, chunk_size=1 << 20):
+    """Streams the top-level entries of a json object file one at a time
+
+    Only the entry being decoded and a read buffer of about `chunk_size`
+    characters are held in memory, so memory stays flat regardless of the
+    size of the file.
+
+    Args:
+        file_path (str): file path to the json file
+        chunk_size (int): number of characters read from the file at a time
+
+    Yields:
+        tuple: (key, value) pair for every top-level entry of the json object
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'r', encoding='utf-8') as file:
+        buffer = ''
+        pos = 0
+        eof = False
+
+        def next_token():
+            # Skips whitespace and returns the next character, reading more of the file if needed
+            nonlocal buffer, pos, eof
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return buffer[pos] if pos < len(buffer) else ''
+                buffer = file.read(chunk_size)
+                pos = 0
+                eof = not buffer
+
+        def decode_value():
+            # Decodes the next json value, growing the buffer until it holds the whole value
+            nonlocal buffer, pos, eof
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                chunk = file.read(chunk_size)
+                eof = not chunk
+                buffer = buffer[pos:] + chunk
+                pos = 0
+
+        if next_token() != '{':
+            raise ValueError(f"{file_path} does not contain a json object")
+        pos += 1
+        if next_token() == '}':
+            return
+        while True:
+            next_token()
+            key = decode_value()
+            if next_token() != ':':
+                raise ValueError(f"Expected ':' after key {key!r} in {file_path}")
+            pos += 1
+            next_token()
+            yield key, decode_value()
+
+            separator = next_token()
+            pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' after entry {key!r} in {file_path}")
+
+def iter_audio_json_items(file_path, chunk_size=1 << 13):
+    """Streams the top-level entries of a news_dataset shard that may have audio, skipping the others undecoded
+
+    The shard is memory-mapped and searched for `"Audio"` keys with a
+    non-empty value. Only the article around every such key, found by
+    scanning back to the `data.body` objects enclosing it, is decoded, so
+    the cost depends on the number of articles with audio rather than on
+    the size of the shard. Entries are yielded in file order; callers still
+    check them with has_news_audio, which keeps the output identical to
+    iter_json_items + iter_news_with_audio as long as keys are not written
+    with escapes and articles do not nest other articles.
+
+    Args:
+        file_path (str): file path to the json file
+        chunk_size (int): number of bytes of an article decoded at a time
+
+    Yields:
+        tuple: (key, value) pair for every top-level entry whose data.body.Audio may be set
+    """
+    decoder = json.JSONDecoder()
+    with open(file_path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            raise ValueError(f"{file_path} does not contain a json object")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            root = re.compile(rb'\s*').match(buffer).end()
+            if buffer[root:root + 1] != b'{':
+                raise ValueError(f"{file_path} does not contain a json object")
+
+            def skip_space_back(pos):
+                # Returns the offset of the last non-whitespace byte before pos
+                pos -= 1
+                while pos > root and buffer[pos] in b' \t\r\n':
+                    pos -= 1
+                return pos
+
+            def string_start(end):
+                # Returns the offset of the opening quote of the string closed by the quote at end
+                pos = end
+                while True:
+                    pos = buffer.rfind(b'"', root, pos)
+                    if pos < 0:
+                        raise ValueError(f"Unterminated string ending at byte {end} of {file_path}")
+                    backslash = pos - 1
+                    while buffer[backslash] == ord('\\'):
+                        backslash -= 1
+                    if (pos - backslash) % 2:
+                        return pos
+
+            def enclosing_object(pos, floor):
+                # Returns the offset of the '{' of the object containing pos, -1 if pos is not directly in an object
+                depth = 0
+                while True:
+                    # Looks for the previous bracket or quote in growing windows, as articles are short but shards are not
+                    window = 1024
+                    while True:
+                        window_start = max(floor, pos - window)
+                        found = max(buffer.rfind(char, window_start, pos) for char in (b'{', b'}', b'[', b']', b'"'))
+                        if found >= 0 or window_start == floor:
+                            break
+                        window *= 8
+                    pos = found
+                    if pos < 0:
+                        return -1
+                    char = buffer[pos]
+                    if char == ord('"'):
+                        pos = string_start(pos)
+                    elif char in b'}]':
+                        depth += 1
+                    elif depth:
+                        depth -= 1
+                    else:
+                        return pos if char == ord('{') else -1
+
+            def key_before(value_start):
+                # Returns the (start, end) offsets of the key string of the value starting at value_start, None if there is none
+                colon = skip_space_back(value_start)
+                if buffer[colon] != ord(':'):
+                    return None
+                quote = skip_space_back(colon)
+                return (string_start(quote), quote + 1) if buffer[quote] == ord('"') else None
+
+            def decode_value(start):
+                # Decodes the json value starting at start, decoding more of the file until it holds the whole value;
+                # returns the value and the offset of its end
+                utf8 = codecs.getincrementaldecoder('utf-8')()
+                text = ''
+                end = start
+                size = chunk_size
+                while True:
+                    chunk = buffer[end:end + size]
+                    end += len(chunk)
+                    text += utf8.decode(chunk, final=not chunk)
+                    try:
+                        value, length = decoder.raw_decode(text)
+                        return value, start + len(text[:length].encode('utf-8'))
+                    except json.JSONDecodeError:
+                        if not chunk:
+                            raise
+                    size *= 2
+
+            floor = root + 1
+            for match in AUDIO_KEY_PATTERN.finditer(buffer, floor):
+                if match.start() < floor:
+                    continue
+                # Walks up from the Audio key to data.body, data and the article holding them
+                value_start = match.start()
+                for parent_key in (b'"body"', b'"data"', None):
+                    value_start = enclosing_object(value_start, floor)
+                    key_span = key_before(value_start) if value_start >= 0 else None
+                    if key_span is None or (parent_key and buffer[key_span[0]:key_span[1]] != parent_key):
+                        break
+                else:
+                    # The article must be an entry of the top-level object
+                    separator = skip_space_back(key_span[0])
+                    if separator == root or buffer[separator] == ord(','):
+                        article, floor = decode_value(value_start)
+                        yield json.loads(buffer[key_span[0]:key_span[1]]), article
+
 def has_news_audio(news_info):
     """Checks if news has audio
 
@@ -34,22 +240,6 @@ def has_news_audio(news_info):
 
     return bool(news_audio_url)
 
-def extract_speaker_from_text(body_text_lines):
-    """Extracts speaker's name from the text after the phrase 'གསར་འགོད་པ།'.
-
-    Args:
-        body_text_lines (list): List of lines in the text.
-
-    Returns:
-        str: Extracted speaker's name or empty string if not found.
-    """
-    # Regular expression to find 'གསར་འགོད་པ།' and capture the next word
-    for line in body_text_lines:
-        match = re.search(r'གསར་འགོད་པ།\s+(\S+)', line)
-        if match:
-            return match.group(1)  # Return the word after 'གསར་འགོད་པ།'
-    return ''  # Return empty if no match is found
-
 def prepare_news_data_with_audio(news_info, news_house):
     """Prepares a structure for news data with audio, including speaker's name if applicable for the news house.
 
@@ -98,23 +288,96 @@ def get_news_with_audio(news_data, news_house):
         if has_news_audio(news_info):
             news_data_with_audio[news_id] = prepare_news_data_with_audio(news_info, news_house)
     return news_data_with_audio
-   
-def download_stream_file(url, dest_path):
+
+def iter_news_with_audio(news_items, news_house):
+    """Lazily filters news with audio
+
+    Args:
+        news_items (iterable): (news_id, news_info) pairs, e.g. from iter_json_items
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+
+    Yields:
+        tuple: (news_id, news data with audio) for every article that has audio
+    """
+    for news_id, news_info in news_items:
+        if has_news_audio(news_info):
+            yield news_id, prepare_news_data_with_audio(news_info, news_house)
+
+def iter_shard_news_with_audio(news_dataset_file_path, news_house, prefilter=False):
+    """Lazily reads the articles with audio of one news_dataset shard
+
+    Args:
+        news_dataset_file_path (Path): path to the news_dataset json shard
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+        prefilter (bool): Only decode the articles found by iter_audio_json_items rather than every article.
+
+    Yields:
+        tuple: (news_id, news data with audio) for every article that has audio
+    """
+    news_items = iter_audio_json_items(news_dataset_file_path) if prefilter else iter_json_items(news_dataset_file_path)
+    return iter_news_with_audio(news_items, news_house)
+
+def download_stream_file(url, dest_path, timeout=STREAM_TIMEOUT, stall_timeout=30):
     """Downloads a stream file using ffmpeg and saves it with .mp3 extension.
 
+    ffmpeg writes to a `.part` file next to dest_path, which is renamed to
+    dest_path only once ffmpeg exits successfully. ffmpeg is killed when the
+    job runs longer than `timeout` seconds or the stream stalls for
+    `stall_timeout` seconds.
+
     Args:
         url (str): url of the file
         dest_path (str): destination path to save the file
+        timeout (float): maximum run time of ffmpeg in seconds, None for no limit
+        stall_timeout (float): maximum time in seconds ffmpeg waits on a stalled stream
 
     Returns:
-        str: destination path of the file
+        str: destination path of the file, or None if the download failed
     """
     user_agent = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/87.0.4280.88 Safari/537.36"
+    dest_path = Path(dest_path)
+    if dest_path.exists():
+        return str(dest_path)
+    part_path = dest_path.with_name(f'{dest_path.stem}.part{dest_path.suffix}')
+    command = [
+        "ffmpeg", "-nostdin", "-y", "-loglevel", "error",
+        "-rw_timeout", str(int(stall_timeout * 1_000_000)),
+        "-headers", f"User-Agent: {user_agent}",
+        "-i", url, "-c", "copy", str(part_path),
+    ]
     try:
-        subprocess.run(["ffmpeg", "-headers", f"User-Agent: {user_agent}", "-i", url, "-c", "copy", dest_path], check=True)
-        print(f"Downloaded stream file: {url}")
+        with timed('item_seconds', stage='stream_download'):
+            subprocess.run(command, check=True, timeout=timeout, stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.replace(part_path, dest_path)
+        increment('items_total', stage='stream_download')
+        increment('bytes_total', dest_path.stat().st_size, stage='stream_download')
+        return str(dest_path)
+    except subprocess.TimeoutExpired:
+        # subprocess.run has already killed the hung ffmpeg process
+        record_failure('stream_download', 'timeout', url=url, timeout=timeout)
     except subprocess.CalledProcessError as e:
-        print(f"Error downloading stream file: {e}")
+        stderr = e.stderr.decode('utf-8', errors='replace').strip()
+        record_failure('stream_download', f'ffmpeg_exit_{e.returncode}', url=url, stderr=stderr[-2000:])
+    part_path.unlink(missing_ok=True)
+    return None
+
+def download_stream_files(jobs, workers=4, timeout=STREAM_TIMEOUT, stall_timeout=30):
+    """Downloads many stream files with a bounded pool of ffmpeg processes.
+
+    Args:
+        jobs (iterable): (url, dest_path) pairs
+        workers (int): maximum number of ffmpeg processes running at once
+        timeout (float): maximum run time of each ffmpeg process in seconds
+        stall_timeout (float): maximum time in seconds ffmpeg waits on a stalled stream
+
+    Returns:
+        list: destination path of every job, or None for the jobs that failed, in job order
+    """
+    jobs = list(jobs)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(download_stream_file, url, dest_path, timeout, stall_timeout) for url, dest_path in jobs]
+        return [future.result() for future in tqdm(futures, desc='Downloading stream files', unit='file')]
 
 def download_mp3_file(url, dest_path):
     """function to download the mp3 file
@@ -123,12 +386,13 @@ def download_mp3_file(url, dest_path):
         url (str): link of the audio file
         dest_path (str): destination of the file path
     """
-    response = requests.get(url, stream=True)
-    if response.status_code == 200:
-        with open(dest_path, 'wb') as file:
-            file.write(response.content)
-    else:
-        print(f"Failed to download the MP3 file: {url}, status code: {response.status_code}")
+    with requests.get(url, stream=True) as response:
+        if response.status_code == 200:
+            with open(dest_path, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    file.write(chunk)
+        else:
+            record_failure('download', f'http_{response.status_code}', url=url)
 
 def save_body_text(article_data, article_dir):
     """Saves the body text of the article to a text file.
@@ -165,40 +429,193 @@ def save_news_file(article_data, article_id, output_dir):
         article_data (dict): The article data containing audio URL, body text, and metadata.
         article_id (str): The ID of the article, used for naming the directory.
         output_dir (Path): The directory where the article data will be saved.
+
+    Returns:
+        str: The saved audio URL, or None if the article has no valid audio URL.
     """
     article_dir = output_dir / article_id
     article_dir.mkdir(parents=True, exist_ok=True)
 
-    audio_url = article_data['audio_url']
-    
-    if isinstance(audio_url, list) and audio_url:
-        audio_url = audio_url[0]  # Use the first audio URL
-    
-    if not audio_url.startswith(('http://', 'https://')):
-        print(f"Invalid audio URL for article {article_id}: {audio_url}")
-        return
+    audio_url = get_article_audio_url(article_data, article_id)
+    if audio_url is None:
+        return None
 
     # Instead of downloading, save the audio URL to a text file
     with open(article_dir / f"{article_id}_audio_url.txt", 'w', encoding='utf-8') as url_file:
         url_file.write(audio_url)
-    print(f"Audio URL saved for article {article_id} as {article_id}_audio_url.txt")
+    log_event('article_saved', logging.DEBUG, article_id=article_id)
 
     save_body_text(article_data, article_dir)
     save_metadata(article_data, article_dir)
+    return audio_url
 
-if __name__ == "__main__":
-    news_houses = ['VOA', 'VOT', 'RFA']
+def get_article_audio_url(article_data, article_id):
+    """Returns the audio URL of an article, recording articles without a valid one as failures.
+
+    Args:
+        article_data (dict): The article data containing the audio URL.
+        article_id (str): The ID of the article.
+
+    Returns:
+        str: The audio URL, or None if it is not an http(s) URL.
+    """
+    audio_url = article_data['audio_url']
+
+    if isinstance(audio_url, list) and audio_url:
+        audio_url = audio_url[0]  # Use the first audio URL
+
+    if not audio_url.startswith(('http://', 'https://')):
+        record_failure('extract', 'invalid_audio_url', article_id=article_id, audio_url=audio_url)
+        return None
+    return audio_url
+
+def encode_news_record(article_data, article_id):
+    """Encodes an article as a bundle record holding what save_news_file writes to its directory.
+
+    Articles without a valid audio URL are kept as empty records, like the
+    empty directory save_news_file leaves for them.
+
+    Args:
+        article_data (dict): The article data containing audio URL, body text, and metadata.
+        article_id (str): The ID of the article.
+
+    Returns:
+        tuple: (encoded record, audio URL or None if the article has no valid audio URL)
+    """
+    audio_url = get_article_audio_url(article_data, article_id)
+    if audio_url is None:
+        return encode_record(article_id, None, None, None), None
+    return encode_record(article_id, audio_url, article_data['body_text'], article_data['metadata']), audio_url
+
+def shard_bundle_path(news_dataset_file_path, news_house, output_dir):
+    """Returns the path of the bundle a news_dataset shard is extracted to.
+
+    Args:
+        news_dataset_file_path (Path): path to the news_dataset json shard
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+        output_dir (Path): The news_dataset_with_audio directory of the news house.
+
+    Returns:
+        Path: `<data_dir>/<news house>/news_bundles/<shard name>.jsonl`
+    """
+    return bundle_dir(Path(output_dir).parent.parent, news_house) / f'{Path(news_dataset_file_path).stem}.jsonl'
+
+def extract_news_dataset_file(news_dataset_file_path, news_house, output_dir, output_format='files', prefilter=False):
+    """Extracts the articles with audio of one news_dataset shard into output_dir.
+
+    With the 'jsonl' output format, the articles are appended to a single
+    bundle named after the shard in the news_bundles directory next to
+    output_dir, instead of three files in a directory per article.
+
+    Args:
+        news_dataset_file_path (Path): path to the news_dataset json shard
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+        output_dir (Path): The directory where the article data will be saved.
+        output_format (str): 'files' or 'jsonl', see OUTPUT_FORMATS.
+        prefilter (bool): skip the articles without audio undecoded, see iter_audio_json_items
+
+    Returns:
+        int: number of articles with audio found in the shard
+    """
+    with profile_stage('extract'):
+        news_with_audio = iter_shard_news_with_audio(news_dataset_file_path, news_house, prefilter)
+        if output_format == 'jsonl':
+            bundle_path = shard_bundle_path(news_dataset_file_path, news_house, output_dir)
+            return write_bundle(bundle_path, (encode_news_record(article_data, article_id)[0] for article_id, article_data in news_with_audio))
+
+        num_articles = 0
+        for article_id, article_data in news_with_audio:
+            save_news_file(article_data, article_id, output_dir)
+            num_articles += 1
+    return num_articles
+
+def extract_news_dataset_job(news_dataset_file_path, news_house, output_dir, output_format='files', prefilter=False):
+    """Runs extract_news_dataset_file on a process pool, returning its failures for the parent to record.
+
+    Returns:
+        tuple: (number of articles with audio found in the shard, failures captured by capture_failures)
+    """
+    with capture_failures() as failures:
+        num_articles = extract_news_dataset_file(news_dataset_file_path, news_house, output_dir, output_format, prefilter)
+    return num_articles, failures
+
+def list_extraction_jobs(data_dir, news_houses):
+    """Lists the (news_house, shard, output_dir) jobs of an extraction run in serial order.
+
+    Args:
+        data_dir (Path): root data directory containing one directory per news house
+        news_houses (list): news house identifiers to extract
+
+    Returns:
+        list: (news_house, news_dataset_file_path, output_dir) tuples
+    """
+    jobs = []
     for news_house in news_houses:
-        news_dataset_dir = Path(f'./data/{news_house}/news_dataset')
-        output_dir = Path(f'./data/{news_house}/news_dataset_with_audio')
+        news_dataset_dir = Path(data_dir) / news_house / 'news_dataset'
+        output_dir = Path(data_dir) / news_house / 'news_dataset_with_audio'
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        news_dataset_file_paths = list(news_dataset_dir.iterdir())
-        news_dataset_file_paths.sort()
+        news_dataset_file_paths = sorted(news_dataset_dir.iterdir())
+        jobs.extend((news_house, news_dataset_file_path, output_dir) for news_dataset_file_path in news_dataset_file_paths)
+    return jobs
+
+def extract_news_audio(data_dir='./data', news_houses=('VOA', 'VOT', 'RFA'), workers=1, output_format='files', prefilter=False):
+    """Extracts the articles with audio of every news house, spreading shards across processes.
 
-        for news_dataset_file_path in tqdm(news_dataset_file_paths, desc=f'Processing {news_house} news files'):
-            news_data = read_json_file(news_dataset_file_path)
-            news_data_with_audio = get_news_with_audio(news_data, news_house)
+    Every shard is written by exactly one worker and the files written for an
+    article only depend on the article itself, so the output is identical to
+    the serial run as long as article IDs are unique within a news house.
 
-            for article_id, article_data in tqdm(news_data_with_audio.items(), desc='Saving articles'):
-                save_news_file(article_data, article_id, output_dir)
+    Args:
+        data_dir (Path): root data directory containing one directory per news house
+        news_houses (list): news house identifiers to extract
+        workers (int): number of worker processes, 1 runs everything in this process
+        output_format (str): 'files' for a directory per article, 'jsonl' for a bundle per shard
+        prefilter (bool): skip the articles without audio undecoded, see iter_audio_json_items
+
+    Returns:
+        int: total number of articles with audio extracted
+    """
+    jobs = list_extraction_jobs(data_dir, news_houses)
+    total_articles = 0
+
+    def shard_done(news_dataset_file_path, num_articles):
+        increment('items_total', num_articles, stage='extract')
+        increment('bytes_total', os.path.getsize(news_dataset_file_path), stage='extract')
+        increment('shards_total', stage='extract')
+        return num_articles
+
+    with timed('stage_seconds', stage='extract'), tqdm(total=len(jobs), desc='Processing news files', unit='file') as progress:
+        if workers <= 1:
+            for news_house, news_dataset_file_path, output_dir in jobs:
+                total_articles += shard_done(news_dataset_file_path, extract_news_dataset_file(news_dataset_file_path, news_house, output_dir, output_format, prefilter))
+                progress.set_postfix(articles=total_articles)
+                progress.update()
+            return total_articles
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(extract_news_dataset_job, news_dataset_file_path, news_house, output_dir, output_format, prefilter): news_dataset_file_path
+                for news_house, news_dataset_file_path, output_dir in jobs
+            }
+            for future in as_completed(futures):
+                num_articles, failures = future.result()
+                record_failures(failures)
+                total_articles += shard_done(futures[future], num_articles)
+                progress.set_postfix(articles=total_articles)
+                progress.update()
+    return total_articles
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract news articles with audio from the news_dataset shards.')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--news-houses', nargs='+', default=['VOA', 'VOT', 'RFA'], help='news houses to extract')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='files',
+                        help="'files' writes a directory per article, 'jsonl' a bundle per shard")
+    parser.add_argument('--prefilter', action='store_true', help='only decode the articles whose Audio field is set')
+    parser.add_argument('--log-level', default='INFO', help='logging level, DEBUG logs every article')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    extract_news_audio(args.data_dir, args.news_houses, args.workers, args.output_format, args.prefilter)
@@ -0,0 +1,234 @@
+import argparse
+import contextlib
+import os
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from audio_store import hash_file
+from metrics import configure_logging, increment, record_failure, record_failures, capture_failures, failure_reason, timed
+from news_manifest import open_manifest, get_audio_features, set_audio_features
+from segment_audio import FRAME_SECONDS, iter_pcm_blocks, iter_frames
+
+# Rate of the cached PCM, matching the rate classify_genders decodes at
+FEATURE_SAMPLE_RATE = 16000
+
+def feature_paths(cache_dir, sha256, sample_rate=FEATURE_SAMPLE_RATE):
+    """Returns the paths of the cached features of an audio content.
+
+    Features are keyed by the SHA-256 of the audio file, so articles sharing
+    the same audio share their features.
+
+    Args:
+        cache_dir (str): Root directory of the feature cache.
+        sha256 (str): SHA-256 of the audio file.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        tuple: (path of the raw int16 PCM, path of the raw float16 frame levels in dBFS)
+    """
+    base_path = os.path.join(cache_dir, sha256[:2], f'{sha256}-{sample_rate}')
+    return f'{base_path}.pcm', f'{base_path}.rms'
+
+def extract_features(audio_file, cache_dir, sample_rate=FEATURE_SAMPLE_RATE):
+    """Decodes an audio file once, streaming its mono PCM and frame levels to the feature cache.
+
+    Nothing is decoded when the features of the same content are already cached.
+
+    Args:
+        audio_file (str): Path of the audio file.
+        cache_dir (str): Root directory of the feature cache.
+        sample_rate (int): Sample rate to decode at.
+
+    Returns:
+        tuple: (sha256 of the audio file, decoded duration in seconds)
+    """
+    sha256 = hash_file(audio_file)
+    pcm_path, rms_path = feature_paths(cache_dir, sha256, sample_rate)
+    if not (os.path.exists(pcm_path) and os.path.exists(rms_path)):
+        os.makedirs(os.path.dirname(pcm_path), exist_ok=True)
+        # Both files are renamed into place only once the whole file is decoded; the part files are
+        # per process, since two workers can decode duplicate audio at the same time
+        pcm_part_path, rms_part_path = f'{pcm_path}.{os.getpid()}.part', f'{rms_path}.{os.getpid()}.part'
+        try:
+            with open(pcm_part_path, 'wb') as pcm_file, open(rms_part_path, 'wb') as rms_file:
+                def write_blocks():
+                    for block in iter_pcm_blocks(audio_file, sample_rate):
+                        pcm_file.write(block.tobytes())
+                        yield block
+
+                # The levels are a few kilobytes per minute of audio, so they are written once decoding is done
+                frames = iter_frames(write_blocks(), int(sample_rate * FRAME_SECONDS))
+                rms_file.write(np.fromiter((level for _, level in frames), dtype='<f2').tobytes())
+            os.replace(rms_part_path, rms_path)
+            os.replace(pcm_part_path, pcm_path)
+        except BaseException:
+            # Retries write part files under another PID, so a failed decode would otherwise leave these behind
+            for part_path in (pcm_part_path, rms_part_path):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(part_path)
+            raise
+    return sha256, os.path.getsize(pcm_path) / 2 / sample_rate
+
+def extract_features_job(args):
+    """Runs extract_features for build_feature_cache, reporting failures as None along with the captured failures."""
+    audio_file = args[0]
+    with capture_failures() as failures:
+        try:
+            feature = extract_features(*args)
+        except Exception as e:
+            record_failure('features', failure_reason(e), path=audio_file, error=str(e))
+            feature = None
+    return feature, failures
+
+def stat_audio_files(audio_file_paths):
+    """Returns the (size, mtime_ns) keying the manifest entries of every existing audio file.
+
+    Args:
+        audio_file_paths (list): Paths of the audio files, missing files are skipped.
+
+    Returns:
+        dict: (size, mtime_ns) by path.
+    """
+    file_stats = {}
+    for audio_file_path in audio_file_paths:
+        try:
+            stat = os.stat(audio_file_path)
+        except FileNotFoundError:
+            continue
+        file_stats[audio_file_path] = (stat.st_size, stat.st_mtime_ns)
+    return file_stats
+
+def find_cached_features(conn, file_stats, cache_dir, sample_rate=FEATURE_SAMPLE_RATE):
+    """Looks up the cached features of unchanged audio files whose cache files are still on disk.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        file_stats (dict): (size, mtime_ns) by path, see stat_audio_files.
+        cache_dir (str): Root directory of the feature cache.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        dict: (sha256, seconds) by path of every file whose features are cached.
+    """
+    return {
+        path: feature for path, feature in get_audio_features(conn, file_stats, sample_rate).items()
+        if all(map(os.path.exists, feature_paths(cache_dir, feature[0], sample_rate)))
+    }
+
+def get_cached_features(audio_file_paths, cache_dir, manifest_path, sample_rate=FEATURE_SAMPLE_RATE):
+    """Returns the cached features of the audio files that are already in the cache, without decoding any file.
+
+    Args:
+        audio_file_paths (list): Paths of the audio files, missing files are skipped.
+        cache_dir (str): Root directory of the feature cache.
+        manifest_path (str): Path of the SQLite manifest indexing the cache.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        dict: (sha256, seconds) by path of every file whose features are cached.
+    """
+    conn = open_manifest(manifest_path)
+    try:
+        return find_cached_features(conn, stat_audio_files(audio_file_paths), cache_dir, sample_rate)
+    finally:
+        conn.close()
+
+def build_feature_cache(audio_file_paths, cache_dir, manifest_path, workers=None, sample_rate=FEATURE_SAMPLE_RATE):
+    """Makes sure the features of every audio file are cached, decoding only new or changed files.
+
+    The manifest maps every file path, size and mtime to the SHA-256 keying
+    its features and to its decoded duration, which get_audio_duration then
+    uses instead of reading the file.
+
+    Args:
+        audio_file_paths (list): Paths of the audio files, missing files are skipped.
+        cache_dir (str): Root directory of the feature cache.
+        manifest_path (str): Path of the SQLite manifest indexing the cache.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        dict: (sha256, seconds) by path of every file whose features are cached.
+    """
+    file_stats = stat_audio_files(audio_file_paths)
+    conn = open_manifest(manifest_path)
+    try:
+        features = find_cached_features(conn, file_stats, cache_dir, sample_rate)
+        increment('cache_hits_total', len(features), stage='features')
+        paths_to_extract = [path for path in file_stats if path not in features]
+        if paths_to_extract:
+            batch_size = 4 * (workers or os.cpu_count() or 1)
+            jobs = iter((path, cache_dir, sample_rate) for path in paths_to_extract)
+            with timed('stage_seconds', stage='features'), ProcessPoolExecutor(max_workers=workers) as executor:
+                while True:
+                    batch = list(islice(jobs, batch_size))
+                    if not batch:
+                        break
+                    extracted = []
+                    for job, (feature, failures) in zip(batch, executor.map(extract_features_job, batch)):
+                        record_failures(failures)
+                        if feature:
+                            extracted.append((job[0], feature))
+                    # Indexed batch by batch, so an interrupted run keeps what it decoded
+                    set_audio_features(conn, ((path, *file_stats[path], sha256, seconds, sample_rate) for path, (sha256, seconds) in extracted))
+                    features.update(extracted)
+                    increment('items_total', len(extracted), stage='features')
+                    increment('bytes_total', sum(file_stats[path][0] for path, _ in extracted), stage='features')
+    finally:
+        conn.close()
+    return features
+
+def load_raw_array(path, dtype):
+    """Memory-maps a raw array file, without reading it.
+
+    Args:
+        path (str): Path of the raw array file.
+        dtype (str): Data type of the array.
+
+    Returns:
+        np.ndarray: Read-only array backed by the file.
+    """
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+def load_pcm(cache_dir, sha256, sample_rate=FEATURE_SAMPLE_RATE):
+    """Memory-maps the cached mono int16 PCM of an audio content.
+
+    Args:
+        cache_dir (str): Root directory of the feature cache.
+        sha256 (str): SHA-256 of the audio file.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        np.ndarray: int16 samples at sample_rate.
+    """
+    return load_raw_array(feature_paths(cache_dir, sha256, sample_rate)[0], '<i2')
+
+def load_frame_levels(cache_dir, sha256, sample_rate=FEATURE_SAMPLE_RATE):
+    """Memory-maps the cached RMS level in dBFS of every FRAME_SECONDS frame of an audio content.
+
+    Args:
+        cache_dir (str): Root directory of the feature cache.
+        sha256 (str): SHA-256 of the audio file.
+        sample_rate (int): Sample rate of the features.
+
+    Returns:
+        np.ndarray: float16 level of every frame.
+    """
+    return load_raw_array(feature_paths(cache_dir, sha256, sample_rate)[1], '<f2')
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Decode audio files once into the shared feature cache.')
+    parser.add_argument('audio_files', nargs='+', help='audio files to decode')
+    parser.add_argument('--cache-dir', default='./feature_cache', help='root directory of the feature cache')
+    parser.add_argument('--manifest', required=True, help='SQLite manifest indexing the feature cache')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--sample-rate', type=int, default=FEATURE_SAMPLE_RATE, help='sample rate of the cached PCM')
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    features = build_feature_cache(args.audio_files, args.cache_dir, args.manifest, args.workers, args.sample_rate)
+    print(f"Cached the features of {len(features)} audio files")
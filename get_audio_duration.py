@@ -1,48 +1,300 @@
+import argparse
 import os
+import struct
 import pandas as pd
-from mutagen.mp3 import MP3  # To get audio duration
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from mutagen.mp3 import MP3  # Fallback for files the header parser does not understand
+from audio_store import annotate_duplicates
+from metrics import configure_logging, increment, record_failure, record_failures, capture_failures, failure_reason, timed
+from metadata_io import TEXT_COLUMN, is_parquet_path, text_path, read_metadata_columns, read_metadata, write_metadata, copy_text_file
+from news_manifest import open_manifest, get_audio_durations, set_audio_durations, get_feature_durations
 
+# Bitrates in kbps by (MPEG-1, layer) and (MPEG-2/2.5, layer), indexed by the bitrate bits of the frame header
+BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
 
-metadata_csv_path = './news_audio_with_duration.csv'
-df = pd.read_csv(metadata_csv_path)
+# Sample rates in Hz by the version bits of the frame header (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1)
+SAMPLE_RATES = {0: [11025, 12000, 8000], 2: [22050, 24000, 16000], 3: [44100, 48000, 32000]}
 
-updated_data = []
+# Number of bytes read after the ID3v2 tag when looking for the first frame
+HEADER_SCAN_SIZE = 64 * 1024
 
-for index, row in df.iterrows():
-    audio_id = row['ID']
-    audio_url = row['Audio URL']
-    audio_text = row['Audio Text']
-    speaker_name = row['Speaker Name']
-    speaker_gender = row['Speaker Gender']
-    news_channel = row['News Channel']
-    publishing_year = row['Publishing Year']
-    
-    audio_duration = 'Duration not found'
+def parse_frame_header(header):
+    """Parses a 4 byte MPEG audio frame header.
 
-    audio_file_path = os.path.join('./data', news_channel, 'downloaded_audio', f"{audio_id}.mp3")
+    Args:
+        header (bytes): The 4 bytes starting at a candidate frame sync.
 
-    if os.path.exists(audio_file_path):
+    Returns:
+        dict: version bits, layer, bitrate (bps), sample rate, samples per frame, channel mode
+        and frame length of the frame, or None if the bytes are not a valid header.
+    """
+    b0, b1, b2, b3 = header
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    bitrate = BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version_bits][sample_rate_index]
+    padding = (b2 >> 1) & 0x01
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples_per_frame = 1152 if mpeg1 or layer == 2 else 576
+        frame_length = samples_per_frame // 8 * bitrate // sample_rate + padding
+    return {
+        'mpeg1': mpeg1,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples_per_frame': samples_per_frame,
+        'mono': b3 >> 6 == 3,
+        'frame_length': frame_length,
+    }
+
+def find_first_frame(data):
+    """Finds the first MPEG audio frame whose successor frame is also valid.
+
+    Args:
+        data (bytes): Bytes read from the start of the audio data.
+
+    Returns:
+        tuple: (offset in data, parsed frame header), or (None, None) if no frame is found.
+    """
+    offset = data.find(b'\xff')
+    while 0 <= offset <= len(data) - 4:
+        frame = parse_frame_header(data[offset:offset + 4])
+        if frame:
+            next_offset = offset + frame['frame_length']
+            # A frame sync can occur by chance, so also require a valid header right after the frame
+            if next_offset + 4 > len(data) or parse_frame_header(data[next_offset:next_offset + 4]):
+                return offset, frame
+        offset = data.find(b'\xff', offset + 1)
+    return None, None
+
+def probe_mp3_duration(audio_file_path):
+    """Reads the duration of an MP3 file from its headers only.
+
+    The duration comes from the frame count of the Xing/Info or VBRI header
+    when the first frame has one, and is otherwise derived from the bitrate of
+    the first frame and the size of the audio data, as for a constant bitrate
+    file. Only the ID3v2 header, the first frames and the last 128 bytes are read.
+
+    Args:
+        audio_file_path (str): Path of the MP3 file.
+
+    Returns:
+        float: Duration in seconds, or None if no MPEG audio frame is found.
+    """
+    file_size = os.path.getsize(audio_file_path)
+    with open(audio_file_path, 'rb') as f:
+        audio_start = 0
+        id3_header = f.read(10)
+        if len(id3_header) == 10 and id3_header[:3] == b'ID3':
+            # Tag size is a 28 bit synchsafe integer, plus a 10 byte footer when flagged
+            size_bytes = id3_header[6:10]
+            audio_start = 10 + (size_bytes[0] << 21 | size_bytes[1] << 14 | size_bytes[2] << 7 | size_bytes[3])
+            if id3_header[5] & 0x10:
+                audio_start += 10
+        f.seek(audio_start)
+        data = f.read(HEADER_SCAN_SIZE)
+
+        audio_end = file_size
+        if file_size - 128 >= audio_start:
+            f.seek(file_size - 128)
+            if f.read(3) == b'TAG':
+                audio_end -= 128
+
+    offset, frame = find_first_frame(data)
+    if frame is None:
+        return None
+
+    if frame['mpeg1']:
+        side_info_length = 17 if frame['mono'] else 32
+    else:
+        side_info_length = 9 if frame['mono'] else 17
+    xing_offset = offset + 4 + side_info_length
+    if data[xing_offset:xing_offset + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack('>I', data[xing_offset + 4:xing_offset + 8])
+        if flags & 0x01:
+            num_frames, = struct.unpack('>I', data[xing_offset + 8:xing_offset + 12])
+            return num_frames * frame['samples_per_frame'] / frame['sample_rate']
+
+    vbri_offset = offset + 4 + 32
+    if data[vbri_offset:vbri_offset + 4] == b'VBRI':
+        num_frames, = struct.unpack('>I', data[vbri_offset + 14:vbri_offset + 18])
+        return num_frames * frame['samples_per_frame'] / frame['sample_rate']
+
+    audio_bytes = audio_end - audio_start - offset
+    return audio_bytes * 8 / frame['bitrate']
+
+def read_audio_duration(audio_file_path):
+    """Reads the duration of an MP3 file, falling back to mutagen when the headers cannot be parsed.
+
+    Args:
+        audio_file_path (str): Path of the MP3 file.
+
+    Returns:
+        float: Duration in seconds, or None if the file cannot be read.
+    """
+    try:
+        duration = probe_mp3_duration(audio_file_path)
+        if duration is None:
+            duration = MP3(audio_file_path).info.length
+        return duration
+    except Exception as e:
+        record_failure('probe', failure_reason(e), path=audio_file_path, error=str(e))
+        return None
+
+def read_audio_duration_job(audio_file_path):
+    """Runs read_audio_duration on a process pool, returning its failures for the parent to record.
+
+    Args:
+        audio_file_path (str): Path of the MP3 file.
+
+    Returns:
+        tuple: (duration in seconds or None, failures captured by capture_failures)
+    """
+    with capture_failures() as failures:
+        duration = read_audio_duration(audio_file_path)
+    return duration, failures
+
+def format_duration(seconds):
+    """Formats a duration as HH:MM:SS, with hours going past 24 for very long files.
+
+    Args:
+        seconds (float): Duration in seconds, or None.
+
+    Returns:
+        str: The formatted duration, or 'Duration not found' if seconds is None.
+    """
+    if seconds is None or pd.isna(seconds):
+        return 'Duration not found'
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+
+def probe_audio_durations(audio_file_paths, workers=None, manifest_path=None):
+    """Reads the duration of many audio files on a process pool.
+
+    With a manifest, durations are cached by file path, size and mtime so that
+    only new or changed audio files are read again, and files already decoded
+    into the feature cache take their decoded duration without being read.
+
+    Args:
+        audio_file_paths (list): Paths of the audio files, missing files are skipped.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        manifest_path (str): Path of the SQLite manifest, None to read every audio file.
+
+    Returns:
+        dict: Duration in seconds, or None if it cannot be read, by path of every existing file.
+    """
+    file_stats = {}
+    for audio_file_path in audio_file_paths:
         try:
-            audio = MP3(audio_file_path)
-            audio_duration = str(datetime.utcfromtimestamp(audio.info.length).strftime('%H:%M:%S'))
-        except Exception as e:
-            print(f"Error reading duration for {audio_file_path}: {e}")
-
-    updated_data.append({
-        'ID': audio_id,
-        'Audio URL': audio_url,
-        'Audio Text': audio_text,
-        'Audio Duration': audio_duration,
-        'Speaker Name': speaker_name,
-        'Speaker Gender': speaker_gender,
-        'News Channel': news_channel,
-        'Publishing Year': publishing_year
-    })
-
-updated_df = pd.DataFrame(updated_data)
-
-output_updated_csv_path = './news_data_with_duration.csv'
-updated_df.to_csv(output_updated_csv_path, index=False, encoding='utf-8')
-
-print(f"Updated CSV file saved at {output_updated_csv_path}")
+            stat = os.stat(audio_file_path)
+        except FileNotFoundError:
+            continue
+        file_stats[audio_file_path] = (stat.st_size, stat.st_mtime_ns)
+
+    conn = open_manifest(manifest_path) if manifest_path else None
+    durations = {}
+    if conn is not None:
+        durations.update(get_audio_durations(conn, file_stats))
+        # Decoded durations are exact, so they win over header-based ones
+        durations.update(get_feature_durations(conn, file_stats))
+
+    paths_to_probe = [audio_file_path for audio_file_path in file_stats if audio_file_path not in durations]
+    increment('cache_hits_total', len(durations), stage='probe')
+    if paths_to_probe:
+        with timed('stage_seconds', stage='probe'), ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(paths_to_probe) // ((workers or os.cpu_count() or 1) * 16))
+            for audio_file_path, (duration, failures) in zip(paths_to_probe, executor.map(read_audio_duration_job, paths_to_probe, chunksize=chunksize)):
+                durations[audio_file_path] = duration
+                record_failures(failures)
+        increment('items_total', len(paths_to_probe), stage='probe')
+        increment('bytes_total', sum(file_stats[path][0] for path in paths_to_probe), stage='probe')
+
+    if conn is not None:
+        set_audio_durations(conn, ((path, *file_stats[path], durations[path]) for path in paths_to_probe))
+        conn.close()
+        print(f"Read the duration of {len(paths_to_probe)} new or changed audio files")
+    return durations
+
+def add_audio_durations(metadata_path='./news_audio_with_duration.csv', output_path='./news_data_with_duration.csv',
+                        data_root_dir='./data', manifest_path=None, workers=None, separate_text=False):
+    """Adds the duration of the downloaded audio of every article to the compiled metadata.
+
+    Metadata can be read from and written to CSV or Parquet files. When both
+    are Parquet and the input keeps its transcripts in a separate file, the
+    transcripts are copied over without being loaded.
+
+    Args:
+        metadata_path (str): Path of the compiled metadata CSV or .parquet file.
+        output_path (str): Path of the CSV or .parquet file to write.
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        manifest_path (str): Path of the SQLite manifest caching durations, None to read every audio file.
+            With a manifest, 'Audio Hash' and 'Duplicate Of' columns from the audio store are added.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        separate_text (bool): For Parquet output, write the transcripts to a separate file.
+
+    Returns:
+        pd.DataFrame: The metadata with 'Audio Duration' and 'Audio Duration Seconds' columns.
+    """
+    copy_text = separate_text and is_parquet_path(metadata_path) and is_parquet_path(output_path) \
+        and text_path(metadata_path).exists()
+    if copy_text:
+        columns = [column for column in read_metadata_columns(metadata_path) if column != TEXT_COLUMN]
+        df = read_metadata(metadata_path, columns=columns)
+    else:
+        df = read_metadata(metadata_path)
+
+    audio_file_paths = [
+        os.path.join(data_root_dir, news_channel, 'downloaded_audio', f"{audio_id}.mp3")
+        for audio_id, news_channel in zip(df['ID'], df['News Channel'])
+    ]
+    durations = probe_audio_durations(audio_file_paths, workers=workers, manifest_path=manifest_path)
+    duration_seconds = [durations.get(audio_file_path) for audio_file_path in audio_file_paths]
+
+    position = df.columns.get_loc(TEXT_COLUMN if TEXT_COLUMN in df.columns else 'Audio URL') + 1
+    df.insert(position, 'Audio Duration', [format_duration(seconds) for seconds in duration_seconds])
+    df.insert(position + 1, 'Audio Duration Seconds', pd.Series(duration_seconds, dtype='float64').round(3))
+    if manifest_path:
+        # Report which articles share the same stored audio, so their hours are only counted once
+        conn = open_manifest(manifest_path)
+        try:
+            annotate_duplicates(df, conn)
+        finally:
+            conn.close()
+    write_metadata(df, output_path, separate_text=separate_text)
+    if copy_text:
+        copy_text_file(metadata_path, output_path)
+    return df
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Add the duration of the downloaded audio to the compiled news metadata.')
+    parser.add_argument('--metadata', default='./news_audio_with_duration.csv', help='compiled news metadata CSV or .parquet file')
+    parser.add_argument('--output', default='./news_data_with_duration.csv', help='output CSV or .parquet file')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--manifest', default=None, help='SQLite manifest caching durations, enables incremental runs')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--separate-text', action='store_true', help='write the transcripts of Parquet output to a separate file')
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    add_audio_durations(args.metadata, args.output, args.data_dir, args.manifest, args.workers, args.separate_text)
+    print(f"Updated metadata file saved at {args.output}")
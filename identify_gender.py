@@ -1,36 +1,222 @@
+import argparse
 import librosa
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from feature_cache import FEATURE_SAMPLE_RATE, build_feature_cache, load_pcm
+from metrics import configure_logging, increment, record_failure, record_failures, capture_failures, failure_reason, timed
 
-def classify_gender(audio_file):
-    # Load the audio file (mp3 supported by librosa)
-    y, sr = librosa.load(audio_file, sr=None)  # sr=None to preserve the original sample rate
-    
+# General threshold between male and female average pitch in Hz
+FEMALE_PITCH_THRESHOLD = 165
+
+def estimate_pitch(y, sr):
+    """Estimates the average pitch (F0) of a signal.
+
+    Args:
+        y (np.ndarray): Mono audio signal.
+        sr (int): Sample rate of the signal.
+
+    Returns:
+        float: Average pitch in Hz over the voiced frames, or None if no frame is voiced.
+    """
     # Extract the pitch (F0) from the audio
     pitches, magnitudes = librosa.core.piptrack(y=y, sr=sr)
-    
-    # Extract the fundamental frequencies (F0)
-    pitch_values = []
-    for t in range(pitches.shape[1]):
-        pitch = pitches[:, t]
-        mag = magnitudes[:, t]
-        index = mag.argmax()
-        pitch_value = pitch[index]
-        if pitch_value > 0:
-            pitch_values.append(pitch_value)
-    
-    # Calculate the average pitch
-    if len(pitch_values) == 0:
+
+    # Pick the pitch of the strongest bin in every frame at once
+    strongest_bins = magnitudes.argmax(axis=0)[np.newaxis, :]
+    pitch_values = np.take_along_axis(pitches, strongest_bins, axis=0)[0]
+    pitch_values = pitch_values[pitch_values > 0]
+
+    if pitch_values.size == 0:
+        return None
+    return float(pitch_values.mean())
+
+def load_audio(audio_file, sr=None, max_duration=None, num_segments=1):
+    """Decodes an audio file to mono, optionally resampled and limited to a bounded window.
+
+    Args:
+        audio_file (str): Path of the audio file.
+        sr (int): Sample rate to decode at, None to preserve the original sample rate.
+        max_duration (float): Number of seconds to decode, None to decode the whole file.
+        num_segments (int): Number of evenly spaced segments sharing max_duration, 1 to decode from the start.
+
+    Returns:
+        tuple: (signal, sample rate)
+    """
+    if max_duration is None or num_segments <= 1:
+        return librosa.load(audio_file, sr=sr, duration=max_duration)
+
+    offsets = segment_offsets(librosa.get_duration(path=audio_file), max_duration, num_segments)
+    if offsets is None:
+        return librosa.load(audio_file, sr=sr)
+
+    segments = []
+    for offset in offsets:
+        y, sr = librosa.load(audio_file, sr=sr, offset=float(offset), duration=max_duration / num_segments)
+        segments.append(y)
+    return np.concatenate(segments), sr
+
+def segment_offsets(total_duration, max_duration, num_segments):
+    """Returns the start of evenly spaced segments sharing max_duration.
+
+    Args:
+        total_duration (float): Duration of the audio in seconds.
+        max_duration (float): Number of seconds to analyze.
+        num_segments (int): Number of segments.
+
+    Returns:
+        np.ndarray: Start of every segment in seconds, or None if the whole audio fits in max_duration.
+    """
+    if total_duration <= max_duration:
+        return None
+    return np.linspace(0, total_duration - max_duration / num_segments, num_segments)
+
+def load_cached_audio(pcm, sr, max_duration=None, num_segments=1):
+    """Selects the same window as load_audio from PCM in the feature cache, without decoding.
+
+    Only the selected samples are read from the memory-mapped PCM.
+
+    Args:
+        pcm (np.ndarray): Cached int16 samples, from feature_cache.load_pcm.
+        sr (int): Sample rate of the PCM.
+        max_duration (float): Number of seconds to analyze, None to analyze everything.
+        num_segments (int): Number of evenly spaced segments sharing max_duration, 1 to analyze from the start.
+
+    Returns:
+        tuple: (float32 signal, sample rate)
+    """
+    if max_duration is None:
+        windows = [(0, len(pcm))]
+    elif num_segments <= 1:
+        windows = [(0, int(max_duration * sr))]
+    else:
+        offsets = segment_offsets(len(pcm) / sr, max_duration, num_segments)
+        segment_samples = int(round(max_duration / num_segments * sr))
+        windows = [(0, len(pcm))] if offsets is None else [(int(round(offset * sr)), int(round(offset * sr)) + segment_samples) for offset in offsets]
+    y = np.concatenate([np.asarray(pcm[start:end], dtype=np.float32) for start, end in windows]) / 32768
+    return y, sr
+
+def gender_from_pitch(avg_pitch):
+    """Classifies a gender from an average pitch.
+
+    Args:
+        avg_pitch (float): Average pitch in Hz, or None.
+
+    Returns:
+        str: 'Female', 'Male' or 'Unable to classify'
+    """
+    if avg_pitch is None:
         return "Unable to classify"
-    
-    avg_pitch = np.mean(pitch_values)
-    
-    # Set a threshold for male and female (general threshold around 165 Hz)
-    if avg_pitch > 165:  # Female
-        return "Female"
-    else:  # Male
-        return "Male"
-
-# Example usage
-audio_file = "./T082024DK-2.mp3"
-gender = classify_gender(audio_file)
-print(f'The speaker is classified as: {gender}')
\ No newline at end of file
+    return "Female" if avg_pitch > FEMALE_PITCH_THRESHOLD else "Male"
+
+def analyze_gender(audio_file, sr=None, max_duration=None, num_segments=1):
+    """Classifies the gender of the speaker of an audio file from its average pitch.
+
+    Args:
+        audio_file (str): Path of the audio file.
+        sr (int): Sample rate to decode at, None to preserve the original sample rate.
+        max_duration (float): Number of seconds to analyze, None to analyze the whole file.
+        num_segments (int): Number of evenly spaced segments sharing max_duration.
+
+    Returns:
+        tuple: ('Female', 'Male' or 'Unable to classify', average pitch in Hz or None)
+    """
+    y, sr = load_audio(audio_file, sr=sr, max_duration=max_duration, num_segments=num_segments)
+    avg_pitch = estimate_pitch(y, sr)
+    return gender_from_pitch(avg_pitch), avg_pitch
+
+def classify_gender(audio_file, sr=None, max_duration=None, num_segments=1):
+    """Classifies the gender of the speaker of an audio file.
+
+    Args:
+        audio_file (str): Path of the audio file (mp3 supported by librosa).
+        sr (int): Sample rate to decode at, None to preserve the original sample rate.
+        max_duration (float): Number of seconds to analyze, None to analyze the whole file.
+        num_segments (int): Number of evenly spaced segments sharing max_duration.
+
+    Returns:
+        str: 'Female', 'Male' or 'Unable to classify'
+    """
+    return analyze_gender(audio_file, sr=sr, max_duration=max_duration, num_segments=num_segments)[0]
+
+def analyze_gender_job(args):
+    """Runs analyze_gender for classify_genders, reporting failures as unclassified along with the captured failures."""
+    audio_file, sr, max_duration, num_segments = args
+    with capture_failures() as failures:
+        try:
+            result = analyze_gender(audio_file, sr=sr, max_duration=max_duration, num_segments=num_segments)
+        except Exception as e:
+            record_failure('classify', failure_reason(e), path=audio_file, error=str(e))
+            result = "Unable to classify", None
+    return result, failures
+
+def analyze_cached_gender_job(args):
+    """Runs the analysis of analyze_gender on cached PCM for classify_genders, like analyze_gender_job."""
+    audio_file, cache_dir, sha256, sr, max_duration, num_segments = args
+    with capture_failures() as failures:
+        try:
+            y, sr = load_cached_audio(load_pcm(cache_dir, sha256, sr), sr, max_duration=max_duration, num_segments=num_segments)
+            avg_pitch = estimate_pitch(y, sr)
+            result = gender_from_pitch(avg_pitch), avg_pitch
+        except Exception as e:
+            record_failure('classify', failure_reason(e), path=audio_file, error=str(e))
+            result = "Unable to classify", None
+    return result, failures
+
+def classify_genders(audio_files, workers=None, sr=16000, max_duration=60, num_segments=3, feature_cache_dir=None,
+                     manifest_path=None):
+    """Classifies the speaker gender of many audio files on a process pool.
+
+    By default every file is decoded at 16 kHz and only three evenly spaced
+    segments totalling 60 seconds are analyzed. With a feature cache, files
+    are decoded into the cache only if they are not in it yet, and the
+    segments are read from the cached PCM.
+
+    Args:
+        audio_files (list): Paths of the audio files.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        sr (int): Sample rate to decode at, None to preserve the original sample rate.
+        max_duration (float): Number of seconds to analyze per file, None to analyze whole files.
+        num_segments (int): Number of evenly spaced segments sharing max_duration.
+        feature_cache_dir (str): Root directory of the feature cache, None to decode every file.
+        manifest_path (str): Path of the SQLite manifest indexing the feature cache, required with feature_cache_dir.
+
+    Returns:
+        list: {'file', 'gender', 'mean_pitch'} dict for every audio file, in order.
+    """
+    features = {}
+    cache_rate = sr or FEATURE_SAMPLE_RATE
+    if feature_cache_dir is not None:
+        features = build_feature_cache(audio_files, feature_cache_dir, manifest_path, workers=workers, sample_rate=cache_rate)
+
+    def job(audio_file):
+        if audio_file in features:
+            sha256 = features[audio_file][0]
+            return analyze_cached_gender_job, (audio_file, feature_cache_dir, sha256, cache_rate, max_duration, num_segments)
+        return analyze_gender_job, (audio_file, sr, max_duration, num_segments)
+
+    with timed('stage_seconds', stage='classify'), ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(*job(audio_file)) for audio_file in audio_files]
+        results = []
+        for audio_file, future in zip(audio_files, futures):
+            (gender, mean_pitch), failures = future.result()
+            record_failures(failures)
+            results.append({'file': audio_file, 'gender': gender, 'mean_pitch': mean_pitch})
+    increment('items_total', len(results), stage='classify')
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Classify the speaker gender of audio files from their average pitch.')
+    parser.add_argument('audio_files', nargs='+', help='audio files to classify')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--sr', type=int, default=16000, help='sample rate to decode at')
+    parser.add_argument('--max-duration', type=float, default=60, help='number of seconds to analyze per file')
+    parser.add_argument('--num-segments', type=int, default=3, help='number of evenly spaced segments to analyze')
+    parser.add_argument('--feature-cache', default=None, help='root directory of the feature cache, decodes every file when not set')
+    parser.add_argument('--manifest', default=None, help='SQLite manifest indexing the feature cache')
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    for result in classify_genders(args.audio_files, args.workers, args.sr, args.max_duration, args.num_segments,
+                                   args.feature_cache, args.manifest):
+        print(f"{result['file']}: {result['gender']} (mean pitch: {result['mean_pitch']})")
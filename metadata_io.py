@@ -0,0 +1,241 @@
+import csv
+import math
+import shutil
+import pandas as pd
+from pathlib import Path
+
+TEXT_COLUMN = 'Audio Text'
+KEY_COLUMNS = ['ID', 'News Channel']
+
+# Columns that are not strings, every other metadata column is stored as a string
+NUMERIC_COLUMNS = {'Audio Duration Seconds'}
+
+def is_parquet_path(path):
+    """Checks if a metadata path refers to a Parquet file.
+
+    Args:
+        path (str): Path of the metadata file.
+
+    Returns:
+        bool: True for .parquet files, False for CSV files.
+    """
+    return str(path).endswith('.parquet')
+
+def text_path(path):
+    """Returns the path of the separate transcript file of a Parquet metadata file.
+
+    Args:
+        path (str): Path of the metadata Parquet file, e.g. news_data.parquet.
+
+    Returns:
+        Path: Path of the transcript Parquet file, e.g. news_data.text.parquet.
+    """
+    path = Path(path)
+    return path.with_name(f'{path.stem}.text.parquet')
+
+def metadata_schema(columns):
+    """Builds the typed Arrow schema of metadata columns.
+
+    Args:
+        columns (list): Metadata column names.
+
+    Returns:
+        pyarrow.Schema: Schema with float64 numeric columns and string columns otherwise.
+    """
+    import pyarrow as pa
+    return pa.schema([(column, pa.float64() if column in NUMERIC_COLUMNS else pa.string()) for column in columns])
+
+def coerce_value(column, value):
+    """Converts a metadata value to the type of its column, with None for missing values.
+
+    Args:
+        column (str): Metadata column name.
+        value: Value read from an article, a CSV file or a DataFrame.
+
+    Returns:
+        Value as a float for numeric columns and as a string otherwise, or None.
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if column in NUMERIC_COLUMNS:
+        return float(value)
+    return value if isinstance(value, str) else str(value)
+
+def write_metadata_rows(rows, output_path, columns, separate_text=False, row_group_size=100_000):
+    """Writes metadata rows to a CSV or Parquet file as they arrive.
+
+    Parquet row groups only hold rows of a single News Channel, so readers
+    filtering on a channel skip the others, and transcripts can be written to
+    a separate file next to the metadata (see text_path).
+
+    Args:
+        rows (iterable): Metadata rows keyed by column name.
+        output_path (str): Path of the CSV or .parquet file to write.
+        columns (list): Metadata column names, in order.
+        separate_text (bool): Write the Audio Text column to a separate Parquet file.
+        row_group_size (int): Maximum number of rows per Parquet row group.
+
+    Returns:
+        int: Number of rows written.
+    """
+    num_rows = 0
+    if not is_parquet_path(output_path):
+        with open(output_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns, lineterminator='\n', extrasaction='ignore')
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                num_rows += 1
+        return num_rows
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if separate_text and TEXT_COLUMN in columns:
+        table_columns = [[column for column in columns if column != TEXT_COLUMN], KEY_COLUMNS + [TEXT_COLUMN]]
+        table_paths = [output_path, text_path(output_path)]
+    else:
+        table_columns = [list(columns)]
+        table_paths = [output_path]
+    writers = [pq.ParquetWriter(path, metadata_schema(cols), compression='zstd') for path, cols in zip(table_paths, table_columns)]
+
+    channel_batches = {}
+
+    def flush(channel):
+        batch = channel_batches.pop(channel)
+        for writer, cols in zip(writers, table_columns):
+            data = {column: [coerce_value(column, row.get(column)) for row in batch] for column in cols}
+            writer.write_table(pa.Table.from_pydict(data, schema=writer.schema), row_group_size=row_group_size)
+
+    try:
+        for row in rows:
+            channel = row['News Channel']
+            channel_batches.setdefault(channel, []).append(row)
+            if len(channel_batches[channel]) >= row_group_size:
+                flush(channel)
+            num_rows += 1
+        for channel in list(channel_batches):
+            flush(channel)
+    finally:
+        for writer in writers:
+            writer.close()
+    return num_rows
+
+def write_metadata(df, output_path, separate_text=False):
+    """Writes a metadata DataFrame to a CSV or Parquet file.
+
+    Args:
+        df (pd.DataFrame): Metadata to write.
+        output_path (str): Path of the CSV or .parquet file to write.
+        separate_text (bool): Write the Audio Text column to a separate Parquet file.
+    """
+    if not is_parquet_path(output_path):
+        df.to_csv(output_path, index=False, encoding='utf-8')
+        return
+    columns = list(df.columns)
+    rows = (dict(zip(columns, values)) for values in df.itertuples(index=False, name=None))
+    write_metadata_rows(rows, output_path, columns, separate_text=separate_text)
+
+def read_metadata_columns(path):
+    """Reads the column names of a metadata file without loading its rows.
+
+    Args:
+        path (str): Path of the CSV or .parquet file.
+
+    Returns:
+        list: Column names stored in the file, excluding a separate transcript file.
+    """
+    if not is_parquet_path(path):
+        return list(pd.read_csv(path, nrows=0).columns)
+
+    import pyarrow.parquet as pq
+    return pq.read_schema(path).names
+
+def apply_filters(df, filters):
+    """Applies pyarrow-style filters to a DataFrame.
+
+    Args:
+        df (pd.DataFrame): Metadata to filter.
+        filters (list): (column, operator, value) tuples that must all hold, operators are
+            '=', '==', '!=', '<', '<=', '>', '>=', 'in' and 'not in'.
+
+    Returns:
+        pd.DataFrame: The rows matching every filter.
+    """
+    operators = {
+        '=': lambda series, value: series == value,
+        '==': lambda series, value: series == value,
+        '!=': lambda series, value: series != value,
+        '<': lambda series, value: series < value,
+        '<=': lambda series, value: series <= value,
+        '>': lambda series, value: series > value,
+        '>=': lambda series, value: series >= value,
+        'in': lambda series, value: series.isin(value),
+        'not in': lambda series, value: ~series.isin(value),
+    }
+    mask = pd.Series(True, index=df.index)
+    for column, operator, value in filters:
+        mask &= operators[operator](df[column], value)
+    return df[mask]
+
+def read_metadata(path, columns=None, filters=None):
+    """Reads compiled metadata from a CSV or Parquet file, loading only the needed columns.
+
+    For Parquet files, only the requested columns are read, row groups of
+    other channels are skipped when filtering on News Channel, and transcripts
+    stored in a separate file are only read when Audio Text is requested.
+
+    Args:
+        path (str): Path of the CSV or .parquet file.
+        columns (list): Columns to read, None for all columns.
+        filters (list): (column, operator, value) tuples that must all hold,
+            e.g. [('News Channel', '=', 'VOA'), ('Audio Duration Seconds', '>', 10)].
+
+    Returns:
+        pd.DataFrame: The requested columns of the matching rows.
+    """
+    filters = list(filters or [])
+    if not is_parquet_path(path):
+        usecols = None
+        if columns is not None:
+            needed = set(columns) | {column for column, _, _ in filters}
+            usecols = lambda column: column in needed
+        dtype = {column: str for column in read_metadata_columns(path) if column not in NUMERIC_COLUMNS}
+        df = pd.read_csv(path, usecols=usecols, dtype=dtype)
+        df = apply_filters(df, filters).reset_index(drop=True)
+        return df if columns is None else df[list(columns)]
+
+    import pyarrow.parquet as pq
+
+    available_columns = read_metadata_columns(path)
+    separate_text_path = text_path(path)
+    wants_text = (columns is None or TEXT_COLUMN in columns) and TEXT_COLUMN not in available_columns \
+        and separate_text_path.exists()
+    read_columns = available_columns if columns is None else [column for column in columns if column != TEXT_COLUMN or not wants_text]
+    if wants_text:
+        read_columns = list(dict.fromkeys(read_columns + KEY_COLUMNS))
+
+    df = pq.read_table(path, columns=read_columns, filters=filters or None).to_pandas()
+    if wants_text:
+        text_filters = [condition for condition in filters if condition[0] in KEY_COLUMNS]
+        text_df = pq.read_table(separate_text_path, filters=text_filters or None).to_pandas()
+        df = df.merge(text_df, on=KEY_COLUMNS, how='left')
+        if columns is None:
+            position = available_columns.index('Audio URL') + 1 if 'Audio URL' in available_columns else len(available_columns)
+            df = df[available_columns[:position] + [TEXT_COLUMN] + available_columns[position:]]
+    return df if columns is None else df[list(columns)]
+
+def copy_text_file(input_path, output_path):
+    """Copies the separate transcript file of a Parquet metadata file, if there is one.
+
+    Args:
+        input_path (str): Path of the metadata file the transcripts belong to.
+        output_path (str): Path of the metadata file the transcripts are copied for.
+
+    Returns:
+        bool: True if a transcript file was copied.
+    """
+    if not (is_parquet_path(input_path) and is_parquet_path(output_path) and text_path(input_path).exists()):
+        return False
+    shutil.copyfile(text_path(input_path), text_path(output_path))
+    return True
@@ -0,0 +1,368 @@
+import contextlib
+import cProfile
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger('news_audio')
+
+# Prefix of every metric name in the Prometheus text format
+METRIC_PREFIX = 'news_audio_'
+
+# Environment variable naming the directory of the per-stage cProfile dumps, inherited by worker processes
+PROFILE_DIR_VARIABLE = 'NEWS_AUDIO_PROFILE_DIR'
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_gauge_callbacks = {}
+_timers = {}
+_profilers = {}
+_captured = threading.local()
+
+def metric_key(name, labels):
+    """Returns the key of a metric series in the registry.
+
+    Args:
+        name (str): Metric name, e.g. 'items_total'.
+        labels (dict): Label values, e.g. {'stage': 'download'}.
+
+    Returns:
+        tuple: (name, sorted label items).
+    """
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def format_series(key):
+    """Formats a metric series in the Prometheus text format, e.g. 'news_audio_items_total{stage="download"}'.
+
+    Args:
+        key (tuple): Key of the series, as returned by metric_key.
+
+    Returns:
+        str: The formatted series name.
+    """
+    name, labels = key
+    if not labels:
+        return METRIC_PREFIX + name
+    label_text = ','.join(f'{label}="{value}"'.replace('\n', ' ') for label, value in labels)
+    return f'{METRIC_PREFIX}{name}{{{label_text}}}'
+
+def increment(name, value=1, **labels):
+    """Adds a value to a counter, e.g. increment('bytes_total', len(chunk), stage='download').
+
+    Args:
+        name (str): Counter name.
+        value (float): Value to add.
+        **labels: Label values of the series.
+    """
+    key = metric_key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def set_gauge(name, value, **labels):
+    """Sets the current value of a gauge.
+
+    Args:
+        name (str): Gauge name.
+        value (float): Current value.
+        **labels: Label values of the series.
+    """
+    with _lock:
+        _gauges[metric_key(name, labels)] = value
+
+def register_gauge(name, callback, **labels):
+    """Registers a gauge whose value is read from a callback whenever the metrics are collected.
+
+    Args:
+        name (str): Gauge name, e.g. 'queue_depth'.
+        callback (callable): Function without arguments returning the current value, e.g. queue.qsize.
+        **labels: Label values of the series.
+    """
+    with _lock:
+        _gauge_callbacks[metric_key(name, labels)] = callback
+
+def unregister_gauge(name, **labels):
+    """Stops reading a gauge registered with register_gauge, keeping its last value.
+
+    Args:
+        name (str): Gauge name.
+        **labels: Label values of the series.
+    """
+    key = metric_key(name, labels)
+    with _lock:
+        callback = _gauge_callbacks.pop(key, None)
+        if callback is not None:
+            _gauges[key] = callback()
+
+def observe(name, seconds, **labels):
+    """Records one timing of a timer.
+
+    Args:
+        name (str): Timer name, e.g. 'stage_seconds'.
+        seconds (float): Measured time in seconds.
+        **labels: Label values of the series.
+    """
+    key = metric_key(name, labels)
+    with _lock:
+        count, total = _timers.get(key, (0, 0.0))
+        _timers[key] = (count + 1, total + seconds)
+
+@contextlib.contextmanager
+def timed(name, **labels):
+    """Times the enclosed block into a timer.
+
+    Args:
+        name (str): Timer name.
+        **labels: Label values of the series.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def failure_reason(error):
+    """Returns a short, low-cardinality reason for a failure, used as a metric label.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        str: 'http_<status>' for HTTP errors, the exception class name otherwise.
+    """
+    response = getattr(error, 'response', None)
+    if response is not None and getattr(response, 'status_code', None):
+        return f'http_{response.status_code}'
+    return type(error).__name__
+
+def log_event(event, level=logging.INFO, **fields):
+    """Logs a structured event.
+
+    Args:
+        event (str): Event name, e.g. 'download_failed'.
+        level (int): Logging level.
+        **fields: Fields of the event.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
+
+def record_failure(stage, reason, **fields):
+    """Counts a failed item of a stage and logs it as a warning.
+
+    Args:
+        stage (str): Stage name, e.g. 'download'.
+        reason (str): Short reason of the failure, e.g. 'http_404' or 'timeout'.
+        **fields: Fields of the event, e.g. the URL of the item.
+    """
+    captured = getattr(_captured, 'failures', None)
+    if captured is not None:
+        captured.append((stage, reason, fields))
+        return
+    increment('failures_total', stage=stage, reason=reason)
+    log_event(f'{stage}_failed', logging.WARNING, reason=reason, **fields)
+
+@contextlib.contextmanager
+def capture_failures():
+    """Collects the failures recorded by this thread instead of counting them.
+
+    Metrics counted in a worker process stay in that process, so jobs run on
+    a process pool capture their failures and return them to the parent,
+    which counts them with record_failures.
+
+    Yields:
+        list: (stage, reason, fields) tuples of the failures recorded in the block.
+    """
+    previous = getattr(_captured, 'failures', None)
+    _captured.failures = []
+    try:
+        yield _captured.failures
+    finally:
+        _captured.failures = previous
+
+def record_failures(failures):
+    """Counts and logs the failures captured by capture_failures, e.g. in a worker process.
+
+    Args:
+        failures (list): (stage, reason, fields) tuples.
+    """
+    for stage, reason, fields in failures:
+        record_failure(stage, reason, **fields)
+
+def collect_metrics():
+    """Collects the current value of every metric.
+
+    Returns:
+        dict: 'counters', 'gauges' and 'timers' by series key; timers are (count, total seconds).
+    """
+    with _lock:
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        metrics = {'counters': dict(_counters), 'gauges': gauges, 'timers': dict(_timers)}
+    for key, callback in callbacks.items():
+        try:
+            gauges[key] = callback()
+        except Exception:
+            pass
+    return metrics
+
+def render_prometheus(metrics=None):
+    """Renders the metrics in the Prometheus text exposition format.
+
+    Args:
+        metrics (dict): Metrics returned by collect_metrics, collected now if not given.
+
+    Returns:
+        str: The metrics, one series per line.
+    """
+    metrics = metrics or collect_metrics()
+    lines = []
+    for metric_type, series in (('counter', metrics['counters']), ('gauge', metrics['gauges'])):
+        for name in sorted({key[0] for key in series}):
+            lines.append(f'# TYPE {METRIC_PREFIX}{name} {metric_type}')
+            lines.extend(f'{format_series(key)} {value}' for key, value in sorted(series.items()) if key[0] == name)
+    for name in sorted({key[0] for key in metrics['timers']}):
+        lines.append(f'# TYPE {METRIC_PREFIX}{name} summary')
+        for (timer_name, labels), (count, total) in sorted(metrics['timers'].items()):
+            if timer_name == name:
+                lines.append(f'{format_series((f"{name}_count", labels))} {count}')
+                lines.append(f'{format_series((f"{name}_sum", labels))} {total:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def write_metrics_file(metrics_path, metrics=None):
+    """Atomically writes the metrics in the Prometheus text format, e.g. for the node exporter textfile collector.
+
+    Args:
+        metrics_path (str): Path of the metrics file.
+        metrics (dict): Metrics returned by collect_metrics, collected now if not given.
+    """
+    temp_path = f'{metrics_path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as metrics_file:
+        metrics_file.write(render_prometheus(metrics))
+    os.replace(temp_path, metrics_path)
+
+def reset_metrics():
+    """Clears every metric of this process."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _gauge_callbacks.clear()
+        _timers.clear()
+
+def stage_rates(previous, current, seconds):
+    """Computes the items/sec and bytes/sec of every stage between two collections.
+
+    Args:
+        previous (dict): Counters of the earlier collection.
+        current (dict): Counters of the later collection.
+        seconds (float): Time elapsed between the collections.
+
+    Returns:
+        dict: {'items_per_sec', 'bytes_per_sec'} by stage.
+    """
+    rates = {}
+    for (name, labels), value in current.items():
+        if name not in ('items_total', 'bytes_total') or seconds <= 0:
+            continue
+        stage = dict(labels).get('stage', '')
+        rate_name = 'items_per_sec' if name == 'items_total' else 'bytes_per_sec'
+        stage_rate = rates.setdefault(stage, {'items_per_sec': 0.0, 'bytes_per_sec': 0.0})
+        stage_rate[rate_name] += (value - previous.get((name, labels), 0)) / seconds
+    return {stage: {name: round(rate, 1) for name, rate in stage_rate.items()} for stage, stage_rate in rates.items()}
+
+@contextlib.contextmanager
+def report_metrics(metrics_path=None, interval=10):
+    """Periodically logs the throughput of every stage, and writes the metrics file, while the block runs.
+
+    Args:
+        metrics_path (str): Path of the Prometheus text file rewritten every interval, None to only log.
+        interval (float): Seconds between two reports.
+    """
+    stop = threading.Event()
+
+    def report(previous, previous_time):
+        metrics = collect_metrics()
+        now = time.monotonic()
+        log_event('progress', rates=stage_rates(previous, metrics['counters'], now - previous_time),
+                  gauges={format_series(key): value for key, value in metrics['gauges'].items()})
+        if metrics_path:
+            write_metrics_file(metrics_path, metrics)
+        return metrics['counters'], now
+
+    def run():
+        state = ({}, time.monotonic())
+        while not stop.wait(interval):
+            state = report(*state)
+
+    start_counters, start_time = collect_metrics()['counters'], time.monotonic()
+    thread = threading.Thread(target=run, name='metrics-reporter', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        metrics = collect_metrics()
+        log_event('summary', rates=stage_rates(start_counters, metrics['counters'], time.monotonic() - start_time),
+                  counters={format_series(key): value for key, value in metrics['counters'].items()})
+        if metrics_path:
+            write_metrics_file(metrics_path, metrics)
+
+@contextlib.contextmanager
+def profile_stage(stage, profile_dir=None):
+    """Profiles the enclosed block with cProfile when a profile directory is set.
+
+    Profiles accumulate per stage, process and thread, and are dumped to
+    `<profile_dir>/<stage>-<pid>-<thread id>.prof` after every block; the
+    dumps of a stage are combined with pstats.Stats(*paths).
+
+    Args:
+        stage (str): Stage name.
+        profile_dir (str): Directory of the dumps, defaults to the NEWS_AUDIO_PROFILE_DIR environment variable.
+            Profiling is disabled when neither is set.
+    """
+    profile_dir = profile_dir or os.environ.get(PROFILE_DIR_VARIABLE)
+    if not profile_dir:
+        yield
+        return
+
+    profile_key = (stage, os.getpid(), threading.get_native_id())
+    profiler = _profilers.setdefault(profile_key, cProfile.Profile())
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, '{}-{}-{}.prof'.format(*profile_key)))
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': round(record.created, 3),
+            'level': record.levelname,
+            'event': record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def configure_logging(level=logging.INFO, json_logs=True, stream=None):
+    """Sends the pipeline events to a stream, as JSON lines by default.
+
+    Args:
+        level (int or str): Minimum logging level, e.g. 'DEBUG' to see every item.
+        json_logs (bool): Format the events as JSON lines rather than plain text.
+        stream (file): Stream the events are written to, defaults to stderr.
+    """
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(JsonFormatter() if json_logs else logging.Formatter('%(asctime)s %(levelname)s %(message)s %(fields)s',
+                                                                             defaults={'fields': {}}))
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
@@ -0,0 +1,328 @@
+import json
+import os
+import sqlite3
+
+def open_manifest(manifest_path, check_same_thread=True):
+    """Opens the SQLite manifest of processed articles, creating its tables if needed.
+
+    Args:
+        manifest_path (str): Path of the SQLite database file.
+        check_same_thread (bool): False to share the connection between threads, serialized by the caller.
+
+    Returns:
+        sqlite3.Connection: Connection to the manifest.
+    """
+    conn = sqlite3.connect(manifest_path, check_same_thread=check_same_thread)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS articles (
+            channel TEXT NOT NULL,
+            id TEXT NOT NULL,
+            signature TEXT NOT NULL,
+            row TEXT NOT NULL,
+            PRIMARY KEY (channel, id)
+        );
+        CREATE TABLE IF NOT EXISTS audio_durations (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            seconds REAL
+        );
+        CREATE TABLE IF NOT EXISTS audio_features (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            sample_rate INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS speaker_genders (
+            speaker TEXT PRIMARY KEY,
+            gender TEXT NOT NULL,
+            mean_pitch REAL,
+            num_clips INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS audio_urls (
+            url TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS audio_articles (
+            channel TEXT NOT NULL,
+            id TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            PRIMARY KEY (channel, id)
+        );
+        CREATE INDEX IF NOT EXISTS audio_articles_sha256 ON audio_articles (sha256);
+        CREATE TABLE IF NOT EXISTS ledger (
+            channel TEXT NOT NULL,
+            id TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            detail TEXT,
+            PRIMARY KEY (channel, id, stage)
+        );
+        CREATE TABLE IF NOT EXISTS ledger_shards (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL
+        );
+    ''')
+    return conn
+
+def article_signature(article_dir):
+    """Builds a signature of an article directory from the names, sizes and mtimes of its files.
+
+    Args:
+        article_dir (str): Path of the article directory.
+
+    Returns:
+        str: Signature that changes whenever a file of the article is added, removed or modified.
+    """
+    with os.scandir(article_dir) as entries:
+        file_stats = sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in entries if entry.is_file()
+        )
+    return ';'.join(f'{name}:{size}:{mtime_ns}' for name, size, mtime_ns in file_stats)
+
+def get_article_signatures(conn, channels):
+    """Returns the stored signature of every article of the given channels.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        channels (list): News channels to look up.
+
+    Returns:
+        dict: Signature by (channel, audio ID).
+    """
+    placeholders = ','.join('?' * len(channels))
+    cursor = conn.execute(f'SELECT channel, id, signature FROM articles WHERE channel IN ({placeholders})', list(channels))
+    return {(channel, audio_id): signature for channel, audio_id, signature in cursor}
+
+def upsert_article_rows(conn, rows_with_signatures):
+    """Stores the metadata row and signature of new or changed articles.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        rows_with_signatures (iterable): (row, signature) pairs, rows keyed by the metadata columns.
+    """
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO articles (channel, id, signature, row) VALUES (?, ?, ?, ?)',
+            ((row['News Channel'], row['ID'], signature, json.dumps(row, ensure_ascii=False))
+             for row, signature in rows_with_signatures)
+        )
+
+def delete_articles(conn, article_keys):
+    """Removes articles that no longer exist on disk.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        article_keys (iterable): (channel, audio ID) pairs to remove.
+    """
+    with conn:
+        conn.executemany('DELETE FROM articles WHERE channel = ? AND id = ?', article_keys)
+
+def iter_article_rows(conn, channels):
+    """Yields the stored metadata rows of the given channels sorted by ID.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        channels (list): News channels to read.
+
+    Yields:
+        dict: Metadata row of every article.
+    """
+    placeholders = ','.join('?' * len(channels))
+    cursor = conn.execute(f'SELECT row FROM articles WHERE channel IN ({placeholders}) ORDER BY id, channel', list(channels))
+    for (row,) in cursor:
+        yield json.loads(row)
+
+def get_audio_durations(conn, file_stats):
+    """Looks up the cached duration of audio files.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        file_stats (dict): Current (size, mtime_ns) by audio file path.
+
+    Returns:
+        dict: Cached duration in seconds (None if unreadable) by path, for the files that are
+        cached and have not changed since.
+    """
+    durations = {}
+    for audio_file_path, size, mtime_ns, seconds in conn.execute('SELECT path, size, mtime_ns, seconds FROM audio_durations'):
+        if file_stats.get(audio_file_path) == (size, mtime_ns):
+            durations[audio_file_path] = seconds
+    return durations
+
+def set_audio_durations(conn, durations):
+    """Caches the duration of audio files.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        durations (iterable): (audio file path, size, mtime_ns, seconds) tuples.
+    """
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO audio_durations (path, size, mtime_ns, seconds) VALUES (?, ?, ?, ?)', durations)
+
+def get_audio_features(conn, file_stats, sample_rate):
+    """Looks up the feature cache entries of audio files.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        file_stats (dict): Current (size, mtime_ns) by audio file path.
+        sample_rate (int): Sample rate of the cached features.
+
+    Returns:
+        dict: (sha256, seconds) by path, for the files that are cached at this sample rate and have not changed since.
+    """
+    features = {}
+    cursor = conn.execute('SELECT path, size, mtime_ns, sha256, seconds FROM audio_features WHERE sample_rate = ?', (sample_rate,))
+    for audio_file_path, size, mtime_ns, sha256, seconds in cursor:
+        if file_stats.get(audio_file_path) == (size, mtime_ns):
+            features[audio_file_path] = (sha256, seconds)
+    return features
+
+def get_feature_durations(conn, file_stats):
+    """Looks up the decoded duration of audio files in the feature cache, whatever its sample rate.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        file_stats (dict): Current (size, mtime_ns) by audio file path.
+
+    Returns:
+        dict: Duration in seconds by path, for the files that are cached and have not changed since.
+    """
+    durations = {}
+    for audio_file_path, size, mtime_ns, seconds in conn.execute('SELECT path, size, mtime_ns, seconds FROM audio_features'):
+        if file_stats.get(audio_file_path) == (size, mtime_ns):
+            durations[audio_file_path] = seconds
+    return durations
+
+def set_audio_features(conn, features):
+    """Indexes the feature cache entries of audio files.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        features (iterable): (audio file path, size, mtime_ns, sha256, seconds, sample rate) tuples.
+    """
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO audio_features (path, size, mtime_ns, sha256, seconds, sample_rate) VALUES (?, ?, ?, ?, ?, ?)',
+            features
+        )
+
+def get_speaker_genders(conn):
+    """Returns the cached gender of every classified speaker.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+
+    Returns:
+        dict: Gender by speaker name.
+    """
+    return dict(conn.execute('SELECT speaker, gender FROM speaker_genders'))
+
+def set_speaker_genders(conn, speaker_genders):
+    """Caches the gender of speakers.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        speaker_genders (iterable): (speaker name, gender, mean pitch, number of classified clips) tuples.
+    """
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO speaker_genders (speaker, gender, mean_pitch, num_clips) VALUES (?, ?, ?, ?)',
+                         speaker_genders)
+
+def get_url_hash(conn, normalized_url):
+    """Looks up the content hash of the audio previously downloaded from a URL.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        normalized_url (str): URL normalized with audio_store.normalize_url.
+
+    Returns:
+        str: SHA-256 of the audio, or None if the URL was never downloaded.
+    """
+    result = conn.execute('SELECT sha256 FROM audio_urls WHERE url = ?', (normalized_url,)).fetchone()
+    return result[0] if result else None
+
+def record_audio_article(conn, channel, audio_id, normalized_url, sha256):
+    """Records which stored audio an article and its URL refer to.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        channel (str): News channel of the article.
+        audio_id (str): ID of the article.
+        normalized_url (str): URL normalized with audio_store.normalize_url.
+        sha256 (str): SHA-256 of the audio.
+    """
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO audio_urls (url, sha256) VALUES (?, ?)', (normalized_url, sha256))
+        conn.execute('INSERT OR REPLACE INTO audio_articles (channel, id, sha256) VALUES (?, ?, ?)', (channel, audio_id, sha256))
+
+def get_audio_hashes(conn):
+    """Returns the content hash of the audio of every stored article.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+
+    Returns:
+        dict: SHA-256 by (channel, audio ID).
+    """
+    return {(channel, audio_id): sha256 for channel, audio_id, sha256 in conn.execute('SELECT channel, id, sha256 FROM audio_articles')}
+
+def mark_stage(conn, entries, stage):
+    """Records in the pipeline ledger that articles finished a stage.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        entries (iterable): (channel, audio ID, detail) tuples, detail is the stage output
+            the next stage needs, e.g. the audio URL or the audio file path.
+        stage (str): Name of the stage, e.g. 'extracted' or 'downloaded'.
+    """
+    with conn:
+        conn.executemany('INSERT OR REPLACE INTO ledger (channel, id, stage, detail) VALUES (?, ?, ?, ?)',
+                         ((channel, audio_id, stage, detail) for channel, audio_id, detail in entries))
+
+def get_pending_articles(conn, done_stage, next_stage):
+    """Returns the articles that finished a stage but not the stage after it.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        done_stage (str): Stage the articles finished.
+        next_stage (str): Stage the articles did not finish yet.
+
+    Returns:
+        list: (channel, audio ID, detail of done_stage) tuples.
+    """
+    return conn.execute('''
+        SELECT done.channel, done.id, done.detail FROM ledger AS done
+        WHERE done.stage = ? AND NOT EXISTS (
+            SELECT 1 FROM ledger AS next WHERE next.channel = done.channel AND next.id = done.id AND next.stage = ?
+        )
+        ORDER BY done.channel, done.id
+    ''', (done_stage, next_stage)).fetchall()
+
+def get_completed_shards(conn):
+    """Returns the news_dataset shards whose articles were all extracted.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+
+    Returns:
+        dict: (size, mtime_ns) of the shard when it was extracted, by shard path.
+    """
+    return {path: (size, mtime_ns) for path, size, mtime_ns in conn.execute('SELECT path, size, mtime_ns FROM ledger_shards')}
+
+def mark_shard(conn, path, size, mtime_ns):
+    """Records that every article of a news_dataset shard was extracted.
+
+    Args:
+        conn (sqlite3.Connection): Connection to the manifest.
+        path (str): Path of the shard.
+        size (int): Size of the shard in bytes.
+        mtime_ns (int): Modification time of the shard in nanoseconds.
+    """
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO ledger_shards (path, size, mtime_ns) VALUES (?, ?, ?)', (path, size, mtime_ns))
@@ -0,0 +1,275 @@
+import argparse
+import os
+import queue
+import threading
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from audio_download import audio_downloader, host_limited_pool, create_session
+from compile_news_metadata import compile_news_metadata
+from article_bundles import write_bundle
+from extract_news_audio import iter_shard_news_with_audio, save_news_file, encode_news_record, shard_bundle_path, list_extraction_jobs, OUTPUT_FORMATS, STREAM_TIMEOUT
+from metrics import PROFILE_DIR_VARIABLE, configure_logging, increment, record_failure, record_failures, capture_failures, failure_reason, timed, profile_stage, register_gauge, unregister_gauge, report_metrics
+from get_audio_duration import read_audio_duration_job, add_audio_durations
+from metadata_io import read_metadata
+from news_manifest import open_manifest, mark_stage, get_pending_articles, get_completed_shards, mark_shard, set_audio_durations
+
+STAGES = ['extracted', 'downloaded', 'probed', 'classified']
+
+# Stage label of the metrics of each ledger stage, shared with the stand-alone scripts
+METRIC_STAGES = dict(zip(STAGES, ['extract', 'download', 'probe', 'classify']))
+
+# Marks the end of a stage's input queue
+DONE = None
+
+def extract_shard_articles(news_dataset_file_path, news_house, output_dir, output_format='files', prefilter=False):
+    """Extracts the articles with audio of one shard, returning what the download stage needs.
+
+    Runs in a worker process, so its failures are returned for the pipeline to record.
+
+    Args:
+        news_dataset_file_path (Path): path to the news_dataset json shard
+        news_house (str): The news house identifier (e.g., 'VOA', 'VOT', 'RFA').
+        output_dir (Path): The directory where the article data will be saved.
+        output_format (str): 'files' for a directory per article, 'jsonl' for a bundle per shard.
+        prefilter (bool): Skip the articles without audio undecoded, see iter_audio_json_items.
+
+    Returns:
+        tuple: (list of the (news house, article ID, audio URL) of every article with a valid audio URL,
+            failures captured by capture_failures)
+    """
+    articles = []
+
+    def encode_records(news_with_audio):
+        for article_id, article_data in news_with_audio:
+            line, audio_url = encode_news_record(article_data, article_id)
+            if audio_url:
+                articles.append((news_house, article_id, audio_url))
+            yield line
+
+    with profile_stage('extract'), capture_failures() as failures:
+        news_with_audio = iter_shard_news_with_audio(news_dataset_file_path, news_house, prefilter)
+        if output_format == 'jsonl':
+            write_bundle(shard_bundle_path(news_dataset_file_path, news_house, output_dir), encode_records(news_with_audio))
+        else:
+            for article_id, article_data in news_with_audio:
+                audio_url = save_news_file(article_data, article_id, output_dir)
+                if audio_url:
+                    articles.append((news_house, article_id, audio_url))
+    return articles, failures
+
+def run_pipeline(data_dir='./data', manifest_path='./pipeline.sqlite', news_houses=('VOA', 'VOT', 'RFA'),
+                 extract_workers=None, download_workers=16, per_host_limit=4, probe_workers=None,
+                 classify=False, classify_workers=None, output_path='./news_data.csv',
+                 output_with_duration_path='./news_data_with_duration.csv', metrics_path=None, metrics_interval=10,
+                 profile_dir=None, output_format='files', prefilter=False, stream_timeout=STREAM_TIMEOUT,
+                 feature_cache_dir=None):
+    """Runs extraction, download and duration probing as overlapping stages, then gender classification.
+
+    Every stage consumes the articles finished by the previous stage as soon
+    as they are available, so downloads start with the first extracted shard
+    and probing with the first downloaded file. Progress is kept per article
+    in the ledger of the manifest: after a crash or kill, the next run skips
+    extracted shards and finished articles and resumes every article at the
+    stage it had reached. The compiled metadata is written once all stages
+    are done; with classification, the gender of every new speaker is then
+    classified from a sample of their clips and filled into the metadata.
+
+    The throughput of every stage, its failures by reason and the depth of
+    the queues between stages are logged every `metrics_interval` seconds.
+
+    Args:
+        data_dir (str): Root data directory containing one directory per news house.
+        manifest_path (str): Path of the SQLite manifest holding the ledger and caches.
+        news_houses (list): News house identifiers to process.
+        extract_workers (int): Number of extraction processes, defaults to the number of CPUs.
+        download_workers (int): Maximum number of concurrent downloads.
+        per_host_limit (int): Maximum number of concurrent downloads per host.
+        probe_workers (int): Number of duration probing processes, defaults to the number of CPUs.
+        classify (bool): Classify the gender of every speaker and fill the Speaker Gender column.
+        classify_workers (int): Number of gender classification processes, defaults to the number of CPUs.
+        output_path (str): Path of the compiled metadata CSV or .parquet file.
+        output_with_duration_path (str): Path of the compiled metadata with durations.
+        metrics_path (str): Path of a Prometheus text file rewritten with the metrics every interval, None to only log them.
+        metrics_interval (float): Seconds between two metrics reports.
+        profile_dir (str): Directory of per-stage cProfile dumps, also used by the worker processes, None to disable profiling.
+        output_format (str): 'files' to extract a directory per article, 'jsonl' to extract a bundle per shard.
+        prefilter (bool): Only decode the articles whose Audio field is set when extracting.
+        stream_timeout (float): Maximum run time in seconds of the download of one stream, after which it is retried in the next run.
+        feature_cache_dir (str): Root directory of the feature cache used by classification, None to decode every clip.
+
+    Returns:
+        dict: Number of articles that finished each stage in this run.
+    """
+    conn = open_manifest(manifest_path, check_same_thread=False)
+    conn_lock = threading.Lock()
+    counts = {stage: 0 for stage in STAGES}
+    download_queue, probe_queue = queue.Queue(), queue.Queue()
+
+    def record(entries, stage):
+        with conn_lock:
+            mark_stage(conn, entries, stage)
+            counts[stage] += len(entries)
+        increment('items_total', len(entries), stage=METRIC_STAGES[stage])
+
+    def extract_stage():
+        with conn_lock:
+            for article in get_pending_articles(conn, 'extracted', 'downloaded'):
+                download_queue.put(article)
+            completed_shards = get_completed_shards(conn)
+
+        jobs = []
+        for news_house, news_dataset_file_path, output_dir in list_extraction_jobs(data_dir, news_houses):
+            stat = os.stat(news_dataset_file_path)
+            if completed_shards.get(str(news_dataset_file_path)) != (stat.st_size, stat.st_mtime_ns):
+                jobs.append((news_house, news_dataset_file_path, output_dir, stat))
+
+        with ProcessPoolExecutor(max_workers=extract_workers) as executor:
+            futures = {executor.submit(extract_shard_articles, path, news_house, output_dir, output_format, prefilter): (path, stat)
+                       for news_house, path, output_dir, stat in jobs}
+            # Shards are handed to the downloads as they finish, so a slow shard holds back none of the others
+            for future in as_completed(futures):
+                path, stat = futures[future]
+                try:
+                    articles, failures = future.result()
+                except Exception as e:
+                    # Left unmarked, so the next run retries the shard
+                    record_failure('extract', failure_reason(e), path=str(path), error=str(e))
+                    continue
+                record_failures(failures)
+                record(articles, 'extracted')
+                with conn_lock:
+                    mark_shard(conn, str(path), stat.st_size, stat.st_mtime_ns)
+                increment('bytes_total', stat.st_size, stage='extract')
+                for article in articles:
+                    download_queue.put(article)
+        download_queue.put(DONE)
+
+    def download_stage():
+        with conn_lock:
+            for article in get_pending_articles(conn, 'downloaded', 'probed'):
+                probe_queue.put(article)
+
+        def download(download_article, channel, audio_id, audio_url):
+            try:
+                _, path = download_article(channel, audio_id, audio_url)
+                if path is None:
+                    # Left pending in the ledger, so the next run retries it
+                    return
+                record([(channel, audio_id, path)], 'downloaded')
+            except Exception as e:
+                record_failure('download', failure_reason(e), audio_id=audio_id, url=audio_url, error=str(e))
+                return
+            probe_queue.put((channel, audio_id, path))
+
+        session = create_session(pool_size=max(download_workers, per_host_limit))
+        with audio_downloader(data_dir, session, manifest_path, stream_timeout=stream_timeout) as download_article, \
+                host_limited_pool(download_workers, per_host_limit) as submit:
+            for channel, audio_id, audio_url in iter(download_queue.get, DONE):
+                submit(audio_url, download, download_article, channel, audio_id, audio_url)
+        probe_queue.put(DONE)
+
+    def probe_stage():
+        def probed(future, channel, audio_id, path):
+            # Runs as a done callback, whose exceptions concurrent.futures would only log
+            try:
+                seconds, failures = future.result()
+                record_failures(failures)
+                stat = os.stat(path)
+                with conn_lock:
+                    set_audio_durations(conn, [(path, stat.st_size, stat.st_mtime_ns, seconds)])
+                record([(channel, audio_id, path)], 'probed')
+            except Exception as e:
+                # Left unprobed in the ledger, so the next run retries it
+                record_failure('probe', failure_reason(e), audio_id=audio_id, path=path, error=str(e))
+
+        with ProcessPoolExecutor(max_workers=probe_workers) as executor:
+            for channel, audio_id, path in iter(probe_queue.get, DONE):
+                future = executor.submit(read_audio_duration_job, path)
+                future.add_done_callback(lambda future, article=(channel, audio_id, path): probed(future, *article))
+
+    def classify_speakers():
+        # librosa is slow to import, so it is only loaded when classification is enabled
+        from speaker_gender import build_speaker_gender_cache
+
+        # Speaker names come from the compiled metadata, which is compiled again to fill in their genders
+        build_speaker_gender_cache(output_path, manifest_path, data_dir, workers=classify_workers,
+                                   feature_cache_dir=feature_cache_dir)
+        compile_news_metadata(data_dir, output_path, channels=list(news_houses), manifest_path=manifest_path)
+        df = read_metadata(output_path, columns=['ID', 'News Channel', 'Speaker Gender'])
+        genders = df['Speaker Gender'].astype(object).where(df['Speaker Gender'].notna(), None)
+        speaker_genders = dict(zip(zip(df['News Channel'], df['ID'].astype(str)), genders))
+        record([(channel, audio_id, speaker_genders.get((channel, audio_id)))
+                for channel, audio_id, _ in get_pending_articles(conn, 'probed', 'classified')], 'classified')
+
+    stages = [extract_stage, download_stage, probe_stage]
+    errors = []
+    stage_queues = {'download': download_queue, 'probe': probe_queue}
+    if profile_dir:
+        # Inherited by the worker processes, which profile their share of the extraction
+        os.environ[PROFILE_DIR_VARIABLE] = profile_dir
+
+    def run_stage(stage):
+        stage_name = METRIC_STAGES[STAGES[stages.index(stage)]]
+        try:
+            with timed('stage_seconds', stage=stage_name), profile_stage(stage_name):
+                stage()
+        except BaseException as e:
+            errors.append(e)
+            # Unblock the downstream stages so the pipeline stops instead of hanging
+            for stage_queue in (download_queue, probe_queue):
+                stage_queue.put(DONE)
+
+    for queue_name, stage_queue in stage_queues.items():
+        register_gauge('queue_depth', stage_queue.qsize, queue=queue_name)
+    threads = [threading.Thread(target=run_stage, args=(stage,), name=stage.__name__) for stage in stages]
+    with report_metrics(metrics_path, metrics_interval):
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    for queue_name in stage_queues:
+        unregister_gauge('queue_depth', queue=queue_name)
+    try:
+        if errors:
+            raise errors[0]
+        compile_news_metadata(data_dir, output_path, channels=list(news_houses), manifest_path=manifest_path)
+        if classify:
+            with timed('stage_seconds', stage='classify'), profile_stage('classify'):
+                classify_speakers()
+    finally:
+        conn.close()
+    add_audio_durations(output_path, output_with_duration_path, data_dir, manifest_path=manifest_path)
+    return counts
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the news audio pipeline end to end, resuming from the ledger.')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--manifest', default='./pipeline.sqlite', help='SQLite manifest holding the ledger and caches')
+    parser.add_argument('--news-houses', nargs='+', default=['VOA', 'VOT', 'RFA'], help='news houses to process')
+    parser.add_argument('--extract-workers', type=int, default=None, help='number of extraction processes')
+    parser.add_argument('--download-workers', type=int, default=16, help='maximum number of concurrent downloads')
+    parser.add_argument('--per-host-limit', type=int, default=4, help='maximum number of concurrent downloads per host')
+    parser.add_argument('--probe-workers', type=int, default=None, help='number of duration probing processes')
+    parser.add_argument('--classify', action='store_true', help='classify the gender of every speaker into the metadata')
+    parser.add_argument('--classify-workers', type=int, default=None, help='number of gender classification processes')
+    parser.add_argument('--output', default='./news_data.csv', help='compiled metadata CSV or .parquet file')
+    parser.add_argument('--output-with-duration', default='./news_data_with_duration.csv', help='compiled metadata with durations')
+    parser.add_argument('--metrics-file', default=None, help='Prometheus text file rewritten with the metrics every interval')
+    parser.add_argument('--metrics-interval', type=float, default=10, help='seconds between two metrics reports')
+    parser.add_argument('--profile-dir', default=None, help='write cProfile dumps of every stage to this directory')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='files',
+                        help="'files' extracts a directory per article, 'jsonl' a bundle per shard")
+    parser.add_argument('--prefilter', action='store_true', help='only decode the articles whose Audio field is set')
+    parser.add_argument('--stream-timeout', type=float, default=STREAM_TIMEOUT, help='maximum seconds spent downloading one stream')
+    parser.add_argument('--feature-cache', default=None, help='root directory of the feature cache used by classification')
+    parser.add_argument('--log-level', default='INFO', help='logging level, DEBUG logs every article')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+
+    counts = run_pipeline(args.data_dir, args.manifest, args.news_houses, args.extract_workers, args.download_workers,
+                          args.per_host_limit, args.probe_workers, args.classify, args.classify_workers,
+                          args.output, args.output_with_duration, args.metrics_file, args.metrics_interval,
+                          args.profile_dir, args.output_format, args.prefilter, args.stream_timeout,
+                          args.feature_cache)
+    print(', '.join(f'{count} {stage}' for stage, count in counts.items()))
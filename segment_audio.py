@@ -0,0 +1,446 @@
+import argparse
+import io
+import json
+import os
+import re
+import subprocess
+import tarfile
+import tempfile
+import wave
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from tqdm import tqdm
+from metadata_io import read_metadata, read_metadata_columns
+from metrics import configure_logging, increment, record_failure, record_failures, capture_failures, failure_reason, timed
+
+# Segments are decoded to 16 kHz mono 16-bit PCM, the usual input of ASR models
+SAMPLE_RATE = 16000
+
+# Length in seconds of the frames whose energy decides between speech and silence
+FRAME_SECONDS = 0.03
+
+# Tibetan sentences end with a shad (།) or a double shad (༎), usually followed by a space
+SENTENCE_END_PATTERN = re.compile(r'(?<=[།༎])\s+|\n+')
+
+def iter_pcm_blocks(audio_file, sample_rate=SAMPLE_RATE, block_seconds=10):
+    """Decodes an audio file to mono 16-bit PCM one block at a time.
+
+    WAV files already at the target rate are read directly, everything else
+    is decoded and resampled by an ffmpeg subprocess whose output is read
+    from a pipe, so memory stays bounded by the block size.
+
+    Args:
+        audio_file (str): Path of the audio file.
+        sample_rate (int): Sample rate to decode at.
+        block_seconds (float): Duration of the yielded blocks.
+
+    Yields:
+        np.ndarray: int16 samples of the next block.
+    """
+    block_samples = int(sample_rate * block_seconds)
+    with open(audio_file, 'rb') as f:
+        is_wav = f.read(4) == b'RIFF'
+    if is_wav:
+        with wave.open(audio_file, 'rb') as wav_file:
+            if (wav_file.getnchannels(), wav_file.getsampwidth(), wav_file.getframerate()) == (1, 2, sample_rate):
+                while True:
+                    frames = wav_file.readframes(block_samples)
+                    if not frames:
+                        return
+                    yield np.frombuffer(frames, dtype='<i2')
+
+    command = [
+        'ffmpeg', '-nostdin', '-loglevel', 'error', '-i', audio_file,
+        '-f', 's16le', '-acodec', 'pcm_s16le', '-ac', '1', '-ar', str(sample_rate), '-',
+    ]
+    # Errors go to a file rather than a pipe: a corrupt file can log more than a pipe holds before
+    # stdout is drained, and ffmpeg would then block on stderr while this blocks on stdout
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr_file)
+        try:
+            while True:
+                data = process.stdout.read(block_samples * 2)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) // 2 * 2], dtype='<i2')
+            if process.wait() != 0:
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
+                raise RuntimeError(f'ffmpeg exited with code {process.returncode}: {stderr[-2000:]}')
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+def iter_frames(blocks, frame_samples):
+    """Regroups blocks of samples into frames of a fixed length, with their level.
+
+    Args:
+        blocks (iterable): int16 sample blocks, e.g. from iter_pcm_blocks.
+        frame_samples (int): Number of samples per frame.
+
+    Yields:
+        tuple: (int16 samples of the frame, RMS level in dBFS); the last frame may be shorter.
+    """
+    remainder = np.empty(0, dtype='<i2')
+    for block in blocks:
+        samples = np.concatenate([remainder, block])
+        num_frames = len(samples) // frame_samples
+        frames = samples[:num_frames * frame_samples].reshape(num_frames, frame_samples)
+        levels = frame_levels(frames)
+        yield from zip(frames, levels)
+        remainder = samples[num_frames * frame_samples:]
+    if len(remainder):
+        yield remainder, frame_levels(remainder[np.newaxis, :])[0]
+
+def frame_levels(frames):
+    """Computes the RMS level of frames in dBFS.
+
+    Args:
+        frames (np.ndarray): int16 samples, one frame per row.
+
+    Returns:
+        np.ndarray: Level of every frame, -100 for digital silence.
+    """
+    rms = np.sqrt(np.mean(np.square(frames.astype(np.float32) / 32768), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-5))
+
+def iter_array_blocks(samples, sample_rate=SAMPLE_RATE, block_seconds=10):
+    """Yields already decoded samples in blocks, like iter_pcm_blocks.
+
+    Args:
+        samples (np.ndarray): int16 samples, e.g. the memory-mapped PCM of the feature cache.
+        sample_rate (int): Sample rate of the samples.
+        block_seconds (float): Duration of the yielded blocks.
+
+    Yields:
+        np.ndarray: int16 samples of the next block.
+    """
+    block_samples = int(sample_rate * block_seconds)
+    for start in range(0, len(samples), block_samples):
+        yield np.asarray(samples[start:start + block_samples])
+
+def iter_audio_segments(audio_file, sample_rate=SAMPLE_RATE, silence_db=-40, min_silence=0.3, min_segment=1.0,
+                        max_segment=20.0, pcm=None):
+    """Splits an audio file into speech segments at pauses, in a single streaming pass.
+
+    A segment ends at the first pause of at least `min_silence` seconds once
+    it holds `min_segment` seconds of audio. A segment reaching `max_segment`
+    seconds without such a pause is cut at the quietest frame of its second
+    half. Only the samples of the current segment are held in memory.
+
+    Args:
+        audio_file (str): Path of the audio file.
+        sample_rate (int): Sample rate to decode at.
+        silence_db (float): Frames below this RMS level in dBFS are silence.
+        min_silence (float): Minimum pause in seconds ending a segment.
+        min_segment (float): Minimum duration of a segment in seconds, shorter bursts are dropped.
+        max_segment (float): Maximum duration of a segment in seconds.
+        pcm (np.ndarray): int16 samples of the file at sample_rate, e.g. from feature_cache.load_pcm,
+            read instead of decoding audio_file.
+
+    Yields:
+        tuple: (start in seconds, int16 samples of the segment)
+    """
+    frame_samples = int(sample_rate * FRAME_SECONDS)
+    min_silence_frames = max(1, round(min_silence / FRAME_SECONDS))
+    min_segment_frames = max(1, round(min_segment / FRAME_SECONDS))
+    max_segment_frames = max(min_segment_frames + 1, round(max_segment / FRAME_SECONDS))
+    # Half of the closing pause stays in the segment, so words are not clipped
+    kept_silence_frames = min_silence_frames // 2
+
+    def segment(start_frame, frames):
+        return start_frame * frame_samples / sample_rate, np.concatenate(frames)
+
+    frames, levels = [], []
+    start_frame = None
+    silence_run = 0
+    blocks = iter_pcm_blocks(audio_file, sample_rate) if pcm is None else iter_array_blocks(pcm, sample_rate)
+    for frame_index, (frame, level) in enumerate(iter_frames(blocks, frame_samples)):
+        silent = level < silence_db
+        if start_frame is None:
+            if silent:
+                continue
+            start_frame = frame_index
+        frames.append(frame)
+        levels.append(level)
+        silence_run = silence_run + 1 if silent else 0
+
+        if silence_run >= min_silence_frames:
+            speech_frames = len(frames) - silence_run
+            if speech_frames >= min_segment_frames:
+                yield segment(start_frame, frames[:speech_frames + kept_silence_frames])
+            frames, levels, start_frame, silence_run = [], [], None, 0
+        elif len(frames) >= max_segment_frames:
+            # Cut at the quietest frame of the second half, the latest one on ties so steady speech is cut late
+            half = len(levels) // 2
+            cut = len(levels) - 1 - int(np.argmin(levels[:half - 1:-1]))
+            yield segment(start_frame, frames[:cut])
+            frames, levels, start_frame = frames[cut:], levels[cut:], start_frame + cut
+
+    if start_frame is not None and len(frames) - silence_run >= min_segment_frames:
+        yield segment(start_frame, frames[:len(frames) - silence_run + min(silence_run, kept_silence_frames)])
+
+def split_sentences(text):
+    """Splits a Tibetan text into sentences, each keeping its closing shad.
+
+    Args:
+        text (str): Text of the article.
+
+    Returns:
+        list: Non-empty sentences in order.
+    """
+    return [sentence.strip() for sentence in SENTENCE_END_PATTERN.split(text) if sentence.strip()]
+
+def align_sentences(sentences, segment_durations):
+    """Assigns sentences to audio segments in proportion to their length.
+
+    The text is assumed to be read at a steady pace: a sentence goes to the
+    segment playing when the reading reaches the middle of the sentence,
+    measured in characters. This is a coarse alignment meant to be refined
+    by a forced aligner or filtered by an ASR model.
+
+    Args:
+        sentences (list): Sentences of the transcript in order.
+        segment_durations (list): Duration in seconds of every audio segment in order.
+
+    Returns:
+        list: Text of every segment, empty for segments without a sentence.
+    """
+    segment_texts = [[] for _ in segment_durations]
+    total_chars = sum(len(sentence) for sentence in sentences)
+    total_seconds = sum(segment_durations)
+    if not total_chars or not total_seconds:
+        return [''] * len(segment_durations)
+
+    segment_ends = np.cumsum(segment_durations) / total_seconds
+    chars_read = 0
+    for sentence in sentences:
+        middle = (chars_read + len(sentence) / 2) / total_chars
+        chars_read += len(sentence)
+        segment_index = min(int(np.searchsorted(segment_ends, middle)), len(segment_durations) - 1)
+        segment_texts[segment_index].append(sentence)
+    return [' '.join(texts) for texts in segment_texts]
+
+def encode_wav(samples, sample_rate=SAMPLE_RATE):
+    """Encodes int16 mono samples as a WAV file.
+
+    Args:
+        samples (np.ndarray): int16 samples.
+        sample_rate (int): Sample rate of the samples.
+
+    Returns:
+        bytes: Content of the WAV file.
+    """
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+def segment_article(audio_file, text, key_prefix, metadata, segment_kwargs=None, pcm=None):
+    """Segments the audio of one article and pairs every segment with its sentences.
+
+    Args:
+        audio_file (str): Path of the downloaded audio of the article.
+        text (str): Transcript of the article.
+        key_prefix (str): Prefix of the sample keys, unique per article.
+        metadata (dict): Fields copied to the JSON of every sample, e.g. ID and speaker.
+        segment_kwargs (dict): Keyword arguments passed on to iter_audio_segments.
+        pcm (np.ndarray): Decoded samples of the audio, see iter_audio_segments, None to decode audio_file.
+
+    Returns:
+        list: WebDataset samples, dicts with '__key__', 'wav', 'txt' and 'json'; segments without text are dropped.
+    """
+    segments = list(iter_audio_segments(audio_file, **(segment_kwargs or {}), pcm=pcm))
+    sample_rate = (segment_kwargs or {}).get('sample_rate', SAMPLE_RATE)
+    durations = [len(samples) / sample_rate for _, samples in segments]
+    texts = align_sentences(split_sentences(text), durations)
+
+    samples = []
+    for index, ((start, segment_samples), duration, segment_text) in enumerate(zip(segments, durations, texts)):
+        if not segment_text:
+            continue
+        segment_metadata = {**metadata, 'segment': index, 'start': round(start, 3), 'duration': round(duration, 3)}
+        samples.append({
+            '__key__': f'{key_prefix}_{index:04d}',
+            'wav': encode_wav(segment_samples, sample_rate),
+            'txt': segment_text.encode('utf-8'),
+            'json': json.dumps(segment_metadata, ensure_ascii=False).encode('utf-8'),
+        })
+    return samples
+
+def segment_article_job(args):
+    """Runs segment_article for segment_news_audio, reporting failures as an empty list along with the captured failures."""
+    audio_file, text, key_prefix, metadata, segment_kwargs, cached_pcm = args
+    with capture_failures() as failures:
+        try:
+            # Imported here, since the feature cache builds on the decoding of this module
+            from feature_cache import load_pcm
+            pcm = load_pcm(*cached_pcm) if cached_pcm else None
+            samples = segment_article(audio_file, text, key_prefix, metadata, segment_kwargs, pcm)
+        except Exception as e:
+            record_failure('segment', failure_reason(e), path=audio_file, error=str(e))
+            samples = []
+    return samples, failures
+
+def write_shards(samples, output_dir, shard_size=1000, max_shard_bytes=1 << 30, prefix='segments'):
+    """Writes WebDataset samples to numbered tar shards of a bounded size.
+
+    A shard is closed once it holds `shard_size` samples or `max_shard_bytes`
+    bytes. Every shard is written to a `.part` file renamed once complete,
+    and listed in `index.jsonl` with its number of samples and total audio
+    duration.
+
+    Args:
+        samples (iterable): Dicts with '__key__' and one bytes value per file extension.
+        output_dir (str): Directory of the shards.
+        shard_size (int): Maximum number of samples per shard.
+        max_shard_bytes (int): Maximum size of a shard in bytes.
+        prefix (str): Prefix of the shard names, e.g. 'segments-000000.tar'.
+
+    Returns:
+        list: Paths of the written shards.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    shard_paths = []
+    shard = None
+
+    def close_shard():
+        tar_file, part_path, num_samples, num_bytes, seconds = shard
+        tar_file.close()
+        os.replace(part_path, shard_paths[-1])
+        index_file.write(json.dumps({'shard': os.path.basename(shard_paths[-1]), 'samples': num_samples,
+                                     'seconds': round(seconds, 3)}) + '\n')
+
+    with open(os.path.join(output_dir, 'index.jsonl'), 'w', encoding='utf-8') as index_file:
+        for sample in samples:
+            if shard is not None and (shard[2] >= shard_size or shard[3] >= max_shard_bytes):
+                close_shard()
+                shard = None
+            if shard is None:
+                shard_paths.append(os.path.join(output_dir, f'{prefix}-{len(shard_paths):06d}.tar'))
+                part_path = f'{shard_paths[-1]}.part'
+                shard = [tarfile.open(part_path, 'w', format=tarfile.USTAR_FORMAT), part_path, 0, 0, 0.0]
+
+            for extension, content in sample.items():
+                if extension == '__key__':
+                    continue
+                info = tarfile.TarInfo(f"{sample['__key__']}.{extension}")
+                info.size = len(content)
+                shard[0].addfile(info, io.BytesIO(content))
+                shard[3] += len(content)
+            shard[2] += 1
+            shard[4] += json.loads(sample['json'])['duration']
+        if shard is not None:
+            close_shard()
+    return shard_paths
+
+def segment_news_audio(metadata_path='./news_data_with_duration.csv', data_root_dir='./data', output_dir='./segments',
+                       workers=None, shard_size=1000, max_shard_bytes=1 << 30, segment_kwargs=None, feature_cache_dir=None,
+                       manifest_path=None):
+    """Segments the downloaded audio of every article into training-ready WebDataset shards.
+
+    Every article is decoded once in a streaming way and split at pauses;
+    its transcript is split into sentences, which are assigned to the
+    segments in proportion to their length. Samples are written in article
+    order to tar shards holding a `.wav`, `.txt` and `.json` file per
+    segment, the JSON carrying the article ID, channel, speaker, start and
+    duration of the segment. Articles whose audio duplicates another
+    article, per the channel/ID in the Duplicate Of column, are skipped. Audio already in the
+    feature cache is read from its memory-mapped PCM instead of decoded again.
+
+    Args:
+        metadata_path (str): Compiled metadata CSV or .parquet file.
+        data_root_dir (str): Root data directory containing the downloaded audio of every news channel.
+        output_dir (str): Directory of the shards.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        shard_size (int): Maximum number of samples per shard.
+        max_shard_bytes (int): Maximum size of a shard in bytes.
+        segment_kwargs (dict): Keyword arguments passed on to iter_audio_segments.
+        feature_cache_dir (str): Root directory of the feature cache, None to decode every file.
+        manifest_path (str): Path of the SQLite manifest indexing the feature cache, required with feature_cache_dir.
+
+    Returns:
+        list: Paths of the written shards.
+    """
+    available_columns = read_metadata_columns(metadata_path)
+    columns = ['ID', 'News Channel', 'Audio Text'] + [
+        column for column in ('Speaker Name', 'Speaker Gender', 'Duplicate Of') if column in available_columns
+    ]
+    df = read_metadata(metadata_path, columns=columns)
+
+    jobs = []
+    for row in df.to_dict('records'):
+        audio_file = os.path.join(data_root_dir, row['News Channel'], 'downloaded_audio', f"{row['ID']}.mp3")
+        if isinstance(row.get('Duplicate Of'), str) and row['Duplicate Of']:
+            increment('skipped_total', stage='segment', reason='duplicate')
+            continue
+        if not os.path.exists(audio_file) or row['Audio Text'] in ('', 'Transcript not found'):
+            increment('skipped_total', stage='segment', reason='missing_input')
+            continue
+        metadata = {'id': row['ID'], 'channel': row['News Channel']}
+        for column in ('Speaker Name', 'Speaker Gender'):
+            if isinstance(row.get(column), str) and row[column]:
+                metadata[column.lower().replace(' ', '_')] = row[column]
+        # Dots separate the key from the extension in WebDataset, so they cannot appear in keys
+        key_prefix = f"{row['News Channel']}_{row['ID']}".replace('.', '_')
+        jobs.append((audio_file, row['Audio Text'], key_prefix, metadata, segment_kwargs, None))
+
+    if feature_cache_dir is not None:
+        from feature_cache import get_cached_features
+        sample_rate = (segment_kwargs or {}).get('sample_rate', SAMPLE_RATE)
+        features = get_cached_features([job[0] for job in jobs], feature_cache_dir, manifest_path, sample_rate)
+        increment('cache_hits_total', len(features), stage='segment')
+        jobs = [
+            (*job[:-1], (feature_cache_dir, features[job[0]][0], sample_rate)) if job[0] in features else job
+            for job in jobs
+        ]
+
+    def iter_samples(executor):
+        # At most a few articles per worker are in flight, so decoded audio does not pile up in memory
+        batch_size = 4 * (workers or os.cpu_count() or 1)
+        job_iter = iter(jobs)
+        with tqdm(total=len(jobs), desc='Segmenting audio', unit='file') as progress:
+            while True:
+                batch = list(islice(job_iter, batch_size))
+                if not batch:
+                    return
+                for samples, failures in executor.map(segment_article_job, batch):
+                    record_failures(failures)
+                    increment('items_total', stage='segment')
+                    increment('segments_total', len(samples), stage='segment')
+                    progress.update()
+                    yield from samples
+
+    with timed('stage_seconds', stage='segment'), ProcessPoolExecutor(max_workers=workers) as executor:
+        return write_shards(iter_samples(executor), output_dir, shard_size=shard_size, max_shard_bytes=max_shard_bytes)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Segment the downloaded audio into WebDataset shards of aligned speech and text.')
+    parser.add_argument('--metadata', default='./news_data_with_duration.csv', help='compiled news metadata CSV or .parquet file')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--output-dir', default='./segments', help='directory of the tar shards')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--shard-size', type=int, default=1000, help='maximum number of segments per shard')
+    parser.add_argument('--silence-db', type=float, default=-40, help='frames below this level in dBFS are silence')
+    parser.add_argument('--min-silence', type=float, default=0.3, help='minimum pause in seconds ending a segment')
+    parser.add_argument('--min-segment', type=float, default=1.0, help='minimum segment duration in seconds')
+    parser.add_argument('--max-segment', type=float, default=20.0, help='maximum segment duration in seconds')
+    parser.add_argument('--feature-cache', default=None, help='root directory of the feature cache, decodes every file when not set')
+    parser.add_argument('--manifest', default=None, help='SQLite manifest indexing the feature cache')
+    parser.add_argument('--log-level', default='INFO', help='logging level')
+    args = parser.parse_args()
+
+    configure_logging(args.log_level)
+    segment_kwargs = {'silence_db': args.silence_db, 'min_silence': args.min_silence,
+                      'min_segment': args.min_segment, 'max_segment': args.max_segment}
+    shard_paths = segment_news_audio(args.metadata, args.data_dir, args.output_dir, args.workers, args.shard_size,
+                                     segment_kwargs=segment_kwargs, feature_cache_dir=args.feature_cache,
+                                     manifest_path=args.manifest)
+    print(f"Wrote {len(shard_paths)} shards to {args.output_dir}")
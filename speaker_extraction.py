@@ -0,0 +1,89 @@
+import re
+from functools import lru_cache
+
+# Phrases that introduce the reporter's name in a byline, e.g. 'གསར་འགོད་པ། བཀྲ་ཤིས།'; only the shad-terminated
+# forms are bylines, as 'གསར་འགོད་པ་' is also the ordinary word for journalist in running text
+BYLINE_MARKERS = ('གསར་འགོད་པ།', 'སྙན་ཞུ་བ།')
+
+# Number of characters scanned at the beginning and at the end of a text, where bylines appear
+BYLINE_WINDOW = 500
+
+@lru_cache(maxsize=None)
+def compile_byline_pattern(markers=BYLINE_MARKERS):
+    """Compiles a single pattern capturing the word that follows any of the byline markers.
+
+    Args:
+        markers (tuple): Byline marker phrases.
+
+    Returns:
+        re.Pattern: Pattern whose first group is the speaker's name.
+    """
+    # Longer markers first, so that a marker is never cut short by one of its prefixes
+    alternatives = '|'.join(re.escape(marker) for marker in sorted(markers, key=len, reverse=True))
+    return re.compile(rf'(?:{alternatives})\s*(\S+)')
+
+def extract_speaker(text, markers=BYLINE_MARKERS, window=BYLINE_WINDOW):
+    """Extracts the speaker's name (the word immediately following a byline marker) from a text.
+
+    Only the first and last `window` characters of the text are scanned, the
+    beginning first.
+
+    Args:
+        text (str or list): Body text, or list of its lines.
+        markers (tuple): Byline marker phrases.
+        window (int): Number of characters scanned at each end of the text, None to scan everything.
+
+    Returns:
+        str: Extracted speaker's name or an empty string if not found.
+    """
+    if not isinstance(text, str):
+        text = '\n'.join(line.rstrip('\n') for line in text)
+    pattern = compile_byline_pattern(tuple(markers))
+
+    if window is None or len(text) <= 2 * window:
+        windows = (text,)
+    else:
+        # Marker and name can straddle the window boundary, so let the windows overlap the middle a little
+        margin = 64
+        windows = (text[:window + margin], text[-window - margin:])
+
+    for scanned_text in windows:
+        match = pattern.search(scanned_text)
+        if match:
+            return match.group(1)
+    return ''
+
+def extract_speakers(texts, markers=BYLINE_MARKERS, window=BYLINE_WINDOW):
+    """Extracts the speaker's name of many texts.
+
+    Args:
+        texts (iterable): Body texts, or lists of their lines.
+        markers (tuple): Byline marker phrases.
+        window (int): Number of characters scanned at each end of every text, None to scan everything.
+
+    Returns:
+        list: Extracted speaker's name, or an empty string, for every text in order.
+    """
+    return [extract_speaker(text, markers=markers, window=window) for text in texts]
+
+def extract_speaker_from_text(body_text_lines):
+    """Extracts the speaker's name (the word immediately following 'གསར་འགོད་པ།' or another byline marker) from the text.
+
+    Args:
+        body_text_lines (list): List of lines in the text.
+
+    Returns:
+        str: Extracted speaker's name or an empty string if not found.
+    """
+    return extract_speaker(body_text_lines)
+
+def is_known_speaker(speaker_name):
+    """Checks if a speaker name identifies a speaker.
+
+    Args:
+        speaker_name (str): Speaker name from the compiled metadata.
+
+    Returns:
+        bool: False for missing, empty and 'unknown' names, True otherwise.
+    """
+    return isinstance(speaker_name, str) and speaker_name.strip() != '' and speaker_name.strip().lower() != 'unknown'
@@ -0,0 +1,107 @@
+import argparse
+import os
+from collections import Counter
+from identify_gender import classify_genders
+from metadata_io import read_metadata
+from news_manifest import open_manifest, get_speaker_genders, set_speaker_genders
+from speaker_extraction import is_known_speaker
+
+def sample_speaker_clips(df, data_root_dir, clips_per_speaker=3, skip_speakers=()):
+    """Picks a few downloaded clips of every speaker, spread over the speaker's clips sorted by ID.
+
+    Args:
+        df (pd.DataFrame): Compiled metadata with ID, Speaker Name and News Channel columns.
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        clips_per_speaker (int): Maximum number of clips picked per speaker.
+        skip_speakers (set): Speakers that need no clips, e.g. because they are already cached.
+
+    Returns:
+        dict: Paths of the picked audio files by speaker name.
+    """
+    speaker_clips = {}
+    df = df[df['Speaker Name'].map(is_known_speaker) & ~df['Speaker Name'].isin(skip_speakers)]
+    for speaker_name, speaker_df in df.sort_values('ID').groupby('Speaker Name', sort=True):
+        audio_file_paths = [
+            os.path.join(data_root_dir, news_channel, 'downloaded_audio', f"{audio_id}.mp3")
+            for audio_id, news_channel in zip(speaker_df['ID'], speaker_df['News Channel'])
+        ]
+        audio_file_paths = [audio_file_path for audio_file_path in audio_file_paths if os.path.exists(audio_file_path)]
+        if not audio_file_paths:
+            continue
+        step = max(1, len(audio_file_paths) // clips_per_speaker)
+        speaker_clips[speaker_name] = audio_file_paths[::step][:clips_per_speaker]
+    return speaker_clips
+
+def vote_speaker_gender(results):
+    """Combines the classifications of a speaker's clips by majority vote.
+
+    Args:
+        results (list): {'gender', 'mean_pitch'} dicts returned by classify_genders.
+
+    Returns:
+        tuple: (gender, mean pitch over the classified clips, number of classified clips),
+        gender is None if no clip could be classified.
+    """
+    classified = [result for result in results if result['mean_pitch'] is not None]
+    if not classified:
+        return None, None, 0
+    gender, _ = Counter(result['gender'] for result in classified).most_common(1)[0]
+    mean_pitch = sum(result['mean_pitch'] for result in classified) / len(classified)
+    return gender, mean_pitch, len(classified)
+
+def build_speaker_gender_cache(metadata_path, manifest_path, data_root_dir='./data', clips_per_speaker=3, workers=None,
+                               refresh=False, feature_cache_dir=None):
+    """Classifies the gender of every distinct speaker from a small sample of their clips.
+
+    Results are stored in the manifest, where compile_news_metadata picks them
+    up to fill the Speaker Gender column. Speakers already in the cache are
+    skipped unless refresh is set.
+
+    Args:
+        metadata_path (str): Path of the compiled metadata CSV or .parquet file.
+        manifest_path (str): Path of the SQLite manifest storing the speaker genders.
+        data_root_dir (str): Root data directory containing one directory per news channel.
+        clips_per_speaker (int): Maximum number of clips classified per speaker.
+        workers (int): Number of worker processes, defaults to the number of CPUs.
+        refresh (bool): Classify speakers that are already cached again.
+        feature_cache_dir (str): Root directory of the feature cache indexed by the manifest, None to decode every clip.
+
+    Returns:
+        dict: Gender by speaker name for the speakers classified in this run.
+    """
+    df = read_metadata(metadata_path, columns=['ID', 'Speaker Name', 'News Channel'])
+    conn = open_manifest(manifest_path)
+    try:
+        cached_speakers = set() if refresh else set(get_speaker_genders(conn))
+        speaker_clips = sample_speaker_clips(df, data_root_dir, clips_per_speaker, skip_speakers=cached_speakers)
+
+        audio_files = [audio_file for clips in speaker_clips.values() for audio_file in clips]
+        results = iter(classify_genders(audio_files, workers=workers, feature_cache_dir=feature_cache_dir,
+                                         manifest_path=manifest_path)) if audio_files else iter(())
+
+        speaker_genders = {}
+        cache_rows = []
+        for speaker_name, clips in speaker_clips.items():
+            gender, mean_pitch, num_clips = vote_speaker_gender([next(results) for _ in clips])
+            if gender is not None:
+                speaker_genders[speaker_name] = gender
+                cache_rows.append((speaker_name, gender, mean_pitch, num_clips))
+        set_speaker_genders(conn, cache_rows)
+    finally:
+        conn.close()
+    return speaker_genders
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Classify the gender of every speaker from a sample of their clips.')
+    parser.add_argument('--metadata', default='./news_data.csv', help='compiled news metadata CSV or .parquet file')
+    parser.add_argument('--manifest', required=True, help='SQLite manifest storing the speaker genders')
+    parser.add_argument('--data-dir', default='./data', help='root data directory')
+    parser.add_argument('--clips-per-speaker', type=int, default=3, help='maximum number of clips classified per speaker')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--refresh', action='store_true', help='classify speakers that are already cached again')
+    parser.add_argument('--feature-cache', default=None, help='root directory of the feature cache, decodes every clip when not set')
+    args = parser.parse_args()
+
+    speaker_genders = build_speaker_gender_cache(args.metadata, args.manifest, args.data_dir, args.clips_per_speaker,
+                                                 args.workers, args.refresh, args.feature_cache)
+    print(f"Classified the gender of {len(speaker_genders)} speakers")
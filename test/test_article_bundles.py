@@ -0,0 +1,42 @@
+import json
+
+from article_bundles import encode_record, write_bundle, index_bundle, bundle_reader, iter_bundle_paths
+from benchmarks.synthetic_corpus import generate_news_dataset
+from compile_news_metadata import compile_news_metadata
+from extract_news_audio import extract_news_audio
+
+def test_write_and_index_bundle(tmp_path):
+    bundle_path = tmp_path / 'RFA' / 'news_bundles' / '0.jsonl'
+    lines = [encode_record('a', 'https://rfa.org/a.mp3', 'བཀྲ་ཤིས།\nline', {'speaker': 'Unknown'}),
+             encode_record('b"2', None, None, None)]
+    assert write_bundle(bundle_path, iter(lines)) == 2
+    assert not bundle_path.with_name('0.jsonl.part').exists()
+    assert iter_bundle_paths(tmp_path, 'RFA') == [str(bundle_path)]
+    assert iter_bundle_paths(tmp_path, 'VOA') == []
+
+    index = list(index_bundle(str(bundle_path)))
+    assert [audio_id for audio_id, _ in index] == ['a', 'b"2']
+    with bundle_reader() as read_record:
+        records = [read_record(location) for _, location in reversed(index)]
+    assert records == [json.loads(line) for line in reversed(lines)]
+
+def test_compile_reads_bundles_like_directories(tmp_path):
+    for output_format in ('files', 'jsonl'):
+        data_dir = tmp_path / output_format
+        generate_news_dataset(data_dir, 60, shard_size=7, audio_ratio=0.5)
+        extract_news_audio(str(data_dir), workers=2, output_format=output_format)
+        compile_news_metadata(str(data_dir), str(tmp_path / f'{output_format}.csv'), workers=4)
+
+    assert not list((tmp_path / 'jsonl').glob('*/news_dataset_with_audio/*'))
+    assert len(list((tmp_path / 'jsonl').glob('*/news_bundles/*.jsonl'))) == 9
+    assert (tmp_path / 'jsonl.csv').read_bytes() == (tmp_path / 'files.csv').read_bytes()
+
+def test_compile_bundles_incremental(tmp_path):
+    data_dir = tmp_path / 'data'
+    generate_news_dataset(data_dir, 30, shard_size=5, audio_ratio=1.0)
+    extract_news_audio(str(data_dir), output_format='jsonl')
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+    assert compile_news_metadata(str(data_dir), str(tmp_path / 'incremental.csv'), manifest_path=manifest_path) == 30
+    assert compile_news_metadata(str(data_dir), str(tmp_path / 'incremental.csv'), manifest_path=manifest_path) == 30
+    compile_news_metadata(str(data_dir), str(tmp_path / 'full.csv'))
+    assert (tmp_path / 'incremental.csv').read_bytes() == (tmp_path / 'full.csv').read_bytes()
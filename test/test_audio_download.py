@@ -0,0 +1,162 @@
+import os
+import sqlite3
+import threading
+import pandas as pd
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import audio_download
+from audio_download import create_session, download_audio_file, download_audio_files, host_limited_pool
+
+AUDIO_BYTES = bytes(range(256)) * 4096
+
+class AudioRequestHandler(BaseHTTPRequestHandler):
+    """Serves AUDIO_BYTES with Range support, failing the first `failures` requests with a 503."""
+    failures = 0
+    range_headers = []
+
+    def do_GET(self):
+        cls = type(self)
+        if cls.failures:
+            cls.failures -= 1
+            self.send_error(503)
+            return
+        if self.path == '/missing.mp3':
+            self.send_error(404)
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        cls.range_headers.append(range_header)
+        if range_header:
+            start = int(range_header.split('=')[1].rstrip('-'))
+            if start >= len(AUDIO_BYTES):
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(AUDIO_BYTES) - 1}/{len(AUDIO_BYTES)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(AUDIO_BYTES) - start))
+        self.end_headers()
+        self.wfile.write(AUDIO_BYTES[start:])
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def audio_server():
+    AudioRequestHandler.failures = 0
+    AudioRequestHandler.range_headers = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AudioRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def test_download_resumes_partial_file(audio_server, tmp_path):
+    audio_file_path = tmp_path / 'a.mp3'
+    (tmp_path / 'a.mp3.part').write_bytes(AUDIO_BYTES[:1000])
+
+    download_audio_file(create_session(), f'{audio_server}/a.mp3', str(audio_file_path))
+
+    assert audio_file_path.read_bytes() == AUDIO_BYTES
+    assert not (tmp_path / 'a.mp3.part').exists()
+    assert AudioRequestHandler.range_headers == ['bytes=1000-']
+
+def test_download_retries_server_errors(audio_server, tmp_path):
+    AudioRequestHandler.failures = 2
+    audio_file_path = tmp_path / 'a.mp3'
+
+    download_audio_file(create_session(), f'{audio_server}/a.mp3', str(audio_file_path), backoff=0.01)
+
+    assert audio_file_path.read_bytes() == AUDIO_BYTES
+
+def test_host_limited_pool_runs_other_hosts_while_one_is_busy():
+    release = threading.Event()
+    other_host_started = threading.Event()
+    started = []
+
+    def slow_job(name):
+        started.append(name)
+        release.wait(5)
+
+    with host_limited_pool(workers=2, per_host_limit=1) as submit:
+        submit('http://a.example/1.mp3', slow_job, 'a1')
+        submit('http://a.example/2.mp3', slow_job, 'a2')
+        submit('http://b.example/1.mp3', other_host_started.set)
+        # The second job of the busy host waits without holding the other pool thread
+        assert other_host_started.wait(5)
+        assert started == ['a1']
+        release.set()
+    assert started == ['a1', 'a2']
+
+def test_download_audio_files(audio_server, tmp_path):
+    (tmp_path / 'VOA' / 'downloaded_audio').mkdir(parents=True)
+    (tmp_path / 'VOA' / 'downloaded_audio' / '3.mp3').write_bytes(b'existing')
+    df = pd.DataFrame({
+        'ID': ['1', '2', '3', '4', '5'],
+        'Audio URL': [f'{audio_server}/1.mp3', f'{audio_server}/2.mp3', f'{audio_server}/3.mp3', 'URL not found', f'{audio_server}/missing.mp3'],
+        'News Channel': ['RFA', 'VOA', 'VOA', 'VOT', 'VOT'],
+    })
+
+    statuses = download_audio_files(df, str(tmp_path), workers=4, per_host_limit=2, backoff=0.01)
+
+    assert statuses == {'1': 'downloaded', '2': 'downloaded', '3': 'exists', '4': 'skipped', '5': 'failed'}
+    assert (tmp_path / 'RFA' / 'downloaded_audio' / '1.mp3').read_bytes() == AUDIO_BYTES
+    assert (tmp_path / 'VOA' / 'downloaded_audio' / '3.mp3').read_bytes() == b'existing'
+
+def test_download_audio_files_deduplicates(audio_server, tmp_path):
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+    df = pd.DataFrame({
+        'ID': ['1', '2', '3', '4'],
+        'Audio URL': [f'{audio_server}/a.mp3', f'{audio_server}/a.mp3#t=1', f'{audio_server}/b.mp3', f'{audio_server}/a.mp3?utm_source=x'],
+        'News Channel': ['RFA', 'VOA', 'VOA', 'VOT'],
+    })
+
+    statuses = download_audio_files(df, str(tmp_path / 'data'), workers=1, manifest_path=manifest_path)
+
+    assert statuses == {'1': 'downloaded', '2': 'linked', '3': 'duplicate', '4': 'linked'}
+    audio_files = [tmp_path / 'data' / channel / 'downloaded_audio' / f'{audio_id}.mp3' for audio_id, channel in zip(df['ID'], df['News Channel'])]
+    assert all(audio_file.read_bytes() == AUDIO_BYTES for audio_file in audio_files)
+    assert len({audio_file.stat().st_ino for audio_file in audio_files}) == 1
+    assert AudioRequestHandler.range_headers == [None, None]
+
+def test_download_audio_files_records_store_errors(audio_server, tmp_path, monkeypatch):
+    link_known_url = audio_download.link_known_url
+
+    def failing_link_known_url(conn, store_dir, channel, audio_id, *args):
+        if audio_id == '2':
+            raise sqlite3.OperationalError('database is locked')
+        return link_known_url(conn, store_dir, channel, audio_id, *args)
+
+    monkeypatch.setattr(audio_download, 'link_known_url', failing_link_known_url)
+    df = pd.DataFrame({
+        'ID': ['1', '2', '3'],
+        'Audio URL': [f'{audio_server}/1.mp3', f'{audio_server}/2.mp3', f'{audio_server}/3.mp3'],
+        'News Channel': ['RFA'] * 3,
+    })
+
+    # The store error fails its own article instead of the whole batch
+    statuses = download_audio_files(df, str(tmp_path / 'data'), workers=1, manifest_path=str(tmp_path / 'manifest.sqlite'))
+    assert statuses == {'1': 'downloaded', '2': 'failed', '3': 'duplicate'}
+
+def test_download_audio_files_fetches_streams_with_ffmpeg(audio_server, tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'ffmpeg').write_text('#!/bin/sh\nfor arg; do last="$arg"; done\n'
+                                    'case "$*" in *fail*) exit 1 ;; *) echo "audio" > "$last" ;; esac\n')
+    (bin_dir / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    df = pd.DataFrame({
+        'ID': ['1', '2', '3'],
+        'Audio URL': [f'{audio_server}/live/index.m3u8', f'{audio_server}/fail/index.m3u8', f'{audio_server}/3.mp3'],
+        'News Channel': ['VOT', 'VOT', 'RFA'],
+    })
+
+    statuses = download_audio_files(df, str(tmp_path / 'data'), workers=2, stream_timeout=5)
+
+    assert statuses == {'1': 'downloaded', '2': 'failed', '3': 'downloaded'}
+    assert (tmp_path / 'data' / 'VOT' / 'downloaded_audio' / '1.mp3').read_text() == 'audio\n'
+    assert not (tmp_path / 'data' / 'VOT' / 'downloaded_audio' / '2.mp3').exists()
@@ -0,0 +1,23 @@
+import pandas as pd
+
+from audio_store import normalize_url, add_audio_file, annotate_duplicates
+from news_manifest import open_manifest
+
+def test_normalize_url():
+    assert normalize_url('https://WWW.RFA.org:443/audio/a.mp3?b=2&utm_source=x&a=1#t=3') == '//www.rfa.org/audio/a.mp3?a=1&b=2'
+    assert normalize_url('http://www.rfa.org/audio/a.mp3') == normalize_url('https://www.rfa.org/audio/a.mp3')
+    assert normalize_url('http://www.rfa.org:8080/a.mp3') == '//www.rfa.org:8080/a.mp3'
+
+def test_annotate_duplicates(tmp_path):
+    conn = open_manifest(str(tmp_path / 'manifest.sqlite'))
+    store_dir = str(tmp_path / 'store')
+    for audio_id, channel, content in [('b', 'VOA', b'same'), ('a', 'RFA', b'same'), ('c', 'VOT', b'other')]:
+        audio_file_path = tmp_path / f'{audio_id}.mp3'
+        audio_file_path.write_bytes(content)
+        add_audio_file(conn, store_dir, channel, audio_id, f'https://example.com/{audio_id}.mp3', str(audio_file_path))
+
+    df = annotate_duplicates(pd.DataFrame({'ID': ['a', 'b', 'c', 'd'], 'News Channel': ['RFA', 'VOA', 'VOT', 'VOT']}), conn)
+
+    assert list(df['Duplicate Of'].fillna('')) == ['', 'RFA/a', '', '']
+    assert df['Audio Hash'][0] == df['Audio Hash'][1] != df['Audio Hash'][2]
+    assert pd.isna(df['Audio Hash'][3])
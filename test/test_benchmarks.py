@@ -0,0 +1,34 @@
+import numpy as np
+
+from benchmarks.run_benchmarks import run_benchmark, track_rss
+from benchmarks.synthetic_corpus import generate_news_dataset, write_mp3_fixture
+from extract_news_audio import extract_news_audio
+from get_audio_duration import read_audio_duration
+
+def test_generate_news_dataset_extracts_every_audio_article(tmp_path):
+    shard_paths = generate_news_dataset(tmp_path, 30, shard_size=4, audio_ratio=1.0)
+    assert len(shard_paths) == 9
+    extract_news_audio(str(tmp_path))
+    article_dirs = list(tmp_path.glob('*/news_dataset_with_audio/*'))
+    assert len(article_dirs) == 30
+
+def test_write_mp3_fixture_duration(tmp_path):
+    path = write_mp3_fixture(tmp_path / 'a.mp3', seconds=30)
+    assert abs(read_audio_duration(str(path)) - 30) < 0.1
+
+def test_run_benchmark_reports_throughput(tmp_path):
+    result = run_benchmark('iter_news_with_audio', 30, 0, profile_dir=str(tmp_path))
+    assert result['items'] == 30
+    assert result['items_per_sec'] > 0
+    assert (tmp_path / 'iter_news_with_audio.prof').exists()
+
+def test_track_rss_leaves_out_earlier_allocations():
+    fixture = np.ones(64 * 2**20, dtype=np.uint8)
+    with track_rss() as usage:
+        pass
+    assert usage['rss_increase_mb'] < 16 and usage['child_peak_rss_mb'] is None
+
+    with track_rss() as usage:
+        block = np.ones(64 * 2**20, dtype=np.uint8)
+    assert usage['rss_increase_mb'] > 48
+    del fixture, block
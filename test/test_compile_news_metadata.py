@@ -0,0 +1,75 @@
+import json
+import shutil
+import pandas as pd
+
+import compile_news_metadata as compile_module
+from compile_news_metadata import compile_news_metadata, extract_speaker_from_text
+from news_manifest import open_manifest, set_speaker_genders
+
+def write_article(data_root_dir, channel, article_id, audio_url, text, metadata):
+    article_dir = data_root_dir / channel / 'news_dataset_with_audio' / article_id
+    article_dir.mkdir(parents=True)
+    (article_dir / f'{article_id}_audio_url.txt').write_text(audio_url, encoding='utf-8')
+    (article_dir / 'news_text.txt').write_text(text, encoding='utf-8')
+    (article_dir / 'metadata.json').write_text(json.dumps(metadata, ensure_ascii=False), encoding='utf-8')
+
+def test_extract_speaker_from_text():
+    assert extract_speaker_from_text(["ཁ་སང་།\n", "གསར་འགོད་པ། བཀྲ་ཤིས། \n"]) == 'བཀྲ་ཤིས།'
+    assert extract_speaker_from_text(["ཁ་སང་།\n"]) == ''
+
+def test_compile_news_metadata(tmp_path):
+    write_article(tmp_path, 'RFA', 'b2', 'https://rfa.org/b2.mp3', 'line, "quoted"\nགསར་འགོད་པ། བཀྲ་ཤིས།',
+                  {'speaker': 'Unknown', 'published_date': '2024-08-20'})
+    write_article(tmp_path, 'VOA', 'a1', 'https://voa.org/a1.mp3', 'text', {'speaker': 'Dolma', 'author': '2023'})
+    write_article(tmp_path, 'VOT', 'c3', 'not a url', '', {'speaker': 'Pema', 'published_date': '2022', 'gender': 'Female'})
+
+    output_csv_path = tmp_path / 'news_data.csv'
+    assert compile_news_metadata(str(tmp_path), str(output_csv_path), workers=2) == 3
+
+    df = pd.read_csv(output_csv_path, dtype=str, keep_default_na=False)
+    assert df.to_dict('records') == [
+        {'ID': 'a1', 'Audio URL': 'https://voa.org/a1.mp3', 'Audio Text': 'text', 'Speaker Name': 'Dolma',
+         'Speaker Gender': '', 'News Channel': 'VOA', 'Publishing Year': '2023'},
+        {'ID': 'b2', 'Audio URL': 'https://rfa.org/b2.mp3', 'Audio Text': 'line, "quoted"\nགསར་འགོད་པ། བཀྲ་ཤིས།',
+         'Speaker Name': 'བཀྲ་ཤིས།', 'Speaker Gender': '', 'News Channel': 'RFA', 'Publishing Year': '2024-08-20'},
+        {'ID': 'c3', 'Audio URL': 'URL not found', 'Audio Text': 'Transcript not found', 'Speaker Name': 'Pema',
+         'Speaker Gender': 'Female', 'News Channel': 'VOT', 'Publishing Year': '2022'},
+    ]
+
+def test_compile_news_metadata_incremental(tmp_path, monkeypatch):
+    data_root_dir = tmp_path / 'data'
+    for i in range(5):
+        write_article(data_root_dir, 'VOA', f'a{i}', f'https://voa.org/a{i}.mp3', f'text {i}', {'speaker': 'Dolma', 'author': '2023'})
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+    output_csv_path = tmp_path / 'news_data.csv'
+    assert compile_news_metadata(str(data_root_dir), str(output_csv_path), manifest_path=manifest_path) == 5
+
+    read_ids = []
+    read_article = compile_module.read_article
+    monkeypatch.setattr(compile_module, 'read_article', lambda audio_id, *args: read_ids.append(audio_id) or read_article(audio_id, *args))
+
+    write_article(data_root_dir, 'VOA', 'a5', 'https://voa.org/a5.mp3', 'text 5', {'speaker': 'Pema', 'author': '2024'})
+    (data_root_dir / 'VOA' / 'news_dataset_with_audio' / 'a1' / 'news_text.txt').write_text('edited text', encoding='utf-8')
+    shutil.rmtree(data_root_dir / 'VOA' / 'news_dataset_with_audio' / 'a3')
+    assert compile_news_metadata(str(data_root_dir), str(output_csv_path), manifest_path=manifest_path) == 5
+    assert sorted(read_ids) == ['a1', 'a5']
+
+    incremental = output_csv_path.read_bytes()
+    assert compile_news_metadata(str(data_root_dir), str(output_csv_path)) == 5
+    assert output_csv_path.read_bytes() == incremental
+
+def test_compile_news_metadata_fills_cached_speaker_genders(tmp_path):
+    data_root_dir = tmp_path / 'data'
+    write_article(data_root_dir, 'VOT', 'a1', 'https://vot.org/a1.mp3', 'text', {'speaker': 'Pema', 'published_date': '2022'})
+    write_article(data_root_dir, 'VOT', 'a2', 'https://vot.org/a2.mp3', 'text', {'speaker': 'Pema', 'gender': 'Female'})
+    write_article(data_root_dir, 'VOT', 'a3', 'https://vot.org/a3.mp3', 'text', {'speaker': 'Dolma'})
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+    conn = open_manifest(manifest_path)
+    set_speaker_genders(conn, [('Pema', 'Male', 120.0, 3)])
+    conn.close()
+
+    output_csv_path = tmp_path / 'news_data.csv'
+    compile_news_metadata(str(data_root_dir), str(output_csv_path), manifest_path=manifest_path)
+
+    df = pd.read_csv(output_csv_path, dtype=str, keep_default_na=False)
+    assert list(df['Speaker Gender']) == ['Male', 'Female', '']
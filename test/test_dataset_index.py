@@ -0,0 +1,90 @@
+import os
+import pandas as pd
+
+from dataset_index import build_index, query_index, split_by_speaker, assign_splits, index_summary, parse_year
+from metadata_io import write_metadata_rows, text_path
+
+COLUMNS = ['ID', 'Audio URL', 'Audio Text', 'Speaker Name', 'Speaker Gender', 'News Channel', 'Publishing Year',
+           'Audio Duration Seconds', 'Duplicate Of']
+
+def make_rows():
+    speakers = ['Dolma', 'Pema', 'Tashi', 'Unknown', 'Sonam', '', 'Norbu', 'Karma']
+    return [
+        {'ID': f'{i:03d}', 'Audio URL': f'https://example.com/{i}.mp3', 'Audio Text': f'ཁ་སང་། "{i}",\nline',
+         'Speaker Name': speakers[i % len(speakers)], 'Speaker Gender': ['Male', 'Female'][i % 2],
+         'News Channel': ['RFA', 'VOA', 'VOT'][i % 3], 'Publishing Year': f'{2020 + i % 4}-08-{1 + i % 28:02d}',
+         'Audio Duration Seconds': float(10 + i) if i % 10 else None, 'Duplicate Of': 'RFA/000' if i == 40 else None}
+        for i in range(80)
+    ]
+
+def test_query_index_matches_pandas(tmp_path):
+    metadata_path = tmp_path / 'news_data.csv'
+    write_metadata_rows(make_rows(), metadata_path, COLUMNS)
+    index_path = build_index(str(metadata_path))
+    assert index_path == f'{metadata_path}.index.sqlite'
+
+    df = pd.read_csv(metadata_path, dtype={'ID': str})
+    df['Publishing Year'] = df['Publishing Year'].str[:4].astype(int)
+    result = query_index(index_path, channels=['VOA', 'VOT'], years=[2021, 2023], min_duration=20, max_duration=70)
+    expected = df[df['News Channel'].isin(['VOA', 'VOT']) & df['Publishing Year'].isin([2021, 2023])
+                  & df['Audio Duration Seconds'].between(20, 70)]
+    assert list(result['ID']) == list(expected['ID']) and len(result) > 0
+    assert 'Audio Text' not in result.columns
+
+    assert list(query_index(index_path, speakers=['Pema'], genders=['Female'])['ID']) == [f'{i:03d}' for i in range(1, 80, 8)]
+    assert len(query_index(index_path)) == 80
+    assert len(query_index(index_path, unique=True)) == 79
+    assert sum(num_clips for _, num_clips, _ in index_summary(index_path)['channel']) == 80
+
+def test_build_index_reads_only_when_metadata_changes(tmp_path):
+    metadata_path = tmp_path / 'news_data.parquet'
+    write_metadata_rows(make_rows(), metadata_path, COLUMNS, separate_text=True)
+    # Transcripts are never read, so the index does not need them
+    os.remove(text_path(metadata_path))
+    index_path = build_index(str(metadata_path), str(tmp_path / 'index.sqlite'))
+    assert len(query_index(index_path, channels=['RFA'])) == 27
+
+    write_metadata_rows(make_rows()[:30], metadata_path, COLUMNS)
+    os.utime(metadata_path, ns=(0, 0))
+    build_index(str(metadata_path), index_path)
+    assert len(query_index(index_path)) == 30
+
+def test_split_by_speaker_is_disjoint_and_balanced(tmp_path):
+    metadata_path = tmp_path / 'news_data.csv'
+    rows = [
+        {'ID': str(i), 'Speaker Name': f'speaker{i % 40}' if i % 5 else 'Unknown', 'News Channel': 'RFA',
+         'Audio Duration Seconds': float(30 + (i * 7) % 50)}
+        for i in range(1000)
+    ]
+    write_metadata_rows(rows, metadata_path, ['ID', 'Speaker Name', 'News Channel', 'Audio Duration Seconds'])
+    df = split_by_speaker(build_index(str(metadata_path)), {'train': 0.8, 'dev': 0.1, 'test': 0.1})
+
+    known = df[df['Speaker Name'] != 'Unknown']
+    assert (known.groupby('Speaker Name')['Split'].nunique() == 1).all()
+    shares = df.groupby('Split')['Audio Duration Seconds'].sum() / df['Audio Duration Seconds'].sum()
+    for split, ratio in {'train': 0.8, 'dev': 0.1, 'test': 0.1}.items():
+        assert abs(shares[split] - ratio) < 0.02
+
+def test_split_by_speaker_keeps_duplicates_with_their_canonical_clip(tmp_path):
+    metadata_path = tmp_path / 'news_data.csv'
+    # IDs repeat across channels, so only the channel/ID key names the canonical clip
+    rows = [
+        {'ID': str(i % 50), 'Speaker Name': 'Unknown', 'News Channel': ['RFA', 'VOA'][i // 50],
+         'Audio Duration Seconds': float(30 + (i * 7) % 50), 'Duplicate Of': f'RFA/{i % 50}' if i >= 50 and i % 2 else None}
+        for i in range(100)
+    ]
+    write_metadata_rows(rows, metadata_path, ['ID', 'Speaker Name', 'News Channel', 'Audio Duration Seconds', 'Duplicate Of'])
+    df = split_by_speaker(build_index(str(metadata_path)), {'train': 0.5, 'test': 0.5})
+
+    splits = dict(zip(df['News Channel'] + '/' + df['ID'], df['Split']))
+    duplicates = df[df['Duplicate Of'].notna() & (df['Duplicate Of'] != '')]
+    assert len(duplicates) == 25
+    assert all(splits[duplicate_of] == split for duplicate_of, split in zip(duplicates['Duplicate Of'], duplicates['Split']))
+
+def test_assign_splits():
+    groups = {'a': 50.0, 'b': 30.0, 'c': 10.0, 'd': 10.0}
+    assert assign_splits(groups, {'train': 0.5, 'test': 0.5}) == {'a': 'train', 'b': 'test', 'c': 'test', 'd': 'test'}
+
+def test_parse_year():
+    values = ('2024-08-20', '20/08/2019', 'August 20, 2018', '2024', 2023.0, None, float('nan'), 'n/a', '123456')
+    assert [parse_year(value) for value in values] == [2024, 2019, 2018, 2024, 2023, None, None, None, None]
@@ -1,5 +1,8 @@
 import json
-from extract_news_audio import has_news_audio
+import os
+from pathlib import Path
+from metrics import collect_metrics, reset_metrics
+from extract_news_audio import has_news_audio, iter_json_items, iter_audio_json_items, iter_news_with_audio, get_news_with_audio, extract_news_audio, download_stream_files
 
 def read_json_file(file_path):
     with open(file_path, 'r', encoding='utf-8') as f:
@@ -7,7 +10,7 @@ def read_json_file(file_path):
 
 def test_has_news_audio():
     # Load news data from a JSON file
-    news_data = read_json_file(f'./test_dataset.json')
+    news_data = read_json_file(Path(__file__).parent / 'test_dataset.json')
     expected_results = {
         "1": True,
         "2": False,
@@ -21,6 +24,136 @@ def test_has_news_audio():
         
         assert result == expected_result, f"Expected {expected_result} but got {result} for article {article_id}"
 
+def make_news_dataset(num_articles):
+    news_data = {}
+    for i in range(num_articles):
+        news_data[str(i)] = {
+            "data": {
+                "title": f"title {i}",
+                "body": {
+                    "Audio": f"https://example.com/{i}.mp3" if i % 3 == 0 else "",
+                    "Text": ["གསར་འགོད་པ། བཀྲ་ཤིས།", f"line \"{i}\" {{}}"]
+                },
+                "meta_data": {"Date": "2024-08-20", "Author": "a", "Tags": ["t"], "URL": f"https://example.com/{i}"}
+            },
+            "Message": "Success",
+            "Response": 200
+        }
+    return news_data
+
+def test_iter_json_items(tmp_path):
+    news_data = make_news_dataset(50)
+    dataset_path = tmp_path / 'news_dataset.json'
+    dataset_path.write_text(json.dumps(news_data, ensure_ascii=False, indent=4), encoding='utf-8')
+
+    for chunk_size in (1, 7, 1 << 20):
+        assert dict(iter_json_items(dataset_path, chunk_size=chunk_size)) == news_data
+
+def test_iter_json_items_empty_object(tmp_path):
+    dataset_path = tmp_path / 'news_dataset.json'
+    dataset_path.write_text(' { } ', encoding='utf-8')
+    assert list(iter_json_items(dataset_path)) == []
+
+def test_iter_news_with_audio(tmp_path):
+    news_data = make_news_dataset(20)
+    dataset_path = tmp_path / 'news_dataset.json'
+    dataset_path.write_text(json.dumps(news_data), encoding='utf-8')
+
+    streamed = dict(iter_news_with_audio(iter_json_items(dataset_path, chunk_size=16), 'RFA'))
+    assert streamed == get_news_with_audio(news_data, 'RFA')
+
+def test_iter_audio_json_items_matches_full_decode(tmp_path):
+    news_data = make_news_dataset(30)
+    # Audio keys outside data.body, inside text or in nested objects must not change the result
+    news_data['1']['data']['meta_data']['Audio'] = 'https://example.com/meta.mp3'
+    news_data['2']['data']['body']['Text'].append('"Audio": "https://example.com/text.mp3" ]} \\')
+    news_data['4']['data']['body']['extra'] = {'body': {'Audio': 'https://example.com/nested.mp3'}}
+    news_data['6']['data']['body']['Audio'] = ['https://example.com/6.mp3']
+    news_data['9']['data']['body']['Audio'] = None
+    dataset_path = tmp_path / 'news_dataset.json'
+
+    for indent in (None, 4):
+        dataset_path.write_text(json.dumps(news_data, ensure_ascii=indent is None, indent=indent), encoding='utf-8')
+        for chunk_size in (1, 1 << 13):
+            prefiltered = list(iter_news_with_audio(iter_audio_json_items(dataset_path, chunk_size=chunk_size), 'RFA'))
+            assert prefiltered == list(iter_news_with_audio(iter_json_items(dataset_path), 'RFA'))
+    assert [news_id for news_id, _ in iter_audio_json_items(dataset_path)] == [str(i) for i in range(0, 30, 3) if i != 9]
+
+def test_iter_audio_json_items_test_dataset():
+    dataset_path = Path(__file__).parent / 'test_dataset.json'
+    assert [news_id for news_id, _ in iter_audio_json_items(dataset_path)] == ['1']
+    assert dict(iter_audio_json_items(dataset_path))['1'] == read_json_file(dataset_path)['1']
+
+def test_iter_audio_json_items_empty_object(tmp_path):
+    dataset_path = tmp_path / 'news_dataset.json'
+    dataset_path.write_text(' { } ', encoding='utf-8')
+    assert list(iter_audio_json_items(dataset_path)) == []
+
+def snapshot_tree(root):
+    return {str(path.relative_to(root)): path.read_bytes() for path in root.rglob('*') if path.is_file()}
+
+def test_parallel_extraction_matches_serial(tmp_path):
+    for run in ('serial', 'parallel'):
+        for news_house in ('VOA', 'RFA'):
+            news_dataset_dir = tmp_path / run / news_house / 'news_dataset'
+            news_dataset_dir.mkdir(parents=True)
+            for shard in range(3):
+                news_data = {f"{news_house}{shard}-{article_id}": article for article_id, article in make_news_dataset(10).items()}
+                (news_dataset_dir / f'{shard}.json').write_text(json.dumps(news_data), encoding='utf-8')
+
+    assert extract_news_audio(tmp_path / 'serial', ['VOA', 'RFA'], workers=1) == 24
+    assert extract_news_audio(tmp_path / 'parallel', ['VOA', 'RFA'], workers=3) == 24
+    assert snapshot_tree(tmp_path / 'serial') == snapshot_tree(tmp_path / 'parallel')
+
+def test_parallel_extraction_counts_worker_failures(tmp_path):
+    news_dataset_dir = tmp_path / 'RFA' / 'news_dataset'
+    news_dataset_dir.mkdir(parents=True)
+    for shard in range(2):
+        news_data = make_news_dataset(4)
+        news_data['0']['data']['body']['Audio'] = 'not a url'
+        (news_dataset_dir / f'{shard}.json').write_text(json.dumps({f'{shard}-{key}': value for key, value in news_data.items()}), encoding='utf-8')
+
+    reset_metrics()
+    assert extract_news_audio(tmp_path, ['RFA'], workers=2) == 4
+    # Recorded in the worker processes, counted in this one
+    assert collect_metrics()['counters'][('failures_total', (('reason', 'invalid_audio_url'), ('stage', 'extract')))] == 2
+
+def test_prefiltered_extraction_matches_full_decode(tmp_path):
+    for run in ('full', 'prefiltered'):
+        news_dataset_dir = tmp_path / run / 'VOT' / 'news_dataset'
+        news_dataset_dir.mkdir(parents=True)
+        for shard in range(2):
+            news_data = {f"{shard}-{article_id}": article for article_id, article in make_news_dataset(10).items()}
+            (news_dataset_dir / f'{shard}.json').write_text(json.dumps(news_data, ensure_ascii=False), encoding='utf-8')
+
+    for output_format in ('files', 'jsonl'):
+        assert extract_news_audio(tmp_path / 'full', ['VOT'], output_format=output_format) == 8
+        assert extract_news_audio(tmp_path / 'prefiltered', ['VOT'], output_format=output_format, prefilter=True) == 8
+    assert snapshot_tree(tmp_path / 'full') == snapshot_tree(tmp_path / 'prefiltered')
+
+FAKE_FFMPEG = """#!/bin/sh
+for arg; do last="$arg"; done
+case "$*" in
+    *hang*) sleep 30 ;;
+    *fail*) echo "Server returned 404 Not Found" >&2; exit 1 ;;
+    *) echo "audio" > "$last" ;;
+esac
+"""
+
+def test_download_stream_files(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'ffmpeg').write_text(FAKE_FFMPEG)
+    (bin_dir / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    jobs = [(f'https://example.com/{name}.m3u8', tmp_path / f'{name}.mp3') for name in ('ok', 'fail', 'hang')]
+    results = download_stream_files(jobs, workers=3, timeout=1)
+
+    assert results == [str(tmp_path / 'ok.mp3'), None, None]
+    assert (tmp_path / 'ok.mp3').read_text() == 'audio\n'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['bin', 'ok.mp3']
+
 if __name__ == "__main__":
     test_has_news_audio()
     print("All tests checked!")
\ No newline at end of file
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pytest
+import wave
+
+import feature_cache
+from feature_cache import build_feature_cache, extract_features, load_pcm, load_frame_levels
+from get_audio_duration import probe_audio_durations
+
+def write_wav(path, samples, sample_rate=16000):
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(samples.astype('<i2').tobytes())
+
+def test_build_feature_cache(tmp_path, monkeypatch):
+    samples = np.concatenate([np.full(8000, 1000), np.zeros(8000)])
+    write_wav(tmp_path / 'a.wav', samples)
+    write_wav(tmp_path / 'b.wav', samples)
+    audio_files = [str(tmp_path / 'a.wav'), str(tmp_path / 'b.wav'), str(tmp_path / 'missing.wav')]
+    cache_dir, manifest_path = str(tmp_path / 'cache'), str(tmp_path / 'manifest.sqlite')
+
+    features = build_feature_cache(audio_files, cache_dir, manifest_path, workers=2)
+    assert sorted(features) == audio_files[:2]
+    # Files with the same content share their features
+    sha256, seconds = features[audio_files[0]]
+    assert features[audio_files[1]] == (sha256, 1.0)
+
+    pcm = load_pcm(cache_dir, sha256)
+    assert isinstance(pcm, np.memmap) and np.array_equal(pcm, samples)
+    levels = load_frame_levels(cache_dir, sha256)
+    assert len(levels) == 34
+    assert abs(levels[0] - 20 * np.log10(1000 / 32768)) < 0.1 and levels[-1] < -90
+
+    # Unchanged files are not decoded again
+    monkeypatch.setattr(feature_cache, 'extract_features_job', None)
+    assert build_feature_cache(audio_files, cache_dir, manifest_path, workers=2) == features
+
+def test_probe_audio_durations_uses_feature_cache(tmp_path):
+    write_wav(tmp_path / 'a.mp3', np.zeros(24000))
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+    build_feature_cache([str(tmp_path / 'a.mp3')], str(tmp_path / 'cache'), manifest_path, workers=1)
+    # The header parser cannot read WAV content, only the cache knows its duration
+    assert probe_audio_durations([str(tmp_path / 'a.mp3')], workers=1, manifest_path=manifest_path) == {str(tmp_path / 'a.mp3'): 1.5}
+
+def test_extract_features_removes_part_files_on_failure(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    # Stands in for ffmpeg failing part-way through a truncated file
+    (bin_dir / 'ffmpeg').write_text('#!/bin/sh\nhead -c 64000 /dev/zero\necho "Error while decoding stream" >&2\nexit 1\n')
+    (bin_dir / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    (tmp_path / 'a.mp3').write_bytes(b'truncated')
+
+    with pytest.raises(RuntimeError, match='Error while decoding stream'):
+        extract_features(str(tmp_path / 'a.mp3'), str(tmp_path / 'cache'))
+    assert [path for path in (tmp_path / 'cache').rglob('*') if path.is_file()] == []
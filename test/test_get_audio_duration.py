@@ -0,0 +1,75 @@
+import struct
+import pandas as pd
+import pytest
+
+from pathlib import Path
+from mutagen.mp3 import MP3
+import get_audio_duration
+from get_audio_duration import probe_mp3_duration, probe_audio_durations, format_duration, add_audio_durations
+from metrics import collect_metrics, reset_metrics
+
+SAMPLE_MP3 = Path(__file__).parent.parent / 'T082024amdob.mp3'
+
+# MPEG-1 layer III, 128 kbps, 44.1 kHz, stereo, no padding: 417 byte frames of 1152 samples
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+
+def write_cbr_mp3(path, num_frames, id3v2=False):
+    frames = (FRAME_HEADER + bytes(FRAME_LENGTH - 4)) * num_frames
+    tag = b'ID3\x04\x00\x00\x00\x00\x01\x00' + bytes(128) if id3v2 else b''
+    path.write_bytes(tag + frames + b'TAG' + bytes(125))
+
+def write_xing_mp3(path, num_frames):
+    xing = b'Xing' + struct.pack('>II', 0x01, num_frames)
+    first_frame = FRAME_HEADER + bytes(32) + xing
+    first_frame += bytes(FRAME_LENGTH - len(first_frame))
+    path.write_bytes(first_frame + (FRAME_HEADER + bytes(FRAME_LENGTH - 4)) * 10)
+
+def test_probe_cbr_mp3(tmp_path):
+    write_cbr_mp3(tmp_path / 'cbr.mp3', 100, id3v2=True)
+    assert probe_mp3_duration(tmp_path / 'cbr.mp3') == pytest.approx(100 * FRAME_LENGTH * 8 / 128000)
+
+def test_probe_xing_mp3(tmp_path):
+    write_xing_mp3(tmp_path / 'vbr.mp3', 5000)
+    assert probe_mp3_duration(tmp_path / 'vbr.mp3') == pytest.approx(5000 * 1152 / 44100)
+
+def test_probe_matches_mutagen():
+    assert probe_mp3_duration(SAMPLE_MP3) == pytest.approx(MP3(SAMPLE_MP3).info.length, abs=0.05)
+
+def test_format_duration():
+    assert format_duration(336.098) == '00:05:36'
+    assert format_duration(90061) == '25:01:01'
+    assert format_duration(None) == 'Duration not found'
+
+def test_add_audio_durations(tmp_path, monkeypatch):
+    audio_dir = tmp_path / 'data' / 'RFA' / 'downloaded_audio'
+    audio_dir.mkdir(parents=True)
+    write_cbr_mp3(audio_dir / '1.mp3', 400)
+    (audio_dir / '2.mp3').write_bytes(b'not an mp3')
+    metadata_csv_path = tmp_path / 'news_data.csv'
+    pd.DataFrame({
+        'ID': ['1', '2', '3'], 'Audio URL': ['u'] * 3, 'Audio Text': ['t'] * 3, 'Speaker Name': ['s'] * 3,
+        'Speaker Gender': [''] * 3, 'News Channel': ['RFA'] * 3, 'Publishing Year': ['2024'] * 3,
+    }).to_csv(metadata_csv_path, index=False)
+
+    for run in range(2):
+        reset_metrics()
+        df = add_audio_durations(metadata_csv_path, tmp_path / 'out.csv', tmp_path / 'data',
+                                 manifest_path=tmp_path / 'manifest.sqlite', workers=2)
+        assert list(df['Audio Duration']) == ['00:00:10', 'Duration not found', 'Duration not found']
+        assert df['Audio Duration Seconds'][0] == pytest.approx(10.425)
+        assert df['Audio Duration Seconds'][1:].isna().all()
+        assert collect_metrics()['counters'].get(('cache_hits_total', (('stage', 'probe'),)), 0) == 2 * run
+        # Unchanged files are not read again, including the one whose duration could not be read
+        monkeypatch.setattr(get_audio_duration, 'read_audio_duration_job', None)
+
+def test_probe_audio_durations_counts_worker_failures(tmp_path):
+    write_cbr_mp3(tmp_path / '1.mp3', 400)
+    (tmp_path / '2.mp3').write_bytes(b'not an mp3')
+    reset_metrics()
+    durations = probe_audio_durations([str(tmp_path / '1.mp3'), str(tmp_path / '2.mp3')], workers=2)
+    assert durations[str(tmp_path / '2.mp3')] is None
+    # Probed in worker processes, but counted here
+    failures = {key: value for key, value in collect_metrics()['counters'].items() if key[0] == 'failures_total'}
+    assert [dict(labels)['stage'] for _, labels in failures] == ['probe']
+    assert list(failures.values()) == [1]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+librosa = pytest.importorskip('librosa')
+from identify_gender import estimate_pitch, classify_genders
+
+SAMPLE_RATE = 16000
+
+def tone(frequency, seconds=1.0):
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (0.5 * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def estimate_pitch_per_frame(y, sr):
+    pitches, magnitudes = librosa.core.piptrack(y=y, sr=sr)
+    pitch_values = []
+    for t in range(pitches.shape[1]):
+        pitch_value = pitches[magnitudes[:, t].argmax(), t]
+        if pitch_value > 0:
+            pitch_values.append(pitch_value)
+    return float(np.mean(pitch_values))
+
+def test_estimate_pitch_matches_per_frame_loop():
+    y = np.concatenate([tone(220), tone(180), np.zeros(SAMPLE_RATE // 2, dtype=np.float32)])
+    assert estimate_pitch(y, SAMPLE_RATE) == pytest.approx(estimate_pitch_per_frame(y, SAMPLE_RATE))
+
+def test_estimate_pitch_of_silence():
+    assert estimate_pitch(np.zeros(SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE) is None
+
+def test_classify_genders(tmp_path):
+    soundfile = pytest.importorskip('soundfile')
+    soundfile.write(tmp_path / 'high.wav', tone(250, seconds=3), SAMPLE_RATE)
+    soundfile.write(tmp_path / 'silent.wav', np.zeros(SAMPLE_RATE, dtype=np.float32), SAMPLE_RATE)
+    audio_files = [str(tmp_path / 'high.wav'), str(tmp_path / 'silent.wav'), str(tmp_path / 'missing.wav')]
+
+    results = classify_genders(audio_files, workers=2, max_duration=2, num_segments=2)
+
+    assert [result['gender'] for result in results] == ['Female', 'Unable to classify', 'Unable to classify']
+    assert results[0]['mean_pitch'] == pytest.approx(250, rel=0.05)
+
+def test_classify_genders_from_feature_cache(tmp_path):
+    soundfile = pytest.importorskip('soundfile')
+    soundfile.write(tmp_path / 'varying.wav', np.concatenate([tone(120, 2), tone(250, 2), tone(200, 2)]), SAMPLE_RATE)
+    audio_files = [str(tmp_path / 'varying.wav'), str(tmp_path / 'missing.wav')]
+
+    decoded = classify_genders(audio_files, workers=2, max_duration=3, num_segments=3)
+    cached = classify_genders(audio_files, workers=2, max_duration=3, num_segments=3,
+                              feature_cache_dir=str(tmp_path / 'cache'), manifest_path=str(tmp_path / 'manifest.sqlite'))
+
+    assert [result['gender'] for result in cached] == [result['gender'] for result in decoded]
+    assert cached[0]['mean_pitch'] == pytest.approx(decoded[0]['mean_pitch'], rel=1e-3)
@@ -0,0 +1,47 @@
+import pandas as pd
+import pyarrow.parquet as pq
+
+from metadata_io import write_metadata_rows, write_metadata, read_metadata, text_path
+
+COLUMNS = ['ID', 'Audio URL', 'Audio Text', 'Audio Duration Seconds', 'News Channel', 'Publishing Year']
+
+def make_rows():
+    return [
+        {'ID': f'{i:03d}', 'Audio URL': f'https://example.com/{i}.mp3', 'Audio Text': f'ཁ་སང་། "{i}",\nline',
+         'Audio Duration Seconds': float(i) if i % 4 else None, 'News Channel': ['RFA', 'VOA', 'VOT'][i % 3],
+         'Publishing Year': 2020 + i % 3}
+        for i in range(30)
+    ]
+
+def test_parquet_row_groups_hold_one_channel(tmp_path):
+    output_path = tmp_path / 'news_data.parquet'
+    assert write_metadata_rows(make_rows(), output_path, COLUMNS, row_group_size=4) == 30
+
+    parquet_file = pq.ParquetFile(output_path)
+    for row_group in range(parquet_file.num_row_groups):
+        channels = parquet_file.read_row_group(row_group, columns=['News Channel']).column(0).to_pylist()
+        assert len(set(channels)) == 1
+    assert str(parquet_file.schema_arrow.field('Audio Duration Seconds').type) == 'double'
+
+def test_read_metadata_matches_across_formats(tmp_path):
+    csv_path = tmp_path / 'news_data.csv'
+    parquet_path = tmp_path / 'news_data.parquet'
+    write_metadata_rows(make_rows(), csv_path, COLUMNS)
+    write_metadata_rows(make_rows(), parquet_path, COLUMNS, separate_text=True)
+    assert text_path(parquet_path).exists()
+    assert 'Audio Text' not in pq.read_schema(parquet_path).names
+
+    filters = [('News Channel', '=', 'VOA'), ('Audio Duration Seconds', '>', 10)]
+    expected = read_metadata(csv_path, filters=filters).sort_values('ID').reset_index(drop=True)
+    actual = read_metadata(parquet_path, filters=filters).sort_values('ID').reset_index(drop=True)
+    assert list(expected['ID']) == ['013', '019', '022', '025']
+    assert list(actual.columns) == COLUMNS
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+
+    ids = read_metadata(parquet_path, columns=['ID'], filters=filters)
+    assert list(ids.columns) == ['ID'] and len(ids) == 4
+
+def test_write_metadata_dataframe(tmp_path):
+    df = pd.DataFrame(make_rows())
+    write_metadata(df, tmp_path / 'news_data.parquet')
+    assert len(read_metadata(tmp_path / 'news_data.parquet', filters=[('News Channel', 'in', ['RFA', 'VOT'])])) == 20
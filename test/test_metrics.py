@@ -0,0 +1,68 @@
+import io
+import json
+import pytest
+
+from metrics import (increment, observe, register_gauge, record_failure, capture_failures, record_failures, render_prometheus,
+                     write_metrics_file, reset_metrics, stage_rates, collect_metrics, profile_stage, configure_logging, logger)
+from extract_news_audio import save_news_file
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    reset_metrics()
+    yield
+    reset_metrics()
+    logger.handlers = []
+
+def test_render_prometheus():
+    increment('items_total', 3, stage='download')
+    increment('failures_total', stage='download', reason='http_404')
+    register_gauge('queue_depth', lambda: 7, queue='probe')
+    observe('stage_seconds', 1.5, stage='download')
+    text = render_prometheus()
+    assert 'news_audio_items_total{stage="download"} 3' in text
+    assert 'news_audio_failures_total{reason="http_404",stage="download"} 1' in text
+    assert 'news_audio_queue_depth{queue="probe"} 7' in text
+    assert 'news_audio_stage_seconds_count{stage="download"} 1' in text
+    assert '# TYPE news_audio_items_total counter' in text
+
+def test_write_metrics_file(tmp_path):
+    increment('items_total', stage='probe')
+    write_metrics_file(tmp_path / 'metrics.prom')
+    assert 'news_audio_items_total{stage="probe"} 1' in (tmp_path / 'metrics.prom').read_text()
+
+def test_stage_rates():
+    increment('items_total', 10, stage='extract')
+    increment('bytes_total', 1000, stage='extract')
+    rates = stage_rates({}, collect_metrics()['counters'], 2)
+    assert rates == {'extract': {'items_per_sec': 5.0, 'bytes_per_sec': 500.0}}
+
+def test_capture_failures():
+    with capture_failures() as failures:
+        record_failure('probe', 'timeout', path='a.mp3')
+    assert failures == [('probe', 'timeout', {'path': 'a.mp3'})]
+    assert collect_metrics()['counters'] == {}
+    record_failures(failures)
+    assert collect_metrics()['counters'] == {('failures_total', (('reason', 'timeout'), ('stage', 'probe'))): 1}
+
+def test_save_news_file_logs_invalid_url_as_json(tmp_path):
+    stream = io.StringIO()
+    configure_logging(stream=stream)
+    article = {'audio_url': 'not a url', 'body_text': '', 'metadata': {}}
+    assert save_news_file(article, 'A1', tmp_path) is None
+    event = json.loads(stream.getvalue())
+    assert event['event'] == 'extract_failed'
+    assert event['reason'] == 'invalid_audio_url'
+    assert event['article_id'] == 'A1'
+    assert collect_metrics()['counters'][('failures_total', (('reason', 'invalid_audio_url'), ('stage', 'extract')))] == 1
+
+def test_save_news_file_does_not_log_every_article(tmp_path):
+    stream = io.StringIO()
+    configure_logging(stream=stream)
+    article = {'audio_url': 'https://example.com/a.mp3', 'body_text': 'text', 'metadata': {}}
+    assert save_news_file(article, 'A1', tmp_path) == 'https://example.com/a.mp3'
+    assert stream.getvalue() == ''
+
+def test_profile_stage(tmp_path):
+    with profile_stage('probe', str(tmp_path)):
+        sum(range(1000))
+    assert len(list(tmp_path.glob('probe-*.prof'))) == 1
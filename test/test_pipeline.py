@@ -0,0 +1,209 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import pandas as pd
+import pytest
+
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from news_manifest import open_manifest, get_pending_articles
+from metrics import reset_metrics
+import pipeline
+from pipeline import run_pipeline
+import speaker_gender
+
+# MPEG-1 layer III, 128 kbps, 44.1 kHz frames of 417 bytes
+MP3_BYTES = (b'\xff\xfb\x90\x00' + bytes(413)) * 400
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def audio_server(tmp_path):
+    served_dir = tmp_path / 'served'
+    served_dir.mkdir()
+    for name in ('a', 'b', 'c'):
+        (served_dir / f'{name}.mp3').write_bytes(MP3_BYTES)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(QuietHandler, directory=str(served_dir)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+def make_article(audio_url):
+    return {
+        'data': {
+            'title': 'title',
+            'body': {'Audio': audio_url, 'Text': ['ཁ་སང་།', 'གསར་འགོད་པ། བཀྲ་ཤིས།']},
+            'meta_data': {'Date': '2024-08-20', 'Author': 'a', 'Tags': [], 'URL': 'https://example.com'},
+        }
+    }
+
+@pytest.mark.parametrize('output_format', ['files', 'jsonl'])
+def test_run_pipeline_resumes(audio_server, tmp_path, output_format):
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text(json.dumps({
+        'a': make_article(f'{audio_server}/a.mp3'),
+        'b': make_article(f'{audio_server}/b.mp3'),
+        'missing': make_article(f'{audio_server}/missing.mp3'),
+        'none': make_article(''),
+    }), encoding='utf-8')
+    (data_dir / 'RFA' / 'news_dataset' / '1.json').write_text(json.dumps({'c': make_article(f'{audio_server}/c.mp3')}), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    outputs = dict(output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+
+    metrics_path = tmp_path / 'metrics.prom'
+    reset_metrics()
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=2, probe_workers=2,
+                          metrics_path=str(metrics_path), output_format=output_format, **outputs)
+    assert counts == {'extracted': 4, 'downloaded': 3, 'probed': 3, 'classified': 0}
+    metrics = metrics_path.read_text()
+    assert 'news_audio_items_total{stage="download"} 3' in metrics
+    assert 'news_audio_failures_total{reason="http_404",stage="download"} 1' in metrics
+    assert 'news_audio_queue_depth{queue="probe"} 0' in metrics
+
+    df = pd.read_csv(outputs['output_with_duration_path'], dtype=str, keep_default_na=False)
+    assert list(df['ID']) == ['a', 'b', 'c', 'missing']
+    assert list(df['Audio Duration']) == ['00:00:10', '00:00:10', '00:00:10', 'Duration not found']
+    assert list(df['Speaker Name']) == ['བཀྲ་ཤིས།'] * 4
+
+    # Only the failed download is retried after a restart
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=2, probe_workers=2,
+                          output_format=output_format, **outputs)
+    assert counts == {'extracted': 0, 'downloaded': 0, 'probed': 0, 'classified': 0}
+    conn = open_manifest(manifest_path)
+    assert [article[1] for article in get_pending_articles(conn, 'extracted', 'downloaded')] == ['missing']
+    conn.close()
+
+def test_run_pipeline_skips_malformed_shard(audio_server, tmp_path):
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text('{"broken": ', encoding='utf-8')
+    (data_dir / 'RFA' / 'news_dataset' / '1.json').write_text(json.dumps({'a': make_article(f'{audio_server}/a.mp3')}), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    metrics_path = tmp_path / 'metrics.prom'
+    outputs = dict(output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+
+    reset_metrics()
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=2, probe_workers=1,
+                          metrics_path=str(metrics_path), **outputs)
+    assert counts['downloaded'] == 1
+    assert 'news_audio_failures_total{reason="JSONDecodeError",stage="extract"} 1' in metrics_path.read_text()
+    assert list(pd.read_csv(outputs['output_with_duration_path'], dtype=str)['ID']) == ['a']
+
+    # The malformed shard is left unmarked, so it is retried once fixed
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text(json.dumps({'b': make_article(f'{audio_server}/b.mp3')}), encoding='utf-8')
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=2, probe_workers=1, **outputs)
+    assert counts['extracted'] == 1 and counts['downloaded'] == 1
+
+def test_run_pipeline_times_out_endless_streams(audio_server, tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    # Stands in for ffmpeg reading a live stream that never ends
+    (bin_dir / 'ffmpeg').write_text('#!/bin/sh\nsleep 30\n')
+    (bin_dir / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    data_dir = tmp_path / 'data'
+    (data_dir / 'VOT' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'VOT' / 'news_dataset' / '0.json').write_text(json.dumps({
+        'a': make_article(f'{audio_server}/a.mp3'),
+        'live': make_article(f'{audio_server}/live.m3u8'),
+    }), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    counts = run_pipeline(str(data_dir), manifest_path, ['VOT'], extract_workers=1, probe_workers=1, stream_timeout=1,
+                          output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+    assert counts['downloaded'] == 1
+    conn = open_manifest(manifest_path)
+    assert [article[1] for article in get_pending_articles(conn, 'extracted', 'downloaded')] == ['live']
+    conn.close()
+
+def test_run_pipeline_deduplicates_shared_audio(audio_server, tmp_path):
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text(json.dumps({
+        'a': make_article(f'{audio_server}/a.mp3'),
+        'b': make_article(f'{audio_server}/b.mp3'),
+        'repost': make_article(f'{audio_server}/a.mp3?utm_source=feed'),
+    }), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    outputs = dict(output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=1, probe_workers=1, **outputs)
+    assert counts['downloaded'] == 3 and counts['probed'] == 3
+
+    df = pd.read_csv(outputs['output_with_duration_path'], dtype=str, keep_default_na=False).set_index('ID')
+    assert list(df['Audio Duration']) == ['00:00:10'] * 3
+    # a.mp3 and b.mp3 hold the same bytes, so b and the repost of a point at a's stored file
+    assert df.loc['a', 'Duplicate Of'] == ''
+    assert df.loc['b', 'Duplicate Of'] == 'RFA/a'
+    assert df.loc['repost', 'Duplicate Of'] == 'RFA/a'
+    assert len(set(df['Audio Hash'])) == 1
+
+def test_run_pipeline_classifies_speaker_genders(audio_server, tmp_path, monkeypatch):
+    classified_files = []
+
+    def fake_classify_genders(audio_files, workers=None, feature_cache_dir=None, manifest_path=None):
+        classified_files.extend(audio_files)
+        return [{'gender': 'female', 'mean_pitch': 210.0} for _ in audio_files]
+
+    monkeypatch.setattr(speaker_gender, 'classify_genders', fake_classify_genders)
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text(json.dumps({
+        'a': make_article(f'{audio_server}/a.mp3'),
+        'b': make_article(f'{audio_server}/b.mp3'),
+    }), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    outputs = dict(output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=1, probe_workers=1, classify=True,
+                          feature_cache_dir=str(tmp_path / 'features'), **outputs)
+    assert counts['classified'] == 2
+    # Both articles share a speaker, whose sampled clips are classified once and cached in the manifest
+    assert len(classified_files) == 2
+    df = pd.read_csv(outputs['output_with_duration_path'], dtype=str, keep_default_na=False)
+    assert list(df['Speaker Gender']) == ['female', 'female']
+
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=1, probe_workers=1, classify=True, **outputs)
+    assert counts['classified'] == 0 and len(classified_files) == 2
+
+def test_run_pipeline_records_stage_errors(audio_server, tmp_path, monkeypatch):
+    mark_stage, set_audio_durations = pipeline.mark_stage, pipeline.set_audio_durations
+
+    def failing_mark_stage(conn, entries, stage):
+        entries = list(entries)
+        if stage == 'downloaded' and entries[0][1] == 'b':
+            raise sqlite3.OperationalError('database is locked')
+        mark_stage(conn, entries, stage)
+
+    def failing_set_audio_durations(conn, durations):
+        durations = list(durations)
+        if durations[0][0].endswith('c.mp3'):
+            raise sqlite3.OperationalError('disk I/O error')
+        set_audio_durations(conn, durations)
+
+    monkeypatch.setattr(pipeline, 'mark_stage', failing_mark_stage)
+    monkeypatch.setattr(pipeline, 'set_audio_durations', failing_set_audio_durations)
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'news_dataset').mkdir(parents=True)
+    (data_dir / 'RFA' / 'news_dataset' / '0.json').write_text(json.dumps({
+        name: make_article(f'{audio_server}/{name}.mp3') for name in ('a', 'b', 'c')
+    }), encoding='utf-8')
+    manifest_path = str(tmp_path / 'pipeline.sqlite')
+    metrics_path = tmp_path / 'metrics.prom'
+
+    reset_metrics()
+    counts = run_pipeline(str(data_dir), manifest_path, ['RFA'], extract_workers=1, probe_workers=1, metrics_path=str(metrics_path),
+                          output_path=str(tmp_path / 'news_data.csv'), output_with_duration_path=str(tmp_path / 'news_data_with_duration.csv'))
+    assert counts['downloaded'] == 2 and counts['probed'] == 1
+    metrics = metrics_path.read_text()
+    assert 'news_audio_failures_total{reason="OperationalError",stage="download"} 1' in metrics
+    assert 'news_audio_failures_total{reason="OperationalError",stage="probe"} 1' in metrics
+    conn = open_manifest(manifest_path)
+    assert [article[1] for article in get_pending_articles(conn, 'extracted', 'downloaded')] == ['b']
+    assert [article[1] for article in get_pending_articles(conn, 'downloaded', 'probed')] == ['c']
+    conn.close()
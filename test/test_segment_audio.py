@@ -0,0 +1,138 @@
+import json
+import os
+import tarfile
+import threading
+import wave
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from feature_cache import build_feature_cache, feature_paths
+from segment_audio import SAMPLE_RATE, iter_pcm_blocks, iter_audio_segments, split_sentences, align_sentences, segment_news_audio, write_shards
+
+def write_speech_wav(path, pattern):
+    """Writes a WAV file alternating tones and silences, given as (seconds, is_tone) pairs."""
+    parts = []
+    for seconds, is_tone in pattern:
+        t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+        parts.append(0.3 * np.sin(2 * np.pi * 150 * t) if is_tone else np.zeros_like(t))
+    with wave.open(str(path), 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(SAMPLE_RATE)
+        wav_file.writeframes((np.concatenate(parts) * 32767).astype('<i2').tobytes())
+
+def test_iter_audio_segments(tmp_path):
+    audio_file = tmp_path / 'a.wav'
+    write_speech_wav(audio_file, [(0.5, False), (2, True), (0.6, False), (3, True), (0.6, False), (0.2, True),
+                                  (0.6, False), (25, True), (1, False)])
+    segments = [(round(start, 1), round(len(samples) / SAMPLE_RATE)) for start, samples in iter_audio_segments(str(audio_file))]
+    # The 0.2 s burst is dropped and the 25 s tone is cut at the 20 s limit
+    assert segments == [(0.5, 2), (3.1, 3), (7.5, 20), (27.5, 5)]
+
+# Stands in for ffmpeg decoding a corrupt MP3, logging an error for every frame
+NOISY_FFMPEG = """#!/bin/sh
+i=0
+while [ $i -lt 3000 ]; do
+    echo "[mp3float @ 0x55d0c8a3c0] Header missing, error while decoding stream #0:0: Invalid data found" >&2
+    i=$((i + 1))
+done
+head -c 64000 /dev/zero
+exit 1
+"""
+
+def test_iter_pcm_blocks_survives_verbose_ffmpeg_errors(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    (bin_dir / 'ffmpeg').write_text(NOISY_FFMPEG)
+    (bin_dir / 'ffmpeg').chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    (tmp_path / 'corrupt.mp3').write_bytes(b'not an mp3')
+
+    errors = []
+
+    def decode():
+        try:
+            list(iter_pcm_blocks(str(tmp_path / 'corrupt.mp3')))
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    # Run on a thread, so a decoder stuck on a full stderr pipe fails the test instead of hanging it
+    thread = threading.Thread(target=decode, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and errors[0].startswith('ffmpeg exited with code 1') and 'Header missing' in errors[0]
+
+def test_split_sentences():
+    assert split_sentences('ཀ་ཁ། ག་ང༎ ཅ་ཆ།\nཇ་ཉ\n\n') == ['ཀ་ཁ།', 'ག་ང༎', 'ཅ་ཆ།', 'ཇ་ཉ']
+
+def test_align_sentences():
+    assert align_sentences(['aa', 'bbbb', 'cc'], [1, 2, 1]) == ['aa', 'bbbb', 'cc']
+    assert align_sentences(['aaaa', 'bb'], [1, 1, 1]) == ['aaaa', '', 'bb']
+    assert align_sentences([], [1]) == ['']
+
+def test_write_shards(tmp_path):
+    samples = [{'__key__': f'k{i}', 'txt': b'text', 'json': json.dumps({'duration': 1.5}).encode()} for i in range(5)]
+    shard_paths = write_shards(iter(samples), str(tmp_path), shard_size=2)
+    assert [path[-len('segments-000002.tar'):] for path in shard_paths] == [f'segments-00000{i}.tar' for i in range(3)]
+    index = [json.loads(line) for line in (tmp_path / 'index.jsonl').read_text().splitlines()]
+    assert [(entry['samples'], entry['seconds']) for entry in index] == [(2, 3.0), (2, 3.0), (1, 1.5)]
+
+def test_segment_news_audio(tmp_path):
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'downloaded_audio').mkdir(parents=True)
+    # The decoder recognizes WAV content whatever the extension
+    write_speech_wav(data_dir / 'RFA' / 'downloaded_audio' / 'a.1.mp3', [(2, True), (0.6, False), (6, True)])
+    write_speech_wav(data_dir / 'RFA' / 'downloaded_audio' / 'b.mp3', [(2, True)])
+    metadata_path = tmp_path / 'news_data.csv'
+    pd.DataFrame({
+        'ID': ['a.1', 'b', 'c'],
+        'News Channel': ['RFA'] * 3,
+        'Audio Text': ['ཀ་ཁ། ག་ང་ཅ་ཆ་ཇ་ཉ་ཏ་ཐ།', 'ཀ་ཁ།', 'ཀ་ཁ།'],
+        'Speaker Name': ['བཀྲ་ཤིས།', '', ''],
+        'Duplicate Of': ['', 'RFA/a.1', ''],
+    }).to_csv(metadata_path, index=False)
+
+    shard_paths = segment_news_audio(str(metadata_path), str(data_dir), str(tmp_path / 'segments'), workers=2)
+    assert len(shard_paths) == 1
+    with tarfile.open(shard_paths[0]) as tar_file:
+        names = tar_file.getnames()
+        sample = json.loads(tar_file.extractfile('RFA_a_1_0001.json').read())
+        text = tar_file.extractfile('RFA_a_1_0001.txt').read().decode('utf-8')
+    assert names == ['RFA_a_1_0000.wav', 'RFA_a_1_0000.txt', 'RFA_a_1_0000.json',
+                     'RFA_a_1_0001.wav', 'RFA_a_1_0001.txt', 'RFA_a_1_0001.json']
+    assert text == 'ག་ང་ཅ་ཆ་ཇ་ཉ་ཏ་ཐ།'
+    assert sample['id'] == 'a.1' and sample['speaker_name'] == 'བཀྲ་ཤིས།' and sample['segment'] == 1
+    assert abs(sample['start'] - 2.61) < 0.05 and abs(sample['duration'] - 6) < 0.05
+
+def test_iter_audio_segments_reads_decoded_pcm(tmp_path):
+    audio_file = tmp_path / 'a.wav'
+    write_speech_wav(audio_file, [(0.5, False), (2, True), (0.6, False), (25, True), (1, False)])
+    with wave.open(str(audio_file), 'rb') as wav_file:
+        pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+    decoded = list(iter_audio_segments(str(audio_file)))
+    cached = list(iter_audio_segments(str(tmp_path / 'missing.wav'), pcm=pcm))
+    assert [start for start, _ in cached] == [start for start, _ in decoded]
+    assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(cached, decoded))
+
+def test_segment_news_audio_reads_feature_cache(tmp_path):
+    data_dir = tmp_path / 'data'
+    (data_dir / 'RFA' / 'downloaded_audio').mkdir(parents=True)
+    audio_file = data_dir / 'RFA' / 'downloaded_audio' / 'a.mp3'
+    write_speech_wav(audio_file, [(2, True), (0.6, False), (6, True)])
+    metadata_path = tmp_path / 'news_data.csv'
+    pd.DataFrame({'ID': ['a'], 'News Channel': ['RFA'], 'Audio Text': ['ཀ་ཁ། ག་ང་ཅ་ཆ་ཇ་ཉ་ཏ་ཐ།']}).to_csv(metadata_path, index=False)
+    cache_dir, manifest_path = str(tmp_path / 'cache'), str(tmp_path / 'manifest.sqlite')
+    sha256, _ = build_feature_cache([str(audio_file)], cache_dir, manifest_path, workers=1)[str(audio_file)]
+
+    # Replaces the cached PCM with other audio, which only shows up in the segments if the cache is read
+    write_speech_wav(tmp_path / 'other.wav', [(2, True), (0.6, False), (3, True)])
+    with wave.open(str(tmp_path / 'other.wav'), 'rb') as wav_file:
+        Path(feature_paths(cache_dir, sha256)[0]).write_bytes(wav_file.readframes(wav_file.getnframes()))
+
+    shard_paths = segment_news_audio(str(metadata_path), str(data_dir), str(tmp_path / 'segments'), workers=1,
+                                     feature_cache_dir=cache_dir, manifest_path=manifest_path)
+    with tarfile.open(shard_paths[0]) as tar_file:
+        sample = json.loads(tar_file.extractfile('RFA_a_0001.json').read())
+    assert abs(sample['duration'] - 3) < 0.05
@@ -0,0 +1,26 @@
+from speaker_extraction import extract_speaker, extract_speakers, extract_speaker_from_text
+
+FILLER = 'ཁ་སང་། ' * 200
+
+def test_extract_speaker_from_lines():
+    assert extract_speaker_from_text(['ཁ་སང་།\n', 'གསར་འགོད་པ།\n', 'བཀྲ་ཤིས། ཁ་སང་།\n']) == 'བཀྲ་ཤིས།'
+
+def test_extract_speaker_markers():
+    assert extract_speaker('སྙན་ཞུ་བ། རྡོ་རྗེ།') == 'རྡོ་རྗེ།'
+    assert extract_speaker('གསར་འགོད་པ་ཚེ་རིང་།') == ''
+    assert extract_speaker('byline: Pema', markers=('byline:',)) == 'Pema'
+
+def test_extract_speaker_scans_both_ends_only():
+    assert extract_speaker(FILLER + 'གསར་འགོད་པ། བཀྲ་ཤིས།') == 'བཀྲ་ཤིས།'
+    assert extract_speaker('གསར་འགོད་པ། ཚེ་རིང་། ' + FILLER + 'གསར་འགོད་པ། བཀྲ་ཤིས།') == 'ཚེ་རིང་།'
+    buried = FILLER + 'གསར་འགོད་པ། བཀྲ་ཤིས། ' + FILLER
+    assert extract_speaker(buried) == ''
+    assert extract_speaker(buried, window=None) == 'བཀྲ་ཤིས།'
+
+def test_extract_speaker_ignores_journalist_in_running_text():
+    text = 'ཨ་རིའི་གསར་འགོད་པ་ཚོས་བཤད་པ་ལྟར། ' + FILLER + 'གསར་འགོད་པ། བཀྲ་ཤིས།'
+    assert extract_speaker(text) == 'བཀྲ་ཤིས།'
+    assert extract_speaker('སྙན་ཞུ་བ་ཚོས་བཤད་པ་ལྟར། སྙན་ཞུ་བ། རྡོ་རྗེ།') == 'རྡོ་རྗེ།'
+
+def test_extract_speakers():
+    assert extract_speakers(['གསར་འགོད་པ། ཚེ་རིང་།', 'ཁ་སང་།', ['གསར་འགོད་པ། བཀྲ་ཤིས།']]) == ['ཚེ་རིང་།', '', 'བཀྲ་ཤིས།']
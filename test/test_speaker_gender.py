@@ -0,0 +1,34 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('librosa')
+from speaker_gender import sample_speaker_clips, vote_speaker_gender
+
+def test_sample_speaker_clips(tmp_path):
+    audio_dir = tmp_path / 'RFA' / 'downloaded_audio'
+    audio_dir.mkdir(parents=True)
+    for i in range(10):
+        (audio_dir / f'{i}.mp3').write_bytes(b'')
+    df = pd.DataFrame({
+        'ID': [str(i) for i in range(10)] + ['missing'],
+        'Speaker Name': ['Dolma'] * 6 + ['Pema'] * 2 + ['Unknown', None, 'Pema'],
+        'News Channel': ['RFA'] * 11,
+    })
+
+    speaker_clips = sample_speaker_clips(df, str(tmp_path), clips_per_speaker=3)
+
+    assert speaker_clips == {
+        'Dolma': [str(audio_dir / f'{i}.mp3') for i in (0, 2, 4)],
+        'Pema': [str(audio_dir / f'{i}.mp3') for i in (6, 7)],
+    }
+    assert sample_speaker_clips(df, str(tmp_path), skip_speakers={'Dolma'}).keys() == {'Pema'}
+
+def test_vote_speaker_gender():
+    results = [
+        {'gender': 'Male', 'mean_pitch': 120.0},
+        {'gender': 'Female', 'mean_pitch': 170.0},
+        {'gender': 'Male', 'mean_pitch': 130.0},
+        {'gender': 'Unable to classify', 'mean_pitch': None},
+    ]
+    assert vote_speaker_gender(results) == ('Male', 140.0, 3)
+    assert vote_speaker_gender(results[3:]) == (None, None, 0)